@@ -1,61 +1,287 @@
 import sys
 import os
+import asyncio
+import functools
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.agents import initialize_agent, AgentType
-from langchain.tools import Tool
-from langchain.memory import ConversationBufferMemory
 
 # Load environment variables (for OpenAI API key)
 load_dotenv()
 
-# Load system prompt
-with open("prompts/system_prompt.txt", "r") as f:
-    system_prompt = f.read()
-
-# Import RAG retriever and return policy tool
-from rag.retriever import query_order_info
-from tools.return_policy_tool import fetch_return_policy_tool
-
-# Define a LangChain Tool for order info retrieval
-order_info_tool = Tool(
-    name="OrderInfoRetriever",
-    func=lambda query: "\n\n".join(
-        [doc.page_content for doc in query_order_info(query)]
-    ),
-    description="Retrieves order information from local markdown files given an order number or query.",
-)
+from observability.logs import configure_logging
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT_PATH = "prompts/system_prompt.txt"
+AGENT_MODEL = "gpt-3.5-turbo"
 
-# Prepare the list of tools for the agent
-tools = [
-    order_info_tool,
-    fetch_return_policy_tool,  # Already a LangChain tool
-]
-
-# Initialize the LLM
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
-
-# Add conversational memory
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-
-# Use a conversational agent type
-agent = initialize_agent(
-    tools=tools,
-    llm=llm,
-    agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-    verbose=True,
-    agent_kwargs={"system_message": system_prompt},
-    memory=memory,
+# Budget of one turn: reasoning steps, and seconds, before the agent gives up
+AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "5"))
+AGENT_MAX_SECONDS = float(os.getenv("AGENT_MAX_SECONDS", "30"))
+# Tool results remembered per session (least recently used ones are dropped)
+AGENT_TOOL_CACHE_SIZE = int(os.getenv("AGENT_TOOL_CACHE_SIZE", "128"))
+# "1" uses a tool-calling agent, which can request several tools in one step;
+# they then run concurrently. The default is the ReAct text agent (one tool
+# per step).
+AGENT_PARALLEL_TOOLS = os.getenv("AGENT_PARALLEL_TOOLS", "0") == "1"
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE", "1") == "1"
+
+BUDGET_EXHAUSTED_REPLY = (
+    "Sorry, I couldn't finish looking that up. Could you give me your order number again?"
 )
 
+_ORDER_NUMBER = re.compile(r"(?<!\d)\d{6,}(?!\d)")
+_WORD = re.compile(r"[a-z0-9]+")
+
+# The agent (LLM client, tools, prompt) is built on first use, so importing
+# this module does not pull in langchain or read files.
+_agent = None
+_agent_lock = threading.Lock()
+
+
+def normalize_tool_input(tool_input):
+    """
+    Cache key of a tool input. Inputs naming order numbers are keyed by them
+    alone ("order 123456", "#123456" and "123456" are one lookup); anything
+    else by its lowercased words.
+    """
+    if isinstance(tool_input, dict):
+        tool_input = " ".join(str(value) for value in tool_input.values())
+    text = str(tool_input)
+    orders = sorted(set(_ORDER_NUMBER.findall(text)))
+    if orders:
+        return "order:" + ",".join(orders)
+    return " ".join(_WORD.findall(text.lower()))
+
+
+class ToolResultCache:
+    """One session's tool results, keyed by tool name and normalized input."""
+
+    def __init__(self, max_entries=AGENT_TOOL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def wrap(self, name, func):
+        """func(tool_input), answering repeated inputs from the cache."""
+        from observability.metrics import AGENT_TOOL_CALLS
+
+        @functools.wraps(func)
+        def cached(tool_input):
+            key = (name, normalize_tool_input(tool_input))
+            with self._lock:
+                if key in self._results:
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    AGENT_TOOL_CALLS.inc(tool=name, cached="true")
+                    return self._results[key]
+                self.misses += 1
+            AGENT_TOOL_CALLS.inc(tool=name, cached="false")
+            result = func(tool_input)
+            with self._lock:
+                self._results[key] = result
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+            return result
+
+        return cached
+
+    def stats(self):
+        return {"entries": len(self._results), "hits": self.hits, "misses": self.misses}
+
+
+class TurnReport(NamedTuple):
+    llm_steps: int
+    tool_calls: int
+    cached_tool_calls: int
+    seconds: float
+    budget_exhausted: bool
+
+
+def _turn_counter():
+    """A callback handler counting LLM calls and tool calls of one turn."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TurnCounter(BaseCallbackHandler):
+        def __init__(self):
+            self.llm_steps = 0
+            self.tool_calls = 0
+
+        def on_chat_model_start(self, serialized, messages, **kwargs):
+            self.llm_steps += 1
+
+        def on_llm_start(self, serialized, prompts, **kwargs):
+            self.llm_steps += 1
+
+        def on_tool_start(self, serialized, input_str, **kwargs):
+            self.tool_calls += 1
+
+    return TurnCounter()
+
+
+class AgentSession:
+    """
+    One conversation with the agent: its executor, memory and tool-result
+    cache. run() answers a turn within the iteration and time budget.
+    """
+
+    def __init__(self, executor, tool_cache, parallel_tools=False):
+        self.executor = executor
+        self.tool_cache = tool_cache
+        self.parallel_tools = parallel_tools
+        # One loop for the whole session, so the memory's background summary
+        # tasks started in one turn are not cancelled when it ends
+        self._loop = asyncio.new_event_loop() if parallel_tools else None
+
+    def run(self, text):
+        """Answers one user message; returns (reply, TurnReport)."""
+        from observability.metrics import AGENT_LLM_STEPS
+
+        counter = _turn_counter()
+        hits = self.tool_cache.hits
+        start = time.perf_counter()
+        inputs = {"input": text}
+        config = {"callbacks": [counter]}
+        if self.parallel_tools:
+            # The async executor runs the tool calls of one step concurrently
+            result = self._loop.run_until_complete(
+                self.executor.ainvoke(inputs, config=config)
+            )
+        else:
+            result = self.executor.invoke(inputs, config=config)
+        reply = result["output"]
+        # AgentExecutor's early stop ("force") returns this fixed text
+        exhausted = reply.startswith("Agent stopped due to")
+        if exhausted:
+            reply = BUDGET_EXHAUSTED_REPLY
+        report = TurnReport(
+            llm_steps=counter.llm_steps,
+            tool_calls=counter.tool_calls,
+            cached_tool_calls=self.tool_cache.hits - hits,
+            seconds=round(time.perf_counter() - start, 3),
+            budget_exhausted=exhausted,
+        )
+        AGENT_LLM_STEPS.inc(counter.llm_steps)
+        logger.info("Agent turn: %s", report._asdict())
+        return reply, report
+
+
+def build_agent(parallel_tools=AGENT_PARALLEL_TOOLS):
+    """
+    Builds a conversational agent session with its tools, memory and tool
+    cache. Each call is a new session.
+    """
+    from langchain.agents import AgentExecutor, AgentType, initialize_agent
+    from langchain.tools import Tool
+    from langchain_core.tools import tool
+
+    from clients.provider import get_chat_model
+    from conversation.langchain_memory import BoundedChatMemory
+    from conversation.memory import ConversationMemory
+    from rag.retriever import query_order_info
+    from tools.return_policy_tool import fetch_return_policy
+
+    # Load system prompt
+    with open(SYSTEM_PROMPT_PATH, "r") as f:
+        system_prompt = f.read()
+
+    cache = ToolResultCache()
+
+    # Define a LangChain Tool for order info retrieval
+    order_info_tool = Tool(
+        name="OrderInfoRetriever",
+        func=cache.wrap(
+            "OrderInfoRetriever",
+            lambda query: "\n\n".join([doc.page_content for doc in query_order_info(query)]),
+        ),
+        description="Retrieves order information from local markdown files given an order number or query.",
+    )
+
+    # Prepare the list of tools for the agent
+    tools = [
+        order_info_tool,
+        tool("fetch_return_policy", return_direct=True)(
+            cache.wrap("fetch_return_policy", fetch_return_policy)
+        ),
+    ]
+
+    # Initialize the LLM
+    llm = get_chat_model(AGENT_MODEL)
+
+    # Add conversational memory: recent turns verbatim, older ones summarized in
+    # the background so the prompt stays within a fixed token budget
+    memory = BoundedChatMemory(memory=ConversationMemory(llm=llm))
+
+    budget = {
+        "max_iterations": AGENT_MAX_ITERATIONS,
+        "max_execution_time": AGENT_MAX_SECONDS,
+        "early_stopping_method": "force",
+    }
+    if parallel_tools:
+        from langchain.agents import create_tool_calling_agent
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", system_prompt),
+                MessagesPlaceholder("chat_history"),
+                ("human", "{input}"),
+                MessagesPlaceholder("agent_scratchpad"),
+            ]
+        )
+        executor = AgentExecutor(
+            agent=create_tool_calling_agent(llm, tools, prompt),
+            tools=tools,
+            memory=memory,
+            verbose=AGENT_VERBOSE,
+            **budget,
+        )
+    else:
+        # Use a conversational agent type
+        executor = initialize_agent(
+            tools=tools,
+            llm=llm,
+            agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+            verbose=AGENT_VERBOSE,
+            agent_kwargs={"system_message": system_prompt},
+            memory=memory,
+            **budget,
+        )
+    return AgentSession(executor, cache, parallel_tools)
+
+
+def get_agent():
+    """Returns the shared agent session, building it on first use."""
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = build_agent()
+    return _agent
+
+
 if __name__ == "__main__":
+    configure_logging()
+    # Build the agent while the user types their first message
+    threading.Thread(target=get_agent, daemon=True).start()
     print("Welcome to the Amazon Return Assistant!\n")
     while True:
         user_input = input("You: ")
         if user_input.lower() in {"exit", "quit"}:
             print("Goodbye!")
             break
-        response = agent.run(input=user_input)
-        print(f"Agent: {response}\n")
+        response, report = get_agent().run(user_input)
+        print(f"Agent: {response}")
+        print(
+            f"({report.llm_steps} LLM steps, {report.tool_calls} tool calls, "
+            f"{report.cached_tool_calls} cached, {report.seconds:.2f}s)\n"
+        )
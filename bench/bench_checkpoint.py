@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from bench.bench_retrieval import RESULTS_DIR, compare, latency_summary
+
+# A conversation that reaches an eligibility answer and then waits for the
+# user: a return request, then an order number from the local store.
+SCRIPT = ["I want to return something", "9823417654"]
+
+
+def write_through_saver(path):
+    """The SQLite checkpointer writing every checkpoint in its own transaction."""
+    from conversation.checkpoint import SQLiteCheckpointSaver
+
+    class WriteThroughSaver(SQLiteCheckpointSaver):
+        def put(self, *args, **kwargs):
+            config = super().put(*args, **kwargs)
+            self.flush()
+            return config
+
+        def put_writes(self, *args, **kwargs):
+            super().put_writes(*args, **kwargs)
+            self.flush()
+
+    return WriteThroughSaver(path)
+
+
+async def drive_sessions(engine, sessions):
+    """Runs SCRIPT in `sessions` concurrent sessions and stops them mid-conversation."""
+    async def one(i):
+        session_id, _ = await engine.open(f"bench-{i}")
+        for text in SCRIPT:
+            await engine.send(session_id, text)
+        await engine.close_session(session_id)
+        return session_id
+
+    return await asyncio.gather(*(one(i) for i in range(sessions)))
+
+
+def stored_bytes(path):
+    """Bytes of checkpoint, blob and write payloads in a checkpoint file."""
+    with sqlite3.connect(path) as conn:
+        return sum(
+            conn.execute(f"SELECT COALESCE(SUM(LENGTH({column})), 0) FROM {table}").fetchone()[0]
+            for table, column in (
+                ("checkpoints", "checkpoint"),
+                ("checkpoints", "metadata"),
+                ("blobs", "value"),
+                ("writes", "value"),
+            )
+        )
+
+
+def state_sizes(values):
+    """
+    Serialized size of one session's state as checkpointed, and as it would
+    be with the order and policy text copied into it.
+    """
+    from conversation.checkpoint import CompactSerializer
+    from conversation.graph import order_text, policy_text
+
+    serde = CompactSerializer()
+    with_text = {**values, "order_info": order_text(values), "return_policy": policy_text(values)}
+    return tuple(
+        sum(len(serde.dumps_typed(value)[1] or b"") for value in state.values())
+        for state in (values, with_text)
+    )
+
+
+async def run_backend(name, saver, sessions, resumes):
+    from conversation.checkpoint import SQLiteCheckpointSaver
+    from conversation.engine import ConversationEngine
+    from conversation.graph import build_graph
+
+    engine = ConversationEngine(build_graph().compile(checkpointer=saver))
+    start = time.perf_counter()
+    session_ids = await drive_sessions(engine, sessions)
+    seconds = time.perf_counter() - start
+    saver.flush()
+
+    # Another worker opening the same file resumes the stopped sessions
+    other = SQLiteCheckpointSaver(saver.path)
+    worker = ConversationEngine(build_graph().compile(checkpointer=other))
+    lookups, resumed = [], []
+    for session_id in session_ids:
+        start = time.perf_counter()
+        await worker.checkpointed_session(session_id)
+        lookups.append(time.perf_counter() - start)
+    for session_id in session_ids[:resumes]:
+        start = time.perf_counter()
+        await worker.live_session(session_id)
+        resumed.append(time.perf_counter() - start)
+        await worker.close_session(session_id)
+
+    snapshot = await worker.graph.aget_state({"configurable": {"thread_id": session_ids[0]}})
+    compact, full = state_sizes(snapshot.values)
+    return {
+        "backend": name,
+        "sessions": sessions,
+        "drive_seconds": round(seconds, 3),
+        "steps_per_second": round(saver.stats["checkpoints"] / seconds, 1),
+        "transactions": saver.stats["flushes"],
+        "stored_bytes_per_session": round(stored_bytes(saver.path) / sessions),
+        "state_bytes": compact,
+        "state_bytes_with_text": full,
+        "checkpoint_lookup": latency_summary(lookups),
+        "resume": latency_summary(resumed),
+    }
+
+
+def run(args):
+    from conversation.checkpoint import SQLiteCheckpointSaver
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {"sessions": args.sessions, "resumes": args.resumes},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "backends": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for name, build in (
+            ("write_through", write_through_saver),
+            ("batched", SQLiteCheckpointSaver),
+        ):
+            saver = build(os.path.join(directory, f"{name}.sqlite3"))
+            results["backends"][name] = asyncio.run(
+                run_backend(name, saver, args.sessions, args.resumes)
+            )
+            saver.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Session checkpoints: write batching, stored size and resume latency."
+    )
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument(
+        "--resumes", type=int, default=100, help="Sessions fully resumed on the second worker."
+    )
+    parser.add_argument(
+        "--output", help="Results JSON path (default: bench/results/checkpoint_<timestamp>.json)."
+    )
+    parser.add_argument("--compare", help="Earlier results JSON to compare against.")
+    parser.add_argument(
+        "--threshold", type=float, default=10.0, help="Percent change flagged as a regression."
+    )
+    args = parser.parse_args()
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+    results = run(args)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"checkpoint_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    for name, case in results["backends"].items():
+        print(
+            f"{name:13s} {case['steps_per_second']:8.0f} steps/s  "
+            f"{case['transactions']:5d} transactions  "
+            f"{case['stored_bytes_per_session']:5d} B/session  "
+            f"state {case['state_bytes']} B (with text {case['state_bytes_with_text']} B)  "
+            f"lookup p50 {case['checkpoint_lookup']['p50_ms']:.2f}ms "
+            f"p99 {case['checkpoint_lookup']['p99_ms']:.2f}ms  "
+            f"resume p50 {case['resume']['p50_ms']:.2f}ms p99 {case['resume']['p99_ms']:.2f}ms"
+        )
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare, args.threshold)
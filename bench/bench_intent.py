@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bench.bench_retrieval import RESULTS_DIR, compare, latency_summary
+from conversation.intent import (
+    ENGINES,
+    load_examples,
+    EXIT,
+    ORDER_LOOKUP,
+    POLICY_QUESTION,
+    RETURN,
+    SMALL_TALK,
+    UNKNOWN,
+)
+
+# Held-out utterances (none of them are classifier training examples), with the
+# route the agent should take. Includes the substring traps of the old
+# wants_exit ("know", "another", "nothing" inside longer requests).
+EVAL_SET = (
+    ("hello", SMALL_TALK),
+    ("hey there!", SMALL_TALK),
+    ("good evening", SMALL_TALK),
+    ("hi, who am I talking to?", SMALL_TALK),
+    ("what can you do", SMALL_TALK),
+    ("I'd like to return a jacket", RETURN),
+    ("return please", RETURN),
+    ("I need to send this back", RETURN),
+    ("my earbuds stopped working, can I get a refund", RETURN),
+    ("I want to return another item", RETURN),
+    ("there is one more order I need to return", RETURN),
+    ("I know which item I want to return", RETURN),
+    ("not happy with the vacuum, want my money back", RETURN),
+    ("can you help me return something", RETURN),
+    ("order 9823417654", ORDER_LOOKUP),
+    ("9823417654", ORDER_LOOKUP),
+    ("it's 4102379581", ORDER_LOOKUP),
+    ("the number is #7640213985, I'd like to return it", ORDER_LOOKUP),
+    ("where's my package", ORDER_LOOKUP),
+    ("can you look up my order", ORDER_LOOKUP),
+    ("Thanks! Can you look up my order?", ORDER_LOOKUP),
+    ("I have no idea where my order is", ORDER_LOOKUP),
+    ("there is no receipt, can you look up my order", ORDER_LOOKUP),
+    ("I bought an end table and it is wobbly", RETURN),
+    ("what's the return window for mattresses", POLICY_QUESTION),
+    ("how many days do I have to send back a phone", POLICY_QUESTION),
+    ("can I still return something I bought 2 months ago", POLICY_QUESTION),
+    ("are kindle ebooks returnable", POLICY_QUESTION),
+    ("which items are non-returnable", POLICY_QUESTION),
+    ("is there a restocking fee", POLICY_QUESTION),
+    ("what is amazon's return policy on baby strollers", POLICY_QUESTION),
+    ("bye!", EXIT),
+    ("ok that's it, thanks", EXIT),
+    ("no thank you", EXIT),
+    ("nothing else", EXIT),
+    ("nothing, thanks", EXIT),
+    ("end", EXIT),
+    ("thanks, goodbye", EXIT),
+    ("I'm done here", EXIT),
+    ("nope", EXIT),
+    ("I don't know it", UNKNOWN),
+    ("I lost the receipt", UNKNOWN),
+    ("hmm", UNKNOWN),
+    ("I can't remember", UNKNOWN),
+)
+
+
+def legacy_route(text):
+    """The routing detect_intent did before the intent engine, for comparison."""
+    text = text.lower().strip()
+    exit_phrases = (
+        "no", "nothing", "exit", "quit", "bye", "goodbye", "that's all", "thank you",
+        "thanks", "that's it", "i'm done", "im done", "end", "stop",
+    )
+    if any(phrase in text for phrase in exit_phrases):
+        return EXIT
+    if "return" in text:
+        return RETURN
+    if re.search(r"\b\d{6,}\b", text):
+        return ORDER_LOOKUP
+    return UNKNOWN
+
+
+def evaluate(route, repeats, eval_set=EVAL_SET):
+    """Accuracy, per-intent recall, confusions and per-message latency of route(text)."""
+    correct = Counter()
+    totals = Counter()
+    confusions = Counter()
+    for text, expected in eval_set:
+        got = route(text)
+        totals[expected] += 1
+        if got == expected:
+            correct[expected] += 1
+        else:
+            confusions[f"{expected}->{got}"] += 1
+
+    latencies = []
+    for _ in range(repeats):
+        for text, _ in eval_set:
+            start = time.perf_counter()
+            route(text)
+            latencies.append(time.perf_counter() - start)
+    return {
+        "accuracy": round(sum(correct.values()) / len(eval_set), 4),
+        "recall": {intent: round(correct[intent] / totals[intent], 4) for intent in totals},
+        "confusions": [
+            {"expected": pair.split("->")[0], "got": pair.split("->")[1], "count": count}
+            for pair, count in confusions.most_common()
+        ],
+        "latency": latency_summary(latencies),
+    }
+
+
+def transcript_accuracy(route):
+    """
+    Accuracy on the labelled user turns of conversation_examples/. The
+    classifier is trained on them, so this guards against regressions on real
+    transcripts rather than measuring generalization.
+    """
+    examples = load_examples()
+    return round(sum(route(text) == expected for text, expected in examples) / len(examples), 4)
+
+
+def run(args):
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {"eval_size": len(EVAL_SET), "repeats": args.repeats},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "engines": {"legacy": evaluate(legacy_route, args.repeats)},
+    }
+    results["engines"]["legacy"]["transcript_accuracy"] = transcript_accuracy(legacy_route)
+    for name, cls in ENGINES.items():
+        start = time.perf_counter()
+        engine = cls()
+        build = time.perf_counter() - start
+        route = lambda text: engine.classify(text).intent  # noqa: E731
+        results["engines"][name] = evaluate(route, args.repeats)
+        results["engines"][name]["transcript_accuracy"] = transcript_accuracy(route)
+        results["engines"][name]["build_seconds"] = round(build, 4)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Accuracy and latency of the intent engines on a held-out set."
+    )
+    parser.add_argument("--repeats", type=int, default=200, help="Timing passes over the set.")
+    parser.add_argument(
+        "--output", help="Results JSON path (default: bench/results/intent_<timestamp>.json)."
+    )
+    parser.add_argument("--compare", help="Earlier results JSON to compare against.")
+    parser.add_argument(
+        "--threshold", type=float, default=10.0, help="Percent change flagged as a regression."
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"intent_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    for name, engine in results["engines"].items():
+        print(
+            f"{name:10s} accuracy {engine['accuracy']:.3f}  "
+            f"transcripts {engine['transcript_accuracy']:.3f}  "
+            f"p50 {engine['latency']['p50_ms'] * 1000:.1f}us  "
+            f"p99 {engine['latency']['p99_ms'] * 1000:.1f}us"
+        )
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare, args.threshold)
@@ -0,0 +1,305 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bench.fake_embeddings import FAKE_EMBEDDING_DIM, HashingEmbeddings
+from bench.generate_orders import generate_orders
+from rag import ingest
+from rag.faiss_store import FAISS_INDEX_TYPE, INDEX_TYPES, index_params
+from rag.retriever import query_customer_orders, query_order_info
+from rag.vectorstore_manager import (
+    VectorStoreManager,
+    read_generation,
+    resolve_store_path,
+    set_vectorstore_manager,
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Metrics where a larger value is a regression; everything else in the
+# comparison is "higher is better" (throughput, recall).
+LOWER_IS_BETTER = ("seconds", "bytes", "_ms", "rss")
+
+
+def rss_bytes():
+    """Current resident set size (falls back to peak RSS off Linux)."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def rss_anon_bytes():
+    """
+    Private (anonymous) resident memory; memory-mapped index pages are shared
+    file pages and do not count. 0 where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def dir_sizes(path):
+    """{entry name: bytes} for the files and subdirectories of one generation."""
+    sizes = {}
+    for entry in os.scandir(path):
+        if entry.is_file():
+            sizes[entry.name] = entry.stat().st_size
+        else:
+            sizes[entry.name] = sum(
+                os.path.getsize(os.path.join(root, name))
+                for root, _, names in os.walk(entry.path)
+                for name in names
+            )
+    return sizes
+
+
+def latency_summary(samples):
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(values, 50)), 4),
+        "p90_ms": round(float(np.percentile(values, 90)), 4),
+        "p99_ms": round(float(np.percentile(values, 99)), 4),
+        "mean_ms": round(float(values.mean()), 4),
+    }
+
+
+def time_queries(queries, expected, filters=None):
+    """
+    Run query_order_info for each query (with the matching filters dict, if
+    given); returns (latencies, recall@1).
+    """
+    latencies = []
+    hits = 0
+    filters = filters or [{}] * len(queries)
+    # The retriever logs every lookup; keep that out of the measurement output
+    with contextlib.redirect_stdout(io.StringIO()):
+        for query, order_number, query_filters in zip(queries, expected, filters):
+            start = time.perf_counter()
+            docs = query_order_info(query, **query_filters)
+            latencies.append(time.perf_counter() - start)
+            if docs and docs[0].metadata.get("order_number") == order_number:
+                hits += 1
+    return latencies, hits / len(queries) if queries else 0.0
+
+
+def fuzzy_query(order, rng):
+    """A free-text question about an order, without its order number."""
+    first, last = order["username"].split("@")[0].rstrip("0123456789").split(".")
+    return rng.choice(
+        [
+            f"my {order['brand']} {order['category']} delivered to {order['street']}",
+            f"{first} {last} {order['category']} order",
+            f"return the {order['category'].lower()} from {order['brand']} for {order['username']}",
+        ]
+    )
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="order_bench_")
+    order_dir = os.path.join(workdir, "orders")
+    store_dir = os.path.join(workdir, "store")
+    embeddings = HashingEmbeddings(dim=args.dim)
+    rng = random.Random(args.seed)
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "orders": args.orders,
+            "orders_per_file": args.orders_per_file,
+            "queries": args.queries,
+            "workers": args.workers,
+            "batch_size": args.batch_size,
+            "embedding_dim": args.dim,
+            "index_type": args.index_type,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+    }
+
+    try:
+        # 1. Corpus
+        start = time.perf_counter()
+        sample = generate_orders(
+            order_dir, args.orders, args.orders_per_file, args.seed, sample_size=args.queries
+        )
+        results["generate_seconds"] = round(time.perf_counter() - start, 3)
+
+        # 2. Ingest throughput (full build, fake embeddings, real parse pool)
+        start = time.perf_counter()
+        summary = ingest.main(
+            workers=args.workers,
+            batch_size=args.batch_size,
+            order_dir=order_dir,
+            store_dir=store_dir,
+            embeddings=embeddings,
+            index_type=args.index_type,
+            params=index_params(nlist=args.nlist, hnsw_m=args.hnsw_m, pq_m=args.pq_m),
+        )
+        elapsed = time.perf_counter() - start
+        results["ingest"] = {
+            "seconds": round(elapsed, 3),
+            "orders_per_second": round(args.orders / elapsed, 1),
+            "chunks_per_second": round(summary["embedded_chunks"] / elapsed, 1),
+            "embedding_requests": embeddings.calls,
+            "index_vectors": summary["index_vectors"],
+            "index_factory": summary["index_factory"],
+            "index_build_seconds": summary["index_seconds"],
+        }
+
+        # 3. Index size on disk, by artifact
+        path = resolve_store_path(read_generation(store_dir), store_dir)
+        sizes = dir_sizes(path)
+        results["disk"] = {"total_bytes": sum(sizes.values()), "artifacts_bytes": sizes}
+
+        # 4. Cold load time and resident memory of everything a lookup touches
+        manager = VectorStoreManager(store_dir, embeddings=embeddings)
+        set_vectorstore_manager(manager)
+        rss_before = rss_bytes()
+        anon_before = rss_anon_bytes()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.snapshot()
+        results["load"] = {
+            "cold_seconds": round(time.perf_counter() - start, 3),
+            "rss_delta_bytes": rss_bytes() - rss_before,
+            "rss_private_delta_bytes": rss_anon_bytes() - anon_before,
+            "rss_total_bytes": rss_bytes(),
+        }
+
+        # 5. Lookup latency: exact order numbers and free-text questions
+        exact = [order["order_number"] for order in sample]
+        latencies, recall = time_queries(exact, exact)
+        results["exact_lookup"] = {**latency_summary(latencies), "recall_at_1": recall}
+
+        fuzzy = [fuzzy_query(order, rng) for order in sample]
+        latencies, recall = time_queries(fuzzy, exact)
+        results["fuzzy_lookup"] = {**latency_summary(latencies), "recall_at_1": round(recall, 4)}
+
+        # Free-text questions pre-filtered to the customer and the delivery month
+        filters = [
+            {
+                "username": order["username"],
+                "delivered_after": order["delivery_date"][:8] + "01",
+                "delivered_before": order["delivery_date"],
+            }
+            for order in sample
+        ]
+        products = [f"{order['brand']} {order['category']}" for order in sample]
+        latencies, recall = time_queries(products, exact, filters)
+        results["filtered_lookup"] = {**latency_summary(latencies), "recall_at_1": round(recall, 4)}
+
+        # The same questions from signed-in customers, searched in their shard only
+        latencies, hits = [], 0
+        for order, query in zip(sample, products):
+            start = time.perf_counter()
+            docs = query_customer_orders(order["username"], query)
+            latencies.append(time.perf_counter() - start)
+            hits += bool(docs) and docs[0].metadata.get("order_number") == order["order_number"]
+        results["customer_lookup"] = {
+            **latency_summary(latencies),
+            "recall_at_1": round(hits / len(sample), 4) if sample else 0.0,
+            "open_shards": manager.get_customer_shards().stats()["open_shards"],
+        }
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return results
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline_path, threshold):
+    """Print the relative change of every numeric metric against a saved run."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = flatten(json.load(f))
+    print(f"\nComparison with {baseline_path}:")
+    for name, value in flatten(current).items():
+        if name.startswith(("config.", "environment.")) or name not in baseline:
+            continue
+        before = baseline[name]
+        if not before:
+            continue
+        change = (value - before) / before * 100
+        worse = change > 0 if any(tag in name for tag in LOWER_IS_BETTER) else change < 0
+        flag = "  <-- regression" if worse and abs(change) >= threshold else ""
+        print(f"  {name:45s} {before:>14,.4f} -> {value:>14,.4f} ({change:+.1f}%){flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark ingest and retrieval on a synthetic order corpus."
+    )
+    parser.add_argument("--orders", type=int, default=10000, help="Orders to generate.")
+    parser.add_argument("--orders-per-file", type=int, default=1, help="Orders per .md file.")
+    parser.add_argument("--queries", type=int, default=500, help="Exact and fuzzy queries each.")
+    parser.add_argument("--workers", type=int, default=None, help="Ingest parser processes.")
+    parser.add_argument("--batch-size", type=int, default=ingest.EMBED_BATCH_SIZE)
+    parser.add_argument("--dim", type=int, default=FAKE_EMBEDDING_DIM, help="Embedding width.")
+    parser.add_argument(
+        "--index-type", choices=INDEX_TYPES, default=FAISS_INDEX_TYPE, help="FAISS index to build."
+    )
+    parser.add_argument("--nlist", type=int, help="IVF clusters (default: about 4*sqrt(N)).")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW links per node.")
+    parser.add_argument("--pq-m", type=int, help="PQ sub-quantizers (must divide --dim).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Keep corpus and store here instead of a temp dir.")
+    parser.add_argument("--keep", action="store_true", help="Do not delete the temp dir.")
+    parser.add_argument(
+        "--output", help="Results JSON path (default: bench/results/<orders>_<timestamp>.json)."
+    )
+    parser.add_argument("--compare", help="Earlier results JSON to compare against.")
+    parser.add_argument(
+        "--threshold", type=float, default=10.0, help="Percent change flagged as a regression."
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{args.orders}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare, args.threshold)
@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bench.bench_retrieval import RESULTS_DIR, compare
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Entry points whose import cost is paid on every CLI start, worker spawn and
+# autoscaled replica.
+ENTRY_MODULES = ("main", "agent.agent", "service.server", "conversation.engine", "rag.retriever")
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+WARMUP_SNIPPET = "import json; from service.warmup import warm_up; print(json.dumps(warm_up()))"
+
+
+def run_python(args, env):
+    """Run a fresh interpreter in the repo; returns (stdout, wall seconds)."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, *args], cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return result.stdout, time.perf_counter() - start
+
+
+def time_import(module, repeats, env):
+    """Median import time and whole-process time of `import module` in fresh interpreters."""
+    imports, processes = [], []
+    for _ in range(repeats):
+        stdout, wall = run_python(["-c", IMPORT_SNIPPET.format(module=module)], env)
+        imports.append(float(stdout.strip().splitlines()[-1]))
+        processes.append(wall)
+    return {
+        "import_seconds": round(statistics.median(imports), 4),
+        "import_seconds_min": round(min(imports), 4),
+        "process_seconds": round(statistics.median(processes), 4),
+    }
+
+
+def slowest_imports(module, env, top=15):
+    """The top-level packages contributing most to importing module (-X importtime)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, self_us, name = line.split("|")
+        if not self_us.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(self_us)
+    ranked = sorted(totals.items(), key=lambda item: -item[1])[:top]
+    return [{"package": name, "seconds": round(us / 1e6, 4)} for name, us in ranked]
+
+
+def run(args):
+    env = dict(os.environ)
+    # Building the OpenAI clients needs a key, not the network
+    env.setdefault("OPENAI_API_KEY", "bench-startup")
+    env["PYTHONWARNINGS"] = "ignore"
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {"repeats": args.repeats, "modules": list(args.modules)},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "interpreter": time_import("sys", args.repeats, env),
+        "imports": {},
+    }
+    for module in args.modules:
+        results["imports"][module] = time_import(module, args.repeats, env)
+        print(f"{module:25s} {results['imports'][module]['import_seconds']:.3f}s", file=sys.stderr)
+    results["slowest_packages"] = {module: slowest_imports(module, env) for module in args.modules}
+    if not args.skip_warmup:
+        stdout, wall = run_python(["-c", WARMUP_SNIPPET], env)
+        results["warmup"] = {
+            "steps_seconds": json.loads(stdout.strip().splitlines()[-1]),
+            "process_seconds": round(wall, 4),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure cold-start import time of the entry points and the warm-up cost."
+    )
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per module.")
+    parser.add_argument(
+        "--modules", nargs="+", default=ENTRY_MODULES, help="Modules to import."
+    )
+    parser.add_argument("--skip-warmup", action="store_true", help="Do not time warm_up().")
+    parser.add_argument(
+        "--output", help="Results JSON path (default: bench/results/startup_<timestamp>.json)."
+    )
+    parser.add_argument("--compare", help="Earlier results JSON to compare against.")
+    parser.add_argument(
+        "--threshold", type=float, default=10.0, help="Percent change flagged as a regression."
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare, args.threshold)
@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bench.bench_retrieval import RESULTS_DIR, compare, latency_summary
+
+MODEL = "gpt-4.1-nano"
+
+# Upstream behaviours to put the clients through: a rate-limited API that
+# serves only a few requests at a time, a flaky one, and one that is down.
+SCENARIOS = {
+    "rate_limited": {"latency": 0.2, "max_concurrency": 4},
+    "flaky": {"latency": 0.05, "error_rate": 0.2},
+    "outage": {"latency": 0.05, "error_rate": 1.0},
+}
+
+
+class FakeUpstream:
+    """service.fake_openai with injected faults, served from a background thread."""
+
+    def __init__(self, **faults):
+        self.faults = faults
+        self.port = None
+        self._started = threading.Event()
+
+    def __enter__(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._started.wait()
+        return self
+
+    def _serve(self):
+        from aiohttp import web
+
+        from service.fake_openai import create_app
+
+        async def serve():
+            self.app = create_app(**self.faults)
+            runner = web.AppRunner(self.app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+            self._stop = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+            self._started.set()
+            await self._stop.wait()
+            await runner.cleanup()
+
+        asyncio.run(serve())
+
+    def stats(self):
+        from service.fake_openai import STATS_KEY
+
+        return dict(self.app[STATS_KEY])
+
+    def __exit__(self, *exc):
+        self._loop.call_soon_threadsafe(self._stop.set)
+
+
+def sdk_defaults_model():
+    """The client as it was built before the provider: SDK pool and retries."""
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=MODEL, temperature=0)
+
+
+def provider_model(max_concurrency):
+    from clients import provider
+
+    provider.LLM_MODEL_LIMITS[MODEL] = {"max_concurrency": max_concurrency}
+    return provider.get_chat_model(MODEL)
+
+
+async def drive(llm, requests, concurrency):
+    """Sends `requests` chat calls, `concurrency` at a time; latencies and outcomes."""
+    latencies = []
+    outcomes = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await llm.ainvoke(f"Is order {i} eligible for a return?")
+                outcomes["ok"] += 1
+            except Exception as e:
+                cause = e.__cause__ or e
+                outcomes[f"{type(e).__name__}:{type(cause).__name__}"] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, outcomes, time.perf_counter() - start
+
+
+def run_case(name, build, faults, args):
+    with FakeUpstream(**faults) as upstream:
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{upstream.port}/v1"
+        os.environ["OPENAI_API_KEY"] = "fake"
+        llm = build()
+        latencies, outcomes, seconds = asyncio.run(drive(llm, args.requests, args.concurrency))
+        served = upstream.stats()
+    return {
+        "client": name,
+        "succeeded": outcomes["ok"],
+        "success_rate": round(outcomes["ok"] / args.requests, 4),
+        "failures": {key: count for key, count in outcomes.items() if key != "ok"},
+        "upstream_requests": served.get("requests", 0),
+        "upstream_429": served.get("429", 0) + served.get("429_concurrency", 0),
+        "upstream_peak_in_flight": served.get("peak_in_flight", 0),
+        "wall_seconds": round(seconds, 3),
+        "latency": latency_summary(latencies),
+    }
+
+
+def run(args):
+    from clients import provider
+
+    provider.LLM_BACKOFF_MAX = args.backoff_max
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "provider_max_concurrency": args.max_concurrency,
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "scenarios": {},
+    }
+    for scenario in args.scenarios:
+        faults = SCENARIOS[scenario]
+        cases = {"sdk_defaults": run_case("sdk_defaults", sdk_defaults_model, faults, args)}
+        # A fresh provider state (breaker, budget) per scenario
+        provider._guards = provider.UpstreamGuards()
+        provider._http_client = provider._async_http_client = None
+        provider._models.clear()
+        cases["provider"] = run_case(
+            "provider", lambda: provider_model(args.max_concurrency), faults, args
+        )
+        cases["provider"]["guard"] = provider.client_stats().get(MODEL)
+        results["scenarios"][scenario] = {"faults": faults, **cases}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Chat calls through the shared client provider vs. SDK defaults, "
+        "against a local fake API with injected faults."
+    )
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32, help="Callers at a time.")
+    parser.add_argument(
+        "--max-concurrency", type=int, default=4, help="Provider's per-model concurrency cap."
+    )
+    parser.add_argument("--backoff-max", type=float, default=1.0, help="Provider backoff cap.")
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument(
+        "--output", help="Results JSON path (default: bench/results/upstream_<timestamp>.json)."
+    )
+    parser.add_argument("--compare", help="Earlier results JSON to compare against.")
+    parser.add_argument(
+        "--threshold", type=float, default=10.0, help="Percent change flagged as a regression."
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"upstream_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    for scenario, cases in results["scenarios"].items():
+        for name in ("sdk_defaults", "provider"):
+            case = cases[name]
+            print(
+                f"{scenario:13s} {name:13s} ok {case['success_rate']:.2f}  "
+                f"upstream {case['upstream_requests']:4d} (429: {case['upstream_429']:3d}, "
+                f"peak {case['upstream_peak_in_flight']:3d})  "
+                f"p50 {case['latency']['p50_ms']:.0f}ms  p99 {case['latency']['p99_ms']:.0f}ms"
+            )
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare, args.threshold)
@@ -0,0 +1,48 @@
+import hashlib
+import re
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+FAKE_EMBEDDING_DIM = 1536  # same width as text-embedding-ada-002 / -3-small
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic local embedding model for benchmarks.
+
+    Each word (and word bigram) is hashed into one of `dim` buckets with a
+    +/-1 sign, and the counts are L2-normalized. Texts sharing words get
+    similar vectors, so fuzzy queries behave roughly like they would with a
+    real model, at no cost and with identical results on every run.
+    """
+
+    def __init__(self, dim=FAKE_EMBEDDING_DIM):
+        self.dim = dim
+        self.calls = 0
+        self.texts = 0
+
+    def _features(self, text):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            yield value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def _embed(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for bucket, sign in self._features(text):
+                vectors[row, bucket] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def embed_documents(self, texts):
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text):
+        return self._embed([text])[0].tolist()
@@ -0,0 +1,186 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Synthetic orders in the exact markdown layout of order_information/*.md, so
+# ingest, the retriever and the record store can be exercised at any scale.
+
+# (category, brands, descriptions). Includes categories that hit the special
+# windows and non-returnable rules of the return policy.
+CATALOG = [
+    ("Wireless Earbuds", ["SoundPulse", "AudioNest", "Beatline"], [
+        "Noise-cancelling Bluetooth earbuds with ergonomic fit, 24-hour battery and touch controls.",
+        "True wireless earbuds with transparency mode, IPX5 sweat resistance and a compact charging case.",
+    ]),
+    ("Air Fryer", ["CrispMaster", "ChefEase", "HeatWave"], [
+        "5.8-quart digital air fryer, rapid heat circulation, 10 pre-set functions, dishwasher-safe basket.",
+        "Dual-basket air fryer with sync finish, 8-quart capacity and nonstick trays.",
+    ]),
+    ("Yoga Mat", ["FlexMat", "ZenStride", "CoreFlow"], [
+        "Extra-thick non-slip yoga mat with alignment lines and carrying strap.",
+        "Eco-friendly TPE yoga mat, 6mm cushioning, moisture-resistant surface.",
+    ]),
+    ("Robot Vacuum", ["CleanPath", "DustBot", "SweepPro"], [
+        "Self-charging robot vacuum with LiDAR mapping, app control and 150-minute runtime.",
+        "Slim robot vacuum and mop combo with automatic carpet detection.",
+    ]),
+    ("Portable Projector", ["LumiCast", "BeamBox", "ViewMax"], [
+        "1080p portable projector with built-in speaker, HDMI and USB inputs, 200-inch display.",
+        "Mini smart projector with autofocus, Wi-Fi streaming and keystone correction.",
+    ]),
+    ("Laptop Stand", ["ElevateGear", "DeskRise", "ErgoLift"], [
+        "Adjustable aluminum laptop stand with ventilated design for 10-17 inch laptops.",
+        "Foldable laptop riser with six height settings and non-slip pads.",
+    ]),
+    ("Adjustable Dumbbells", ["PowerShape", "IronFlex", "LiftCore"], [
+        "Pair of adjustable dumbbells from 5 to 52.5 lbs with quick-select dial.",
+        "Space-saving adjustable dumbbell set with storage tray.",
+    ]),
+    ("Reusable Water Bottle", ["AquaGuard", "HydroPeak", "FlowCanteen"], [
+        "32oz insulated stainless steel water bottle, leak-proof lid, BPA-free.",
+        "Collapsible silicone water bottle with carabiner clip for hiking.",
+    ]),
+    ("Essential Oil Diffuser", ["AromaWave", "MistHaven", "CalmLeaf"], [
+        "Ultrasonic essential oil diffuser with seven LED colors and auto shut-off.",
+        "Wood-grain aroma diffuser, 500ml tank, timer settings and quiet operation.",
+    ]),
+    ("Stainless Steel Cookware Set", ["ChefEase", "IronHearth", "Culina"], [
+        "10-piece tri-ply stainless steel cookware set, oven safe, induction compatible.",
+        "Stainless steel pots and pans set with glass lids and stay-cool handles.",
+    ]),
+    ("Smartphone", ["Apple", "Pixelon", "Novaphone"], [
+        "6.1-inch smartphone with dual camera system, 128GB storage and 5G.",
+        "Unlocked smartphone with OLED display, 256GB storage and fast charging.",
+    ]),
+    ("Mattress", ["DreamCloud", "Zinus", "RestWell"], [
+        "12-inch hybrid mattress with pocketed coils and cooling gel memory foam.",
+        "Medium-firm memory foam mattress in a box, CertiPUR-US certified.",
+    ]),
+    ("Baby Stroller", ["TinySteps", "CradleCo", "BabyRoam"], [
+        "Lightweight travel stroller with one-hand fold and reclining seat.",
+        "Jogging stroller with all-terrain wheels and adjustable handlebar.",
+    ]),
+    ("Grocery", ["FreshFarm", "PantryPlus", "GreenBasket"], [
+        "Organic fresh produce box with seasonal fruits and vegetables.",
+        "Assorted snack pack of nuts, dried fruit and granola bars.",
+    ]),
+    ("Kindle eBook", ["Kindle", "PageTurner", "ReadMore"], [
+        "Digital edition of a bestselling mystery novel.",
+        "Digital cookbook with 150 weeknight recipes.",
+    ]),
+]
+
+FIRST_NAMES = [
+    "melissa", "helen", "devon", "jamal", "sasha", "rachel", "omar", "li", "priya", "carlos",
+    "nina", "ethan", "grace", "mateo", "aisha", "lucas", "hannah", "kenji", "sofia", "owen",
+]
+LAST_NAMES = [
+    "noble", "smithers", "richards", "wilson", "fields", "mendez", "khan", "chen", "patel",
+    "garcia", "novak", "brooks", "kim", "rossi", "bello", "martin", "weber", "sato", "lopez",
+    "hughes",
+]
+EMAIL_DOMAINS = ["gmail.com", "outlook.com", "yahoo.com", "fastmail.com", "aol.com", "icloud.com"]
+STREETS = [
+    "Juniper Lane", "Aspen Ridge", "Oak Meadow", "Birchwood Drive", "Orchard Avenue",
+    "Magnolia Court", "Cedar Street", "Willow Way", "Maple Terrace", "Sycamore Road",
+]
+CITIES = [
+    "Silverbrook", "Pleasanton", "Willowtown", "Lakeville", "Pinegrove", "Meadowbrook",
+    "Riverton", "Fairhaven", "Clearwater", "Stonebridge",
+]
+
+# Order numbers are an affine bijection of the order's index onto 10-digit
+# numbers: unique for any count, scattered like real ids, and reproducible.
+ORDER_NUMBER_BASE = 1_000_000_000
+ORDER_NUMBER_SPAN = 9_000_000_000
+ORDER_NUMBER_STEP = 2_654_435_761  # coprime with ORDER_NUMBER_SPAN
+
+
+def order_number_for(index, seed=0):
+    return str(
+        ORDER_NUMBER_BASE + (index * ORDER_NUMBER_STEP + seed * 7919) % ORDER_NUMBER_SPAN
+    )
+
+
+def make_order(index, rng, seed=0, today=None, max_age_days=120):
+    """One synthetic order as a dict of the fields the markdown format holds."""
+    today = today or date.today()
+    category, brands, descriptions = CATALOG[rng.randrange(len(CATALOG))]
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return {
+        "order_number": order_number_for(index, seed),
+        "category": category,
+        "brand": rng.choice(brands),
+        "description": rng.choice(descriptions),
+        "username": f"{first}.{last}{rng.randrange(100)}@{rng.choice(EMAIL_DOMAINS)}",
+        "delivery_date": (today - timedelta(days=rng.randrange(max_age_days))).isoformat(),
+        "is_prime": rng.random() < 0.6,
+        "street": rng.choice(STREETS),
+        "suite": f"{rng.choice(['Apt.', 'Suite'])} {rng.randrange(1, 999)}",
+        "city": rng.choice(CITIES),
+        "zipcode": f"{rng.randrange(10000, 99999)}-{rng.randrange(1000, 9999)}",
+    }
+
+
+def render_order(order):
+    """Markdown for one order, field for field like order_information/*.md."""
+    return (
+        f"Product category: {order['category']}\n"
+        f"Brand: {order['brand']}\n"
+        f"Description: {order['description']}\n"
+        f"username: {order['username']}\n"
+        f"Delivery date: {order['delivery_date']}\n"
+        f"Order number: {order['order_number']}\n"
+        f"isPrime: {'true' if order['is_prime'] else 'false'}\n"
+        f"Address:\n\n"
+        f"Street: {order['street']}\n\n"
+        f"Suite: {order['suite']}\n\n"
+        f"City: {order['city']}\n\n"
+        f"Zipcode: {order['zipcode']}"
+    )
+
+
+def generate_orders(out_dir, count, orders_per_file=1, seed=0, sample_size=1000, today=None):
+    """
+    Write `count` orders to out_dir as order_<n>.md files, `orders_per_file`
+    orders each. Returns up to sample_size generated orders (a uniform
+    reservoir sample) for building benchmark queries.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    sample_rng = random.Random(seed + 1)
+    sample = []
+    start = time.perf_counter()
+
+    for file_index, first in enumerate(range(0, count, orders_per_file), 1):
+        orders = [
+            make_order(i, rng, seed, today) for i in range(first, min(first + orders_per_file, count))
+        ]
+        with open(os.path.join(out_dir, f"order_{file_index}.md"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(render_order(order) for order in orders))
+        for i, order in enumerate(orders, first):
+            if len(sample) < sample_size:
+                sample.append(order)
+            else:
+                slot = sample_rng.randrange(i + 1)
+                if slot < sample_size:
+                    sample[slot] = order
+
+    elapsed = time.perf_counter() - start
+    print(f"Generated {count} orders in {out_dir} in {elapsed:.2f}s")
+    return sample
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic order markdown files.")
+    parser.add_argument("out_dir", help="Directory to write order_<n>.md files into.")
+    parser.add_argument("--orders", type=int, default=1000, help="Number of orders.")
+    parser.add_argument("--orders-per-file", type=int, default=1, help="Orders per .md file.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (same seed, same orders).")
+    args = parser.parse_args()
+    generate_orders(args.out_dir, args.orders, args.orders_per_file, args.seed)
@@ -0,0 +1,702 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from observability.metrics import (
+    UPSTREAM_QUEUE_SECONDS,
+    UPSTREAM_REQUESTS,
+    UPSTREAM_RETRIES,
+    UPSTREAM_SHED,
+)
+
+logger = logging.getLogger(__name__)
+
+# One place that hands out the OpenAI clients. Every chat model and embedding
+# client shares one pooled HTTP client per process, and every request to the
+# API goes through a per-model guard:
+#   - a fair (first come, first served) queue in front of a concurrency cap
+#     and a tokens-per-minute budget,
+#   - retries with full-jitter exponential backoff on 429s, 5xx and
+#     connection errors, honoring Retry-After, within a retry budget,
+#   - a circuit breaker that refuses requests locally while the API keeps
+#     failing, instead of queueing them behind a dead upstream.
+# The SDK's own retries are switched off so they do not multiply these.
+
+# Connection pool shared by all models
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "32"))
+# Seconds for a whole API call (the SDK's default is 600)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# Per-model defaults; LLM_MODEL_LIMITS overrides them per model, e.g.
+#   LLM_MODEL_LIMITS='{"gpt-4.1-nano": {"max_concurrency": 8, "tokens_per_minute": 200000}}'
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# 0 disables the tokens-per-minute budget
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+# Requests waiting for a slot beyond this are refused at once
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+# Seconds a request may wait for a slot before it is refused
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_MODEL_LIMITS = json.loads(os.getenv("LLM_MODEL_LIMITS", "{}"))
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# Retries may add at most this fraction of the requests sent, plus a small
+# allowance for bursts, so a failing upstream never sees more than 1.2x load
+LLM_RETRY_BUDGET = float(os.getenv("LLM_RETRY_BUDGET", "0.2"))
+RETRY_BUDGET_BURST = 10
+
+# Consecutive failed attempts that open the circuit, and seconds it stays open
+# before one probe request is let through
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+# Token estimate for budgeting: prompt characters / 4, plus the completion
+# allowance (max_tokens when the request sets it)
+CHARS_PER_TOKEN = 4
+COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS", "256"))
+
+
+class UpstreamUnavailable(RuntimeError):
+    """A request refused locally: queue full, queue timeout or circuit open."""
+
+    def __init__(self, model, reason):
+        super().__init__(f"{model}: request shed ({reason})")
+        self.model = model
+        self.reason = reason
+
+
+def request_cost(request):
+    """(model, estimated tokens) of an OpenAI API request."""
+    try:
+        body = json.loads(request.content or b"{}")
+    except (ValueError, httpx.RequestNotRead):
+        return "unknown", 0
+    if not isinstance(body, dict):
+        return "unknown", 0
+    if "messages" in body:
+        chars = 0
+        for message in body["messages"]:
+            content = message.get("content") or ""
+            if isinstance(content, list):
+                content = " ".join(str(part.get("text", "")) for part in content)
+            chars += len(str(content))
+        completion = body.get("max_completion_tokens") or body.get("max_tokens") or COMPLETION_TOKENS
+        return body.get("model", "unknown"), chars // CHARS_PER_TOKEN + completion
+    inputs = body.get("input", [])
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    tokens = sum(
+        len(item) if isinstance(item, list) else len(item) // CHARS_PER_TOKEN for item in inputs
+    )
+    return body.get("model", "unknown"), tokens
+
+
+class _Waiter:
+    __slots__ = ("cost", "wake", "granted")
+
+    def __init__(self, cost, wake):
+        self.cost = cost
+        self.wake = wake
+        self.granted = False
+
+
+class FairLimiter:
+    """
+    Concurrency cap plus a tokens-per-minute bucket with one FIFO queue in
+    front of both. Slots are granted strictly in arrival order, so a large
+    request waiting for budget is not starved by small ones behind it. Used
+    from threads (acquire) and event loops (aacquire) alike.
+    """
+
+    def __init__(
+        self,
+        name="",
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+        max_queue=LLM_MAX_QUEUE,
+        queue_timeout=LLM_QUEUE_TIMEOUT,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._queue = deque()
+        self._tokens = float(tokens_per_minute)
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _dispatch(self):
+        """
+        Grants slots to waiters in order while there is room. Returns the
+        seconds until the head waiter's tokens are refilled, or None when it
+        is waiting for a slot (or nobody is waiting). Call under the lock.
+        """
+        if self.tokens_per_minute:
+            now = time.monotonic()
+            rate = self.tokens_per_minute / 60.0
+            self._tokens = min(self.tokens_per_minute, self._tokens + (now - self._refilled) * rate)
+            self._refilled = now
+        while self._queue and self.in_flight < self.max_concurrency:
+            waiter = self._queue[0]
+            if self.tokens_per_minute:
+                # A request larger than the whole budget runs on a full bucket
+                cost = min(waiter.cost, self.tokens_per_minute)
+                if self._tokens < cost:
+                    return (cost - self._tokens) / rate
+                self._tokens -= cost
+            self._queue.popleft()
+            self.in_flight += 1
+            waiter.granted = True
+            waiter.wake()
+        return None
+
+    def _enqueue(self, waiter):
+        """Queues a waiter; returns the head's refill wait (see _dispatch)."""
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                raise UpstreamUnavailable(self.name, "queue_full")
+            self._queue.append(waiter)
+            return self._dispatch()
+
+    def _abandon(self, waiter):
+        """Takes a waiter that gave up out of the queue; True if it got a slot meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._queue.remove(waiter)
+            self._dispatch()
+            return False
+
+    def acquire(self, cost=0):
+        """
+        Blocks for a slot and returns the seconds waited. Raises
+        UpstreamUnavailable if the queue is full or the wait times out.
+        """
+        start = time.monotonic()
+        wakeup = threading.Event()
+        waiter = _Waiter(cost, wakeup.set)
+        refill = self._enqueue(waiter)
+        deadline = start + self.queue_timeout
+        while not waiter.granted:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if not self._abandon(waiter):
+                    raise UpstreamUnavailable(self.name, "queue_timeout")
+                break
+            # Nobody releases a slot when only the token bucket is short, so
+            # the head waiter wakes itself up once the tokens are back
+            wakeup.wait(min(remaining, refill) if refill is not None else remaining)
+            wakeup.clear()
+            with self._lock:
+                refill = self._dispatch()
+        return time.monotonic() - start
+
+    async def aacquire(self, cost=0):
+        """Waits for a slot without blocking the event loop; like acquire."""
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        waiter = _Waiter(cost, lambda: loop.call_soon_threadsafe(wakeup.set))
+        refill = self._enqueue(waiter)
+        deadline = start + self.queue_timeout
+        try:
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if not self._abandon(waiter):
+                        raise UpstreamUnavailable(self.name, "queue_timeout")
+                    break
+                try:
+                    await asyncio.wait_for(
+                        wakeup.wait(), min(remaining, refill) if refill is not None else remaining
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+                with self._lock:
+                    refill = self._dispatch()
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+        return time.monotonic() - start
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._dispatch()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queued": len(self._queue),
+                "max_concurrency": self.max_concurrency,
+                "tokens_per_minute": self.tokens_per_minute,
+                "tokens_available": round(self._tokens) if self.tokens_per_minute else None,
+            }
+
+
+class RetryBudget:
+    """Every request earns `ratio` of a retry; every retry spends one."""
+
+    def __init__(self, ratio=LLM_RETRY_BUDGET, burst=RETRY_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self._balance = float(burst)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._balance = min(self.burst, self._balance + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Closed: requests flow. After `failures` consecutive failed attempts it
+    opens and refuses requests for `cooldown` seconds, then lets a single
+    probe through (half-open); the probe's outcome closes or reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.cooldown
+
+    def allow(self):
+        """True if a request may be sent now; in half-open state, only the probe."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, ok):
+        """Outcome of an allowed request: True, False, or None if it never finished."""
+        with self._lock:
+            if ok is None:
+                self._probing = False
+            elif ok:
+                self.state = self.CLOSED
+                self.failures = 0
+                self._probing = False
+            else:
+                self.failures += 1
+                if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                    if self.state != self.OPEN:
+                        logger.warning("Circuit opened after %d failed attempts", self.failures)
+                        self.opened += 1
+                    self.state = self.OPEN
+                    self._opened_at = time.monotonic()
+                    self._probing = False
+
+
+def retry_after(response):
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms), if any."""
+    if response is None:
+        return None
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+def backoff(attempt, response=None):
+    """Full-jitter exponential backoff, or the server's Retry-After when sooner than the cap."""
+    requested = retry_after(response)
+    if requested is not None:
+        return min(requested, LLM_BACKOFF_MAX)
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2**attempt))
+
+
+class UpstreamGuard:
+    """Limiter, breaker and retry policy of one model."""
+
+    def __init__(self, model, limits=None):
+        limits = {**LLM_MODEL_LIMITS.get(model, {}), **(limits or {})}
+        self.model = model
+        self.limiter = FairLimiter(
+            model,
+            max_concurrency=limits.get("max_concurrency", LLM_MAX_CONCURRENCY),
+            tokens_per_minute=limits.get("tokens_per_minute", LLM_TOKENS_PER_MINUTE),
+            max_queue=limits.get("max_queue", LLM_MAX_QUEUE),
+            queue_timeout=limits.get("queue_timeout", LLM_QUEUE_TIMEOUT),
+        )
+        self.breaker = CircuitBreaker()
+        self.budget = RetryBudget()
+        self.max_retries = limits.get("max_retries", LLM_MAX_RETRIES)
+        self.counts = Counter()
+
+    def _shed(self, reason):
+        self.counts[f"shed_{reason}"] += 1
+        UPSTREAM_SHED.inc(model=self.model, reason=reason)
+        return UpstreamUnavailable(self.model, reason)
+
+    def _admitted(self, waited):
+        """After the queue: refuse if the circuit opened meanwhile."""
+        UPSTREAM_QUEUE_SECONDS.observe(waited, model=self.model)
+        if not self.breaker.allow():
+            self.limiter.release()
+            raise UpstreamUnavailable(self.model, "circuit_open")
+
+    def _outcome(self, response, error):
+        """Records an attempt; True if it should be retried."""
+        UPSTREAM_REQUESTS.inc(model=self.model, outcome=_reason(response, error))
+        self.counts["attempts"] += 1
+        failed = error is not None or response.status_code in RETRYABLE_STATUS
+        self.breaker.record(not failed)
+        if failed:
+            self.counts["failures"] += 1
+        return failed
+
+    def _may_retry(self, attempt, reason):
+        if attempt >= self.max_retries or self.breaker.is_open():
+            return False
+        if not self.budget.withdraw():
+            self.counts["retry_budget_exhausted"] += 1
+            return False
+        self.counts["retries"] += 1
+        UPSTREAM_RETRIES.inc(model=self.model, reason=reason)
+        return True
+
+    def _precheck(self):
+        if self.breaker.is_open():
+            raise self._shed("circuit_open")
+        self.counts["requests"] += 1
+        self.budget.deposit()
+
+    def send(self, request, send):
+        """Sends request with send(request) under this guard's policy."""
+        self._precheck()
+        cost = request_cost(request)[1]
+        attempt = 0
+        while True:
+            try:
+                self._admitted(self.limiter.acquire(cost))
+            except UpstreamUnavailable as e:
+                raise self._shed(e.reason) from None
+            response = error = None
+            try:
+                response = send(request)
+            except httpx.TransportError as e:
+                error = e
+            except BaseException:
+                self.breaker.record(None)
+                self.limiter.release()
+                raise
+            if not self._outcome(response, error):
+                # The slot is held until the body is read (or the stream closed)
+                response.stream = _ReleasingStream(response.stream, self.limiter.release)
+                return response
+            if response is not None:
+                response.read()
+                response.close()
+            self.limiter.release()
+            if not self._may_retry(attempt, _reason(response, error)):
+                if error is not None:
+                    raise error
+                return _detached(response, request)
+            time.sleep(backoff(attempt, response))
+            attempt += 1
+
+    async def asend(self, request, send):
+        """Async variant of send."""
+        self._precheck()
+        cost = request_cost(request)[1]
+        attempt = 0
+        while True:
+            try:
+                self._admitted(await self.limiter.aacquire(cost))
+            except UpstreamUnavailable as e:
+                raise self._shed(e.reason) from None
+            response = error = None
+            try:
+                response = await send(request)
+            except httpx.TransportError as e:
+                error = e
+            except BaseException:
+                self.breaker.record(None)
+                self.limiter.release()
+                raise
+            if not self._outcome(response, error):
+                response.stream = _AsyncReleasingStream(response.stream, self.limiter.release)
+                return response
+            if response is not None:
+                await response.aread()
+                await response.aclose()
+            self.limiter.release()
+            if not self._may_retry(attempt, _reason(response, error)):
+                if error is not None:
+                    raise error
+                return _detached(response, request)
+            await asyncio.sleep(backoff(attempt, response))
+            attempt += 1
+
+    def stats(self):
+        return {
+            **self.limiter.stats(),
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+            **self.counts,
+        }
+
+
+def _reason(response, error):
+    """Status code of a response, or the name of a transport error."""
+    return type(error).__name__ if error is not None else str(response.status_code)
+
+
+def _detached(response, request):
+    """A read, closed error response rebuilt so the SDK can raise its usual error from it."""
+    return httpx.Response(
+        response.status_code, headers=response.headers, content=response.content, request=request
+    )
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+class UpstreamGuards:
+    """The guards of all models, created on first request for a model."""
+
+    def __init__(self):
+        self._guards = {}
+        self._lock = threading.Lock()
+
+    def guard(self, model):
+        guard = self._guards.get(model)
+        if guard is None:
+            with self._lock:
+                guard = self._guards.setdefault(model, UpstreamGuard(model))
+        return guard
+
+    def stats(self):
+        with self._lock:
+            guards = dict(self._guards)
+        return {model: guard.stats() for model, guard in sorted(guards.items())}
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE
+    )
+
+
+class GuardedTransport(httpx.BaseTransport):
+    """Pooled HTTP transport that sends every request through its model's guard."""
+
+    def __init__(self, guards):
+        self.guards = guards
+        self._transport = httpx.HTTPTransport(limits=_limits())
+
+    def handle_request(self, request):
+        model, _ = request_cost(request)
+        return self.guards.guard(model).send(request, self._transport.handle_request)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncGuardedTransport(httpx.AsyncBaseTransport):
+    """
+    Async counterpart of GuardedTransport. Connections belong to the event
+    loop that opened them, so each loop gets its own pool (the CLI runs a
+    fresh loop per conversation; the server runs one).
+    """
+
+    def __init__(self, guards):
+        self.guards = guards
+        self._transports = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _transport(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(limits=_limits())
+        return transport
+
+    async def handle_async_request(self, request):
+        model, _ = request_cost(request)
+        return await self.guards.guard(model).asend(request, self._transport().handle_async_request)
+
+    async def aclose(self):
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+_guards = UpstreamGuards()
+_http_client = None
+_async_http_client = None
+_models = {}
+_clients_lock = threading.Lock()
+_models_lock = threading.Lock()
+
+
+def get_http_client():
+    """The process-wide pooled, guarded httpx.Client."""
+    global _http_client
+    if _http_client is None:
+        with _clients_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    transport=GuardedTransport(_guards), timeout=LLM_TIMEOUT
+                )
+    return _http_client
+
+
+def get_async_http_client():
+    """The process-wide pooled, guarded httpx.AsyncClient."""
+    global _async_http_client
+    if _async_http_client is None:
+        with _clients_lock:
+            if _async_http_client is None:
+                _async_http_client = httpx.AsyncClient(
+                    transport=AsyncGuardedTransport(_guards), timeout=LLM_TIMEOUT
+                )
+    return _async_http_client
+
+
+def _shared(key, build):
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = _models[key] = build()
+    return model
+
+
+def get_chat_model(model, temperature=0):
+    """
+    The shared ChatOpenAI for (model, temperature). Token usage is reported
+    for streamed answers too, and LLM latency and tokens are recorded.
+    """
+
+    def build():
+        from langchain_openai import ChatOpenAI
+
+        from observability.metrics import LLMMetricsHandler
+
+        return ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            stream_usage=True,
+            callbacks=[LLMMetricsHandler()],
+            max_retries=0,
+            timeout=LLM_TIMEOUT,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+        )
+
+    return _shared(("chat", model, temperature), build)
+
+
+def get_embedding_model(model=None):
+    """The shared OpenAIEmbeddings (the langchain default model unless given)."""
+
+    def build():
+        from langchain_openai import OpenAIEmbeddings
+
+        kwargs = {"model": model} if model else {}
+        return OpenAIEmbeddings(
+            max_retries=0,
+            timeout=LLM_TIMEOUT,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+            **kwargs,
+        )
+
+    return _shared(("embeddings", model), build)
+
+
+def client_stats():
+    """Per-model queue, limit, circuit and retry counters."""
+    return _guards.stats()
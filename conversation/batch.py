@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime
+
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+load_dotenv()
+
+from conversation.graph import (
+    ELIGIBILITY_MODEL,
+    eligibility_cache_key,
+    eligibility_messages,
+    get_llm,
+)
+from conversation.response_cache import get_response_cache
+from observability.logs import configure_logging
+from rag.order_records import parse_order_record
+from rag.retriever import get_order_record, query_order_info
+from tools.eligibility_fast_path import is_clear_cut, render_decision
+from tools.return_policy_tool import evaluate_order, return_policy_for_order
+
+logger = logging.getLogger(__name__)
+
+# Orders resolved and evaluated together; their LLM calls go out as one batch
+BATCH_SIZE = int(os.getenv("BATCH_ELIGIBILITY_SIZE", "256"))
+# Concurrent LLM requests within a batch
+LLM_CONCURRENCY = int(os.getenv("BATCH_ELIGIBILITY_CONCURRENCY", "8"))
+
+ORDER_NUMBER_FIELDS = ("order_number", "order", "order_id", "Order number")
+# Same shape the conversation accepts; anything else would fall through to
+# (embedding-backed) free-text search
+ORDER_NUMBER_PATTERN = re.compile(r"\d{6,}")
+
+
+def _order_number_from(value):
+    if isinstance(value, dict):
+        for field in ORDER_NUMBER_FIELDS:
+            if value.get(field) not in (None, ""):
+                return str(value[field]).strip()
+        return None
+    if value in (None, ""):
+        return None
+    return str(value).strip()
+
+
+def read_order_numbers(lines, fmt="auto"):
+    """
+    Yields order numbers from JSONL (objects with an order_number field, or
+    bare strings/numbers) or CSV (an order_number column, or the first column
+    when there is no header). Rows without an order number yield None.
+    """
+    lines = iter(lines)
+    if fmt == "auto":
+        for first in lines:
+            if first.strip():
+                break
+        else:
+            return
+        fmt = "jsonl" if first.lstrip()[:1] in ("{", '"') else "csv"
+        lines = _chain([first], lines)
+
+    if fmt == "jsonl":
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                yield _order_number_from(json.loads(line))
+            except ValueError:
+                yield None
+        return
+
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    column = next((header.index(f) for f in ORDER_NUMBER_FIELDS if f in header), None)
+    if column is None:
+        # No header row: the first column holds the order numbers
+        column = 0
+        yield _order_number_from(header[0] if header else None)
+    for row in reader:
+        if row:
+            yield _order_number_from(row[column] if column < len(row) else None)
+
+
+def _chain(*iterables):
+    for iterable in iterables:
+        yield from iterable
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resolve_order(order_number, current_date):
+    """
+    Looks one order up and evaluates it the way the graph's retrieve_order and
+    fetch_policy nodes do. Returns a result dict plus, for orders that need
+    the LLM, the context for the eligibility prompt.
+    """
+    result = {"order_number": order_number}
+    if not order_number or not ORDER_NUMBER_PATTERN.fullmatch(order_number):
+        return {**result, "status": "INVALID", "error": "not an order number"}, None
+
+    docs = query_order_info(order_number)
+    if not docs:
+        return {**result, "status": "NOT FOUND"}, None
+    order_info = docs[0].page_content
+    record = get_order_record(order_number) or parse_order_record(order_info)
+    if not record or record.order_number != order_number:
+        return {**result, "status": "NOT FOUND"}, None
+
+    decision = evaluate_order(record, current_date)
+    result.update(
+        status=decision.status,
+        policy_class=decision.policy_class,
+        window_days=decision.window_days,
+        days_since_delivery=decision.days_since_delivery,
+        days_remaining=decision.days_remaining,
+        delivery_date=record.delivery_date.isoformat() if record.delivery_date else None,
+        category=record.category,
+    )
+    if is_clear_cut(decision, record):
+        return {**result, "path": "fast_path", "answer": render_decision(decision, record)}, None
+
+    # The passages fetch_return_policy returns for a known order
+    policy_text = return_policy_for_order(record, current_date)
+    return result, (record, order_info, policy_text)
+
+
+async def evaluate_batch(order_numbers, current_date, concurrency=LLM_CONCURRENCY):
+    """
+    Results for one batch of order numbers, in input order. Clear-cut orders
+    are answered from templates, repeats from the response cache, and the rest
+    with one batched LLM call bounded by `concurrency`.
+    """
+    date_str = current_date.isoformat()
+    cache = get_response_cache()
+    resolved = {}
+    for order_number in dict.fromkeys(order_numbers):
+        resolved[order_number] = resolve_order(order_number, current_date)
+
+    pending = []  # (order_number, cache key, prompt messages)
+    for order_number, (result, context) in resolved.items():
+        if context is None:
+            continue
+        order, order_info, policy_text = context
+        key = eligibility_cache_key(order, date_str) if cache is not None else None
+        cached = cache.get(key) if key is not None else None
+        if cached is not None:
+            result.update(path="cached", answer=cached)
+        else:
+            pending.append((order_number, key, eligibility_messages(order_info, policy_text, date_str)))
+
+    if pending:
+        responses = await get_llm().abatch(
+            [messages for _, _, messages in pending],
+            config={"max_concurrency": concurrency},
+            return_exceptions=True,
+        )
+        for (order_number, key, _), response in zip(pending, responses):
+            result = resolved[order_number][0]
+            if isinstance(response, Exception):
+                logger.warning("LLM call for order %s failed: %s", order_number, response)
+                result.update(path="llm_path", error=str(response))
+                continue
+            result.update(path="llm_path", answer=response.content)
+            if key is not None and response.content:
+                cache.put(key, response.content)
+
+    return [dict(resolved[order_number][0]) for order_number in order_numbers]
+
+
+async def run_batch(
+    lines, out, fmt="auto", batch_size=BATCH_SIZE, concurrency=LLM_CONCURRENCY, current_date=None
+):
+    """
+    Evaluates every order number read from lines and writes one JSON object
+    per order to out as each batch completes. Returns a summary with orders/sec.
+    """
+    current_date = current_date or date.today()
+    stats = Counter()
+    start = time.perf_counter()
+    for batch in _batches(read_order_numbers(lines, fmt), batch_size):
+        results = await evaluate_batch(batch, current_date, concurrency)
+        for result in results:
+            out.write(json.dumps(result) + "\n")
+            stats["orders"] += 1
+            stats[f"status:{result['status']}"] += 1
+            if "path" in result:
+                stats[f"path:{result['path']}"] += 1
+            if "error" in result:
+                stats["errors"] += 1
+        out.flush()
+        elapsed = time.perf_counter() - start
+        logger.info("%d orders in %.1fs (%.1f orders/s)", stats["orders"], elapsed, stats["orders"] / elapsed)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "orders": stats["orders"],
+        "seconds": round(elapsed, 3),
+        "orders_per_second": round(stats["orders"] / elapsed, 1) if elapsed else 0.0,
+        "model": ELIGIBILITY_MODEL,
+        "current_date": current_date.isoformat(),
+        "status": {k.split(":", 1)[1]: v for k, v in stats.items() if k.startswith("status:")},
+        "paths": {k.split(":", 1)[1]: v for k, v in stats.items() if k.startswith("path:")},
+        "errors": stats["errors"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evaluate return eligibility for many orders; writes one JSON line per order."
+    )
+    parser.add_argument(
+        "input", nargs="?", default="-", help="JSONL or CSV of order numbers ('-' for stdin)."
+    )
+    parser.add_argument("-o", "--output", default="-", help="Results JSONL ('-' for stdout).")
+    parser.add_argument("--format", choices=("auto", "jsonl", "csv"), default="auto")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=LLM_CONCURRENCY, help="Parallel LLM calls.")
+    parser.add_argument("--date", help="Evaluate as of this date (YYYY-MM-DD, default today).")
+    args = parser.parse_args()
+    configure_logging()
+
+    current_date = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else None
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8", newline="")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        summary = asyncio.run(
+            run_batch(source, out, args.format, args.batch_size, args.concurrency, current_date)
+        )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(summary), file=sys.stderr)
@@ -0,0 +1,501 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from rag.order_records import OrderRecord
+from tools.return_policy_engine import EligibilityDecision
+
+logger = logging.getLogger(__name__)
+
+# "sqlite" (default), "memory" or "off"
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "sqlite")
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "rag/checkpoints.sqlite3")
+# Checkpoints are buffered and written in one transaction at most this many
+# seconds later (or as soon as this many rows are waiting). A crash loses at
+# most the last interval; the session then resumes one step earlier.
+CHECKPOINT_FLUSH_SECONDS = float(os.getenv("CHECKPOINT_FLUSH_SECONDS", "0.05"))
+CHECKPOINT_BATCH_SIZE = int(os.getenv("CHECKPOINT_BATCH_SIZE", "512"))
+# Checkpoints kept per session; resuming only needs the latest
+CHECKPOINT_HISTORY = int(os.getenv("CHECKPOINT_HISTORY", "2"))
+# Sessions nobody resumed are dropped after this many seconds
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL", "86400"))
+EXPIRY_CHECK_INTERVAL = 60
+
+
+class CompactSerializer:
+    """
+    Checkpoint serializer. Order records and eligibility decisions are stored
+    as short JSON lists of their fields; every other value goes through
+    LangGraph's own serializer.
+    """
+
+    def __init__(self):
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+        self._fallback = JsonPlusSerializer()
+
+    def dumps_typed(self, obj):
+        if isinstance(obj, OrderRecord):
+            return "order_record", json.dumps(obj.to_list()).encode("utf-8")
+        if isinstance(obj, EligibilityDecision):
+            return "eligibility", json.dumps(list(obj)).encode("utf-8")
+        return self._fallback.dumps_typed(obj)
+
+    def loads_typed(self, data):
+        type_, payload = data
+        if type_ == "order_record":
+            return OrderRecord.from_list(json.loads(payload))
+        if type_ == "eligibility":
+            return EligibilityDecision(*json.loads(payload))
+        return self._fallback.loads_typed(data)
+
+
+def _thread_key(config):
+    configurable = config["configurable"]
+    return configurable["thread_id"], configurable.get("checkpoint_ns", "")
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer in a SQLite file, shared by every worker that
+    points at it, so any of them can resume any session.
+
+    Channel values are stored once per version, so a step writes only the
+    channels it changed, not the whole state. Writes are buffered and flushed
+    in batches by a background thread. Reads see the buffer, so the writing
+    process always reads its own latest checkpoint. Only the last
+    CHECKPOINT_HISTORY checkpoints of a session are kept.
+    """
+
+    def __init__(
+        self,
+        path=CHECKPOINT_PATH,
+        flush_seconds=CHECKPOINT_FLUSH_SECONDS,
+        batch_size=CHECKPOINT_BATCH_SIZE,
+        history=CHECKPOINT_HISTORY,
+        ttl=CHECKPOINT_TTL,
+    ):
+        super().__init__(serde=CompactSerializer())
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.history = history
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                parent_id TEXT,
+                type TEXT NOT NULL,
+                checkpoint BLOB NOT NULL,
+                metadata BLOB NOT NULL,
+                stored_at REAL NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                version TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB,
+                task_path TEXT NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS checkpoints_stored_at ON checkpoints (stored_at);
+            """
+        )
+        self._conn.commit()
+        self._lock = threading.RLock()
+        # Rows waiting for the next flush, keyed like their primary keys
+        self._checkpoints = {}
+        self._blobs = {}
+        self._writes = {}
+        self._expired_at = 0.0
+        self.stats = {"flushes": 0, "rows_written": 0, "checkpoints": 0, "expired_sessions": 0}
+        self._wake = threading.Event()
+        self._closed = False
+        # The flusher holds only a weak reference, so an unused saver can be collected
+        threading.Thread(
+            target=_flush_loop, args=(weakref.ref(self), self._wake), daemon=True,
+            name="checkpoint-flush",
+        ).start()
+
+    # ── writing ─────────────────────────────────
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id, checkpoint_ns = _thread_key(config)
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+        type_, payload = self.serde.dumps_typed(checkpoint)
+        _, meta = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            for channel, version in new_versions.items():
+                value = (
+                    self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)
+                )
+                self._blobs[(thread_id, checkpoint_ns, channel, str(version))] = value
+            self._checkpoints[(thread_id, checkpoint_ns, checkpoint["id"])] = (
+                config["configurable"].get("checkpoint_id"),
+                type_,
+                payload,
+                meta,
+                time.time(),
+            )
+            self.stats["checkpoints"] += 1
+            if self._pending() >= self.batch_size:
+                self._wake.set()
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id, checkpoint_ns = _thread_key(config)
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            for i, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, i)
+                key = (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                self._writes[key] = (channel, *self.serde.dumps_typed(value), task_path)
+
+    def _pending(self):
+        return len(self._checkpoints) + len(self._blobs) + len(self._writes)
+
+    def flush(self):
+        """Writes every buffered row in one transaction, then prunes old checkpoints."""
+        with self._lock:
+            if not self._pending():
+                self._expire()
+                return
+            checkpoints, blobs, writes = self._checkpoints, self._blobs, self._writes
+            self._checkpoints, self._blobs, self._writes = {}, {}, {}
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [key + row for key, row in checkpoints.items()],
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                    [key + row for key, row in blobs.items()],
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [key[:4] + (key[4],) + row for key, row in writes.items()],
+                )
+                for thread_id, checkpoint_ns in {key[:2] for key in checkpoints}:
+                    self._prune(thread_id, checkpoint_ns)
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += len(checkpoints) + len(blobs) + len(writes)
+            self._expire()
+
+    def _prune(self, thread_id, checkpoint_ns):
+        """Drops a session's checkpoints beyond the history, and what only they used."""
+        rows = self._conn.execute(
+            "SELECT checkpoint_id, type, checkpoint FROM checkpoints "
+            "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        if len(rows) <= self.history:
+            return
+        kept = rows[: self.history]
+        oldest = kept[-1][0]
+        self._conn.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, oldest),
+        )
+        self._conn.execute(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, oldest),
+        )
+        used = set()
+        for _, type_, payload in kept:
+            versions = self.serde.loads_typed((type_, payload))["channel_versions"]
+            used.update((channel, str(version)) for channel, version in versions.items())
+        stale = [
+            (thread_id, checkpoint_ns, channel, version)
+            for channel, version in self._conn.execute(
+                "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            )
+            if (channel, version) not in used
+        ]
+        self._conn.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? "
+            "AND version = ?",
+            stale,
+        )
+
+    def _expire(self):
+        """Deletes sessions idle for longer than the TTL (checked once a minute)."""
+        now = time.time()
+        if now - self._expired_at < EXPIRY_CHECK_INTERVAL:
+            return
+        self._expired_at = now
+        threads = [
+            row[0]
+            for row in self._conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(stored_at) < ?",
+                (now - self.ttl,),
+            )
+        ]
+        for thread_id in threads:
+            self._delete(thread_id)
+        if threads:
+            self._conn.commit()
+            self.stats["expired_sessions"] += len(threads)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            for pending in (self._checkpoints, self._blobs, self._writes):
+                for key in [key for key in pending if key[0] == thread_id]:
+                    del pending[key]
+            self._delete(thread_id)
+            self._conn.commit()
+
+    def _delete(self, thread_id):
+        for table in ("checkpoints", "blobs", "writes"):
+            self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def close(self):
+        """Flushes what is buffered and stops the flusher."""
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    # ── reading ─────────────────────────────────
+    def _checkpoint_row(self, thread_id, checkpoint_ns, checkpoint_id):
+        """(checkpoint_id, parent_id, type, checkpoint, metadata) from the buffer or the file."""
+        if checkpoint_id:
+            row = self._checkpoints.get((thread_id, checkpoint_ns, checkpoint_id))
+            if row is not None:
+                return (checkpoint_id, *row[:4])
+            return self._conn.execute(
+                "SELECT checkpoint_id, parent_id, type, checkpoint, metadata FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchone()
+        # Checkpoint ids sort by creation time
+        buffered = [
+            key[2] for key in self._checkpoints if key[0] == thread_id and key[1] == checkpoint_ns
+        ]
+        stored = self._conn.execute(
+            "SELECT checkpoint_id, parent_id, type, checkpoint, metadata FROM checkpoints "
+            "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+            (thread_id, checkpoint_ns),
+        ).fetchone()
+        if buffered and (stored is None or max(buffered) > stored[0]):
+            latest = max(buffered)
+            return (latest, *self._checkpoints[(thread_id, checkpoint_ns, latest)][:4])
+        return stored
+
+    def _channel_values(self, thread_id, checkpoint_ns, versions):
+        values = {}
+        for channel, version in versions.items():
+            key = (thread_id, checkpoint_ns, channel, str(version))
+            blob = self._blobs.get(key)
+            if blob is None:
+                blob = self._conn.execute(
+                    "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "AND channel = ? AND version = ?",
+                    key,
+                ).fetchone()
+            if blob is not None and blob[0] != "empty":
+                values[channel] = self.serde.loads_typed(blob)
+        return values
+
+    def _pending_writes(self, thread_id, checkpoint_ns, checkpoint_id):
+        rows = {
+            key[3:]: (key[3], row[0], row[1], row[2])
+            for key, row in self._writes.items()
+            if key[:3] == (thread_id, checkpoint_ns, checkpoint_id)
+        }
+        for task_id, idx, channel, type_, value in self._conn.execute(
+            "SELECT task_id, idx, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ):
+            rows.setdefault((task_id, idx), (task_id, channel, type_, value))
+        return [
+            (task_id, channel, self.serde.loads_typed((type_, value)))
+            for (_, _), (task_id, channel, type_, value) in sorted(rows.items())
+        ]
+
+    def get_tuple(self, config):
+        thread_id, checkpoint_ns = _thread_key(config)
+        with self._lock:
+            row = self._checkpoint_row(thread_id, checkpoint_ns, get_checkpoint_id(config))
+            if row is None:
+                return None
+            checkpoint_id, parent_id, type_, payload, meta = row
+            checkpoint = self.serde.loads_typed((type_, payload))
+            checkpoint["channel_values"] = self._channel_values(
+                thread_id, checkpoint_ns, checkpoint["channel_versions"]
+            )
+            writes = self._pending_writes(thread_id, checkpoint_ns, checkpoint_id)
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=checkpoint,
+            metadata=self.serde.loads_typed(("msgpack", meta)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=writes,
+        )
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        """Checkpoints newest first (history is short: see CHECKPOINT_HISTORY)."""
+        self.flush()
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id FROM checkpoints"
+        clauses, params = [], []
+        if config is not None:
+            thread_id, checkpoint_ns = _thread_key(config)
+            clauses += ["thread_id = ?", "checkpoint_ns = ?"]
+            params += [thread_id, checkpoint_ns]
+        if before is not None:
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            keys = self._conn.execute(query, params).fetchall()
+        count = 0
+        for thread_id, checkpoint_ns, checkpoint_id in keys:
+            found = self.get_tuple(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": checkpoint_id,
+                    }
+                }
+            )
+            if found is None or (
+                filter and any(found.metadata.get(k) != v for k, v in filter.items())
+            ):
+                continue
+            yield found
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+    # The sync methods take self._lock, which the flush thread and
+    # delete_thread hold across SQLite I/O, and reads query the file, so the
+    # async variants run them in a thread rather than blocking the event loop.
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def _flush_loop(saver_ref, wake):
+    while True:
+        saver = saver_ref()
+        if saver is None or saver._closed:
+            return
+        interval = saver.flush_seconds
+        try:
+            saver.flush()
+        except Exception as e:
+            logger.warning("Checkpoint flush failed: %s", e)
+        del saver
+        wake.wait(interval)
+        wake.clear()
+
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer():
+    """
+    Returns the shared checkpointer for CHECKPOINT_BACKEND, or None when
+    checkpointing is turned off.
+    """
+    global _checkpointer
+    if CHECKPOINT_BACKEND == "off" and _checkpointer is None:
+        return None
+    if _checkpointer is None:
+        with _checkpointer_lock:
+            if _checkpointer is None:
+                if CHECKPOINT_BACKEND == "sqlite":
+                    _checkpointer = SQLiteCheckpointSaver()
+                    # Buffered checkpoints are written before the process exits
+                    atexit.register(_checkpointer.close)
+                elif CHECKPOINT_BACKEND == "memory":
+                    from langgraph.checkpoint.memory import InMemorySaver
+
+                    _checkpointer = InMemorySaver(serde=CompactSerializer())
+                else:
+                    raise ValueError(f"Unknown CHECKPOINT_BACKEND: {CHECKPOINT_BACKEND}")
+    return _checkpointer
+
+
+def set_checkpointer(checkpointer):
+    """Install a custom BaseCheckpointSaver (or None to go back to CHECKPOINT_BACKEND)."""
+    global _checkpointer
+    _checkpointer = checkpointer
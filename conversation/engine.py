@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import uuid
+
+from conversation.graph import get_compiled_graph, get_llm, initial_state
+from conversation.memory import ConversationMemory
+from conversation.session_io import QueueSessionIO, RecordingSessionIO
+
+logger = logging.getLogger(__name__)
+
+# Conversations loop through detect_intent / ask_* many times; LangGraph's
+# default recursion limit (25 steps) would cut long sessions short.
+RECURSION_LIMIT = 10_000
+
+
+class Session:
+    """
+    One running conversation: its IO, memory, graph task, where it currently
+    is, and the signed-in customer (username), if known.
+    """
+
+    __slots__ = ("session_id", "io", "memory", "task", "current_node", "customer")
+
+    def __init__(self, session_id, io, memory, customer=None):
+        self.session_id = session_id
+        self.io = io
+        self.memory = memory
+        self.customer = customer
+        self.task = None
+        self.current_node = None
+
+
+class ConversationEngine:
+    """
+    Runs many independent conversations on one asyncio event loop.
+
+    Each session gets its own AgentState and SessionIO; the compiled graph is
+    shared. Sessions waiting for user input cost one suspended task each, so a
+    single process can hold thousands of them.
+
+    When the graph has a checkpointer, a session's state is checkpointed
+    after every step under its session id. A session that was stopped (its
+    task cancelled, the process restarted) can be resumed by any engine
+    sharing the checkpointer; it continues at the step it was waiting in,
+    with the conversation memory it had at its last step.
+    Sessions that end normally delete their checkpoints.
+    """
+
+    def __init__(self, compiled_graph=None, memory_llm=None):
+        self.graph = compiled_graph or get_compiled_graph()
+        # Summarizes older turns of each session's memory in the background
+        self.memory_llm = memory_llm or get_llm()
+        self.sessions = {}
+
+    def _new_session(self, session_id, io, customer=None):
+        return Session(session_id, io, ConversationMemory(llm=self.memory_llm), customer)
+
+    def _config(self, session):
+        # Nodes talk through a recording IO, so every turn lands in the memory
+        return {
+            "configurable": {
+                "thread_id": session.session_id,
+                "io": RecordingSessionIO(session.io, session.memory),
+                "memory": session.memory,
+                "session_id": session.session_id,
+                "customer": session.customer,
+            },
+            "recursion_limit": RECURSION_LIMIT,
+        }
+
+    async def run(self, io, session_id=None, customer=None):
+        """
+        Run one conversation to completion over the given SessionIO. With a
+        customer (username), order lookups only search that customer's orders.
+        A stopped session with this session_id is resumed instead.
+        """
+        resume = False
+        if session_id:
+            metadata = await self.checkpointed_session(session_id)
+            if metadata is not None:
+                if customer and customer != metadata.get("customer"):
+                    raise ValueError(f"Session {session_id} belongs to another customer")
+                resume = True
+                customer = metadata.get("customer")
+        session = self._new_session(session_id or uuid.uuid4().hex, io, customer)
+        await self._run_session(session, resume)
+
+    async def _run_session(self, session, resume=False):
+        # Fresh state per session. Resuming continues from the session's last
+        # checkpoint instead, with the memory it had checkpointed.
+        state = None if resume else dict(initial_state)
+        try:
+            if resume:
+                snapshot = await self.graph.aget_state(
+                    {"configurable": {"thread_id": session.session_id}}
+                )
+                session.memory.restore(snapshot.values.get("chat_history"))
+            async for update in self.graph.astream(
+                state, self._config(session), stream_mode="updates"
+            ):
+                session.current_node = next(iter(update), None)
+        except asyncio.CancelledError:
+            # Stopped, not finished: the checkpoint is kept for resume()
+            raise
+        except Exception as e:
+            logger.exception("Session %s failed: %s", session.session_id, e)
+            await self._discard_checkpoints(session.session_id)
+        else:
+            await self._discard_checkpoints(session.session_id)
+        finally:
+            session.memory.close()
+            await session.io.close()
+
+    async def _discard_checkpoints(self, session_id):
+        if self.graph.checkpointer is not None:
+            await self.graph.checkpointer.adelete_thread(session_id)
+
+    async def checkpointed_session(self, session_id):
+        """
+        The checkpoint metadata of a stopped session that can be resumed, or
+        None (no checkpointer, unknown session, or the session finished).
+        """
+        if self.graph.checkpointer is None:
+            return None
+        snapshot = await self.graph.aget_state({"configurable": {"thread_id": session_id}})
+        if not snapshot.next:
+            return None
+        return snapshot.metadata or {}
+
+    def start_session(self, session_id=None, io=None, customer=None):
+        """
+        Start a conversation in the background and return its Session.
+        Without an explicit io, the session gets a QueueSessionIO.
+        """
+        return self._start(session_id or uuid.uuid4().hex, io, customer)
+
+    def _start(self, session_id, io=None, customer=None, resume=False):
+        if session_id in self.sessions:
+            raise ValueError(f"Session {session_id} already exists")
+        session = self._new_session(session_id, io or QueueSessionIO(), customer)
+        session.task = asyncio.create_task(self._run_session(session, resume))
+        self.sessions[session_id] = session
+        session.task.add_done_callback(lambda _: self.sessions.pop(session_id, None))
+        return session
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise KeyError(f"Unknown or finished session {session_id}")
+        return session
+
+    async def resume(self, session_id, io=None):
+        """
+        Continue a stopped session from its checkpoint, for the customer it
+        was started for, and return its Session. The step it was waiting in
+        runs again, so the user is asked their last question again.
+        Raises KeyError when there is nothing to resume.
+        """
+        metadata = await self.checkpointed_session(session_id)
+        if metadata is None:
+            raise KeyError(f"Unknown or finished session {session_id}")
+        logger.debug("Resuming session %s at step %s", session_id, metadata.get("step"))
+        return self._start(session_id, io, metadata.get("customer"), resume=True)
+
+    async def live_session(self, session_id):
+        """A running session, resuming it from its checkpoint if it is not running here."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = await self.resume(session_id)
+            # The client has already seen the question being asked again
+            await session.io.read_turn()
+        return session
+
+    async def open(self, session_id=None, customer=None):
+        """Start a QueueSessionIO session and return (session_id, greeting messages)."""
+        session = self.start_session(session_id, customer=customer)
+        messages, _ = await session.io.read_turn()
+        return session.session_id, messages
+
+    async def send(self, session_id, text):
+        """
+        Deliver one user message and wait for the agent's reply.
+        Returns (messages, ended). A session that is not running here is
+        resumed from its checkpoint first.
+        """
+        session = await self.live_session(session_id)
+        await session.io.put_input(text)
+        return await session.io.read_turn()
+
+    async def open_stream(self, session_id=None, customer=None):
+        """
+        Start a session and return (session_id, events), where events is an
+        async iterator over the greeting turn's (event, payload) tuples.
+        """
+        session = self.start_session(session_id, customer=customer)
+        return session.session_id, session.io.stream_turn()
+
+    async def send_stream(self, session_id, text):
+        """
+        Deliver one user message and yield the agent's reply as (event, payload)
+        tuples, including CHUNK events for streamed LLM tokens. A session
+        that is not running here is resumed from its checkpoint first.
+        """
+        session = await self.live_session(session_id)
+        await session.io.put_input(text)
+        async for event in session.io.stream_turn():
+            yield event
+
+    async def close_session(self, session_id, discard=False):
+        """
+        Stop a session early (e.g. the client disconnected). Its checkpoint
+        is kept so it can be resumed, unless discard is set.
+        """
+        session = self.sessions.pop(session_id, None)
+        if session and session.task and not session.task.done():
+            session.task.cancel()
+            try:
+                await session.task
+            except asyncio.CancelledError:
+                pass
+        if discard:
+            await self._discard_checkpoints(session_id)
+
+    def active_sessions(self):
+        return len(self.sessions)
+
+    def checkpoint_stats(self):
+        """The checkpointer's backend and write counters, or None without one."""
+        checkpointer = self.graph.checkpointer
+        if checkpointer is None:
+            return None
+        return {"backend": type(checkpointer).__name__, **getattr(checkpointer, "stats", {})}
+
+    def memory_stats(self):
+        """Conversation memory across active sessions, for sizing hosts."""
+        sizes = [session.memory.stats() for session in list(self.sessions.values())]
+        total_bytes = sum(s["bytes"] for s in sizes)
+        return {
+            "sessions": len(sizes),
+            "total_bytes": total_bytes,
+            "max_bytes": max((s["bytes"] for s in sizes), default=0),
+            "mean_bytes": round(total_bytes / len(sizes)) if sizes else 0,
+            "max_prompt_tokens": max(
+                (s["recent_tokens"] + s["summary_tokens"] for s in sizes), default=0
+            ),
+            "summarizations": sum(s["summarizations"] for s in sizes),
+        }
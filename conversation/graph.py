@@ -0,0 +1,539 @@
+import asyncio
+import inspect
+import logging
+import threading
+from typing import TYPE_CHECKING, TypedDict, Optional, List, Annotated, NotRequired
+from dotenv import load_dotenv
+from datetime import datetime, timedelta
+
+
+from rag.order_records import OrderRecord, parse_order_record
+from rag.retriever import get_order_record, query_customer_orders, query_order_info
+from tools.eligibility_fast_path import is_clear_cut, record_decision_path, render_decision
+from tools.return_policy_engine import EligibilityDecision, get_policy_engine
+from tools.return_policy_tool import (
+    evaluate_order,
+    fetch_return_policy,
+    return_policy_for_order,
+)
+from conversation.intent import (
+    EXIT,
+    ORDER_LOOKUP,
+    POLICY_QUESTION,
+    RETURN,
+    SMALL_TALK,
+    classify_intent,
+)
+from conversation.memory import ConversationMemory
+from conversation.response_cache import get_response_cache, response_cache_key
+from conversation.session_io import SessionIO
+from observability.metrics import instrument_node
+
+if TYPE_CHECKING:
+    # Nodes annotate config as "RunnableConfig", which LangGraph recognizes by
+    # name; langchain_core is only imported once the graph is built.
+    from langchain_core.runnables import RunnableConfig
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# ── 1. LLM ───────────────────────────────────
+# The client and the compiled graph are built on first use (or by
+# service/warmup.py), so importing this module stays cheap.
+ELIGIBILITY_MODEL = "gpt-4.1-nano"
+
+_llm = None
+_compiled_graph = None
+_llm_lock = threading.Lock()
+_graph_lock = threading.Lock()
+
+
+def get_llm():
+    """Returns the shared chat model, creating the OpenAI client on first use."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                from clients.provider import get_chat_model
+
+                _llm = get_chat_model(ELIGIBILITY_MODEL)
+    return _llm
+
+ELIGIBILITY_PROMPT = """
+            You are a helpful Amazon return assistant.
+            Order Info: {order_info}
+            Return Policy: {policy_text}
+            Current Date: {current_date}
+            Conversation so far: {chat_history}
+
+            Check if the order is eligible for return based on the return policy and the current date.
+            If so, explain how to initiate the return. If not, explain why it's not eligible.
+            Be specific about the time window for returns and whether the current date falls within that window.
+            """
+
+
+# ── 2. State Schema ────────────────────────────
+class AgentState(TypedDict, total=False):
+    user_input: Optional[str]
+    order_number: Optional[str]
+    order_info: Optional[str]
+    order_record: Optional[OrderRecord]
+    policy_text: Optional[str]
+    return_policy: Optional[str]
+    eligibility: Optional[EligibilityDecision]
+    # ConversationMemory.snapshot() after the last step, so a resumed session
+    # gets its summary and recent turns back
+    chat_history: Optional[dict]
+    retry_count: int
+    conversation_should_end: NotRequired[bool]
+    __next__: NotRequired[str]
+
+
+initial_state: AgentState = {
+    "chat_history": None,
+    "retry_count": 0,
+}
+
+
+# ── 3. Helper functions ─────────────────────────
+def get_current_date() -> str:
+    """
+    Returns the current date in a human-readable format.
+    """
+    current_date = datetime.now()
+    return current_date.strftime("%Y-%m-%d")
+
+
+def eligibility_cache_key(order, current_date):
+    """Response-cache key of an eligibility answer; order is a record or its text."""
+    return response_cache_key(
+        ELIGIBILITY_MODEL,
+        ELIGIBILITY_PROMPT,
+        order,
+        get_policy_engine().current_version(),
+        current_date,
+    )
+
+
+def eligibility_messages(order_info, policy_text, current_date, chat_history=""):
+    """ELIGIBILITY_PROMPT filled in, as chat messages for the LLM."""
+    from langchain_core.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate.from_template(ELIGIBILITY_PROMPT).format_messages(
+        order_info=order_info,
+        policy_text=policy_text,
+        current_date=current_date,
+        chat_history=chat_history or "(none)",
+    )
+
+
+def order_text(state: AgentState) -> str:
+    """
+    The order's text. Orders found in the record store are only referenced
+    by their record in the state, so their text is looked up again.
+    """
+    if state.get("order_info"):
+        return state["order_info"]
+    record = state.get("order_record")
+    docs = query_order_info(record.order_number) if record else []
+    return docs[0].page_content if docs else "No order information available."
+
+
+def policy_text(state: AgentState) -> str:
+    """The return policy that applies to the state's order."""
+    if state.get("return_policy"):
+        return state["return_policy"]
+    record = state.get("order_record")
+    return return_policy_for_order(record) if record else "Standard return policy applies."
+
+
+def session_io(config: "RunnableConfig") -> SessionIO:
+    """The SessionIO of the session a node is running for."""
+    return config["configurable"]["io"]
+
+
+def session_customer(config: "RunnableConfig") -> Optional[str]:
+    """The username of the signed-in customer, if the session has one."""
+    return config["configurable"].get("customer")
+
+
+def session_memory(config: "RunnableConfig") -> Optional[ConversationMemory]:
+    """The session's ConversationMemory, if the engine gave it one."""
+    return config["configurable"].get("memory")
+
+
+# ── 4. Node functions ──────────────────────────
+# Nodes talk to the user only through the session's SessionIO, so one event
+# loop can run many conversations at once.
+async def greet(state: AgentState, config: "RunnableConfig") -> AgentState:
+    io = session_io(config)
+    await io.send("Hi! How can I help you today?")
+    return {"user_input": await io.receive()}
+
+
+async def detect_intent(state: AgentState, config: "RunnableConfig") -> AgentState:
+    io = session_io(config)
+    # Local rules and classifier; routing never waits on the LLM
+    intent = classify_intent(state["user_input"])
+    logger.debug("Intent %s (%.2f, %s)", intent.intent, intent.confidence, intent.source)
+
+    if intent.intent == EXIT:
+        await io.send("Thanks for chatting. Have a great day!")
+        return {"__next__": "end"}
+    if intent.order_number:
+        return {"order_number": intent.order_number, "__next__": "retrieve_order"}
+    if intent.intent in (RETURN, ORDER_LOOKUP):
+        return {"__next__": "ask_order_number"}
+    if intent.intent == POLICY_QUESTION:
+        return {"__next__": "answer_policy_question"}
+
+    # Small talk or unclear → ask again
+    if intent.intent == SMALL_TALK:
+        await io.send(
+            "I can help you return an item or answer questions about the return policy. "
+            "How can I help you?"
+        )
+    else:
+        await io.send("How can I help you?")
+    user_input = await io.receive()
+
+    # Check again if the user wants to exit after the follow-up question
+    if classify_intent(user_input).intent == EXIT:
+        await io.send("Thanks for chatting. Have a great day!")
+        return {"__next__": "end"}
+
+    return {"user_input": user_input, "__next__": "detect_intent"}
+
+
+async def ask_order_number(state: AgentState, config: "RunnableConfig") -> AgentState:
+    io = session_io(config)
+    tries = state.get("retry_count", 0)
+    if tries >= 3:
+        await io.send("I wasn't able to get a valid order number after 3 tries.")
+        await io.send("Is there anything else I can help you with?")
+        user_input = await io.receive()
+        if classify_intent(user_input).intent == EXIT:
+            await io.send("Thanks for chatting. Have a great day!")
+            return {"__next__": "end"}
+        return {"user_input": user_input, "__next__": "detect_intent"}
+
+    await io.send("Could you please provide your order number?")
+    user_input = await io.receive()
+
+    # Exit handling
+    intent = classify_intent(user_input)
+    if intent.intent == EXIT:
+        await io.send("Thanks for chatting. Have a great day!")
+        return {"__next__": "end"}
+
+    # Extract order number
+    order_number = intent.order_number
+    if order_number:
+        return {
+            "order_number": order_number,
+            "retry_count": 0,
+            "__next__": "retrieve_order",
+        }
+
+    await io.send("I can't help without a valid order number. Could you provide one?")
+    return {"retry_count": tries + 1, "__next__": "ask_order_number"}
+
+
+async def retrieve_order(state: AgentState, config: "RunnableConfig") -> AgentState:
+    io = session_io(config)
+    try:
+        # Get the order number safely
+        order_number = state.get("order_number", "")
+        if not order_number:
+            return {"__next__": "ask_order_number"}
+
+        logger.debug("Searching for order %s", order_number)
+
+        # A signed-in customer's lookup only searches their own orders, so
+        # another customer's order can never come back. Blocking I/O runs
+        # off the event loop.
+        customer = session_customer(config)
+        if customer:
+            docs = await asyncio.to_thread(query_customer_orders, customer, order_number)
+        else:
+            docs = await asyncio.to_thread(query_order_info, order_number)
+
+        # No results found
+        if not docs:
+            await io.send("Sorry, I couldn't find an order with that number.")
+            await io.send("Please provide a valid order number.")
+            # CRITICAL FIX: Return to ask_order_number state
+            # Clear the order_number so we don't get stuck in a loop
+            return {"order_number": None, "__next__": "ask_order_number"}
+
+        # Get the first result
+        order_content = docs[0].page_content
+
+        # Typed fields were parsed once at ingest; stores built before the
+        # record columns existed fall back to parsing the retrieved text.
+        stored = get_order_record(order_number)
+        record = stored or parse_order_record(order_content)
+
+        # Only proceed if the retrieved order number matches the requested one
+        if record and record.order_number == order_number:
+            delivery_date_str = (
+                record.delivery_date.isoformat() if record.delivery_date else "Not specified"
+            )
+            await io.send(
+                f"I found your order #{record.order_number} (Delivery date: {delivery_date_str}):\n"
+                f"{order_content}"
+            )
+
+            # If delivery date is missing, add a note
+            if not record.delivery_date:
+                await io.send(
+                    "Note: This order doesn't specify a delivery date, which may affect return eligibility."
+                )
+
+            # A stored record is kept by reference: checkpoints hold the typed
+            # record, and order_text() reads the text again if it is needed
+            return {
+                "order_info": None if stored else order_content,
+                "order_record": record,
+                "__next__": "fetch_policy",
+            }
+
+        # If order numbers don't match, reject it and ask again
+        await io.send(f"Sorry, I couldn't find order number {order_number}.")
+        await io.send("Please provide a valid order number.")
+        # CRITICAL FIX: Return to ask_order_number state and clear the invalid order number
+        return {"order_number": None, "__next__": "ask_order_number"}
+
+    except Exception as e:
+        await io.send(f"I encountered an error looking up your order: {str(e)}")
+        await io.send("Let me try again. Please provide your order number.")
+        # CRITICAL FIX: Make sure we return to ask_order_number on any exception
+        return {"order_number": None, "__next__": "ask_order_number"}
+
+
+async def fetch_policy(state: AgentState) -> AgentState:
+    """Fetch the return policy and check eligibility based on delivery date."""
+    logger.debug("Checking return policy")
+
+    # The typed record carries the delivery date, so no text needs re-parsing.
+    # Its policy text is derived again by policy_text() when the LLM needs it,
+    # so only the decision is kept in the state.
+    record = state.get("order_record")
+    decision = None
+    policy = None
+    if record:
+        logger.debug("Passing delivery date to tool: %s", record.delivery_date)
+        decision = evaluate_order(record)
+    else:
+        policy = fetch_return_policy(state.get("order_info") or "")
+
+    return {
+        "return_policy": policy,
+        "eligibility": decision,
+        "__next__": "assess_eligibility",
+    }
+
+
+async def check_eligibility(state: AgentState, config: "RunnableConfig") -> AgentState:
+    io = session_io(config)
+    try:
+        current_date = get_current_date()
+
+        # Clear-cut decisions are answered from the computed result; the LLM
+        # only handles ambiguous cases (missing date, unknown category, special
+        # or non-returnable policy classes).
+        decision = state.get("eligibility")
+        record = state.get("order_record")
+        if is_clear_cut(decision, record):
+            record_decision_path("fast_path")
+            await io.send(render_decision(decision, record))
+            return {"__next__": "ask_continue_route"}
+
+        # Repeat questions about the same order on the same day are answered
+        # from the response cache without spending tokens.
+        cache = get_response_cache()
+        cache_key = None
+        if cache is not None:
+            order = record or await asyncio.to_thread(order_text, state)
+            cache_key = eligibility_cache_key(order, current_date)
+            # The SQLite backend reads a file; keep it off the event loop
+            cached = await asyncio.to_thread(cache.get, cache_key)
+            if cached is not None:
+                record_decision_path("cached")
+                await io.send(cached)
+                return {"__next__": "ask_continue_route"}
+        record_decision_path("llm_path")
+
+        # Bounded history (recent turns plus a summary), so the prompt does not
+        # grow with the session. It is context only and not part of the cache
+        # key: the decision depends on the order, policy and date.
+        memory = session_memory(config)
+        order_info = await asyncio.to_thread(order_text, state)
+        formatted_prompt = eligibility_messages(
+            order_info, policy_text(state), current_date, memory.as_text() if memory else ""
+        )
+
+        # Stream tokens to the user as the LLM produces them
+        async def tokens():
+            async for chunk in get_llm().astream(formatted_prompt):
+                if chunk.content:
+                    yield chunk.content
+
+        response = await io.send_stream(tokens())
+        if cache_key is not None and response:
+            await asyncio.to_thread(cache.put, cache_key, response)
+
+        return {"__next__": "ask_continue_route"}
+
+    except Exception as e:
+        await io.send(f"I'm sorry, I encountered an error: {str(e)}")
+        return {"__next__": "ask_continue_route"}
+
+
+async def answer_policy_question(state: AgentState, config: "RunnableConfig") -> AgentState:
+    """Answers a general policy question with the policy passages it concerns."""
+    io = session_io(config)
+    excerpt = get_policy_engine().sections.context(state.get("user_input") or "")
+    await io.send(f"Here is what our return policy says:\n{excerpt}")
+    return {"__next__": "ask_continue_route"}
+
+
+async def ask_if_wants_to_continue(state: AgentState, config: "RunnableConfig") -> AgentState:
+    """Asks the user if they want to continue or end the conversation."""
+    io = session_io(config)
+    await io.send("Is there anything else I can help you with today?")
+    user_response = await io.receive()
+
+    # A bare "ok" or "no" here means the user is done
+    if classify_intent(user_response, closing=True).intent == EXIT:
+        await io.send("Thanks for chatting. Have a great day!")
+        return {
+            "user_input": user_response,
+            "__next__": "end",
+            "conversation_should_end": True,
+        }
+    else:
+        return {"user_input": user_response, "__next__": "detect_intent_route"}
+
+
+async def end_conv(state: AgentState) -> AgentState:
+    # No need to send a goodbye message here since we do it before transitioning
+    return {"conversation_should_end": True}
+
+
+# ── 5. Build LangGraph ─────────────────────────
+def remember_turns(fn):
+    """
+    Wraps a node so its update also carries the session memory as
+    chat_history whenever the node changed it. The memory is then
+    checkpointed with the step and restored when the session resumes.
+    """
+    takes_config = "config" in inspect.signature(fn).parameters
+
+    async def node(state: AgentState, config: "RunnableConfig") -> AgentState:
+        update = await (fn(state, config) if takes_config else fn(state))
+        memory = session_memory(config)
+        if memory is not None:
+            turns = memory.snapshot()
+            if turns != state.get("chat_history"):
+                update = {**(update or {}), "chat_history": turns}
+        return update
+
+    node.__name__ = fn.__name__
+    node.__doc__ = fn.__doc__
+    return node
+
+
+def build_graph():
+    """The conversation's StateGraph (uncompiled)."""
+    from langgraph.graph import StateGraph, END
+
+    graph = StateGraph(AgentState)
+    for n, fn in {
+        "greet": greet,
+        "detect_intent": detect_intent,
+        "ask_order_number": ask_order_number,
+        "retrieve_order": retrieve_order,
+        "fetch_policy": fetch_policy,
+        "check_eligibility": check_eligibility,
+        "answer_policy_question": answer_policy_question,
+        "ask_if_wants_to_continue": ask_if_wants_to_continue,
+        "end": end_conv,
+    }.items():
+        graph.add_node(n, instrument_node(n, remember_turns(fn)))
+
+    # Make sure all edges are properly defined
+    graph.set_entry_point("greet")
+    graph.add_edge("greet", "detect_intent")
+
+    # Fix conditional edges
+    graph.add_conditional_edges(
+        "detect_intent",
+        lambda x: x.get("__next__", "detect_intent"),
+        {
+            "ask_order_number": "ask_order_number",
+            "retrieve_order": "retrieve_order",
+            "answer_policy_question": "answer_policy_question",
+            "detect_intent": "detect_intent",
+            "end": "end",
+        },
+    )
+
+    graph.add_conditional_edges(
+        "ask_order_number",
+        lambda x: x.get("__next__", "ask_order_number"),
+        {
+            "retrieve_order": "retrieve_order",
+            "ask_order_number": "ask_order_number",
+            "end": "end",
+            "detect_intent": "detect_intent",
+        },
+    )
+
+    # CRITICAL FIX: Make retrieve_order -> fetch_policy a conditional edge
+    graph.add_conditional_edges(
+        "retrieve_order",
+        lambda x: x.get("__next__", "ask_order_number"),  # Default to ask_order_number
+        {
+            "fetch_policy": "fetch_policy",  # Only if valid order found
+            "ask_order_number": "ask_order_number",  # If no valid order
+        },
+    )
+
+    graph.add_edge("fetch_policy", "check_eligibility")
+
+    graph.add_conditional_edges(
+        "answer_policy_question",
+        lambda x: x.get("__next__"),
+        {"ask_continue_route": "ask_if_wants_to_continue"},
+    )
+
+    graph.add_conditional_edges(
+        "check_eligibility",
+        lambda x: x.get("__next__"),
+        {"ask_continue_route": "ask_if_wants_to_continue"},
+    )
+
+    graph.add_conditional_edges(
+        "ask_if_wants_to_continue",
+        lambda x: x.get("__next__"),
+        {"detect_intent_route": "detect_intent", "end": "end"},
+    )
+
+    graph.add_edge("end", END)
+    return graph
+
+
+def get_compiled_graph():
+    """Returns the shared compiled graph, building it on first use."""
+    global _compiled_graph
+    if _compiled_graph is None:
+        with _graph_lock:
+            if _compiled_graph is None:
+                from conversation.checkpoint import get_checkpointer
+
+                # Each step's state is checkpointed per session (thread_id), so
+                # any worker sharing the checkpointer can resume the session
+                _compiled_graph = build_graph().compile(checkpointer=get_checkpointer())
+    return _compiled_graph
@@ -0,0 +1,309 @@
+import glob
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import NamedTuple, Optional
+
+# Routing intents the graph understands
+EXIT = "exit"
+RETURN = "return"
+ORDER_LOOKUP = "order_lookup"
+POLICY_QUESTION = "policy_question"
+SMALL_TALK = "small_talk"
+UNKNOWN = "unknown"
+INTENTS = (EXIT, RETURN, ORDER_LOOKUP, POLICY_QUESTION, SMALL_TALK, UNKNOWN)
+
+# "hybrid" (rules, then the classifier for what they cannot settle),
+# "rules" or "classifier"
+INTENT_ENGINE = os.getenv("INTENT_ENGINE", "hybrid")
+# Below this probability the classifier answers UNKNOWN and the user is asked again
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.5"))
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), "..", "conversation_examples")
+
+ORDER_NUMBER = re.compile(r"(?<!\d)\d{6,}(?!\d)")
+
+# Precompiled word-boundary matchers. "Strong" patterns decide on their own;
+# weak exits ("thanks", "no", "nothing", "end") only count when they are the
+# whole message, so "no, I want to return another item" is still a return.
+_PATTERNS = {
+    EXIT: re.compile(
+        r"\b(bye|goodbye|good bye|exit|quit|that'?s (all|it)|i'?m done|im done|"
+        r"nothing else|end (the )?chat|stop)\b"
+    ),
+    RETURN: re.compile(
+        r"\b(return(ing|ed)?|send (it|this|them) back|refund|exchange|another (one|item|order)|"
+        r"(second|another|one more) (item|order|product|return))\b"
+    ),
+    POLICY_QUESTION: re.compile(
+        r"\b(polic(y|ies)|window|how (long|many days)|deadline|eligib(le|ility)|"
+        r"non-?returnable|restocking|allowed to return|can i (still )?return|"
+        r"is it too late|what items|which items)\b"
+    ),
+    SMALL_TALK: re.compile(
+        r"^\W*(hi|hello|hey|hiya|good (morning|afternoon|evening)|how are you|"
+        r"what'?s up|who are you|what can you do)\b"
+    ),
+}
+# Polite closers that only mean "exit" when they are the whole message;
+# inside a longer one ("no idea where my order is", "an end table") they do not
+_WEAK_EXIT = re.compile(
+    r"\W*(thanks?|thank you|thx|no|nope|nah|no thanks|nothing|end)"
+    r"(\W+(thanks?|thank you|thx|no|nope|nah|nothing|end))*\W*"
+)
+# Bare acknowledgements: after "anything else?" they close the conversation
+_ACKNOWLEDGEMENT = re.compile(
+    r"^\W*(ok(ay)?|k|sure|fine|alright|all good|cool|got it|great|perfect)\W*$"
+)
+_TOKEN = re.compile(r"[a-z']+|\d+")
+
+# Seed utterances for the classifier, alongside the user turns of
+# conversation_examples/. Kept small and close to the traffic the agent sees.
+SEED_EXAMPLES = (
+    ("hi", SMALL_TALK),
+    ("hello there", SMALL_TALK),
+    ("hey, how are you", SMALL_TALK),
+    ("good morning", SMALL_TALK),
+    ("what can you help me with", SMALL_TALK),
+    ("can you help me", SMALL_TALK),
+    ("I need some help", SMALL_TALK),
+    ("are you a bot", SMALL_TALK),
+    ("I want to return my item", RETURN),
+    ("I'd like to send back the shoes I bought", RETURN),
+    ("start a return for my order", RETURN),
+    ("I need a refund for my headphones", RETURN),
+    ("the blender arrived broken and I want my money back", RETURN),
+    ("can I get my money back", RETURN),
+    ("I want to exchange a product", RETURN),
+    ("I have another item to return", RETURN),
+    ("one more order please", RETURN),
+    ("it doesn't fit, I want to give it back", RETURN),
+    ("where is my order", ORDER_LOOKUP),
+    ("look up my order", ORDER_LOOKUP),
+    ("check the status of my order", ORDER_LOOKUP),
+    ("the order number is", ORDER_LOOKUP),
+    ("my order number", ORDER_LOOKUP),
+    ("find my purchase", ORDER_LOOKUP),
+    ("what is your return policy", POLICY_QUESTION),
+    ("how long do I have to return something", POLICY_QUESTION),
+    ("how many days is the return window", POLICY_QUESTION),
+    ("can I return electronics after 30 days", POLICY_QUESTION),
+    ("are groceries returnable", POLICY_QUESTION),
+    ("do you accept returns on opened items", POLICY_QUESTION),
+    ("what items can't be returned", POLICY_QUESTION),
+    ("is there a fee for returns", POLICY_QUESTION),
+    ("do I have to pay for return shipping", POLICY_QUESTION),
+    ("what is the deadline for returning a phone", POLICY_QUESTION),
+    ("bye", EXIT),
+    ("no thanks, that's all", EXIT),
+    ("nothing else, thank you", EXIT),
+    ("I'm done", EXIT),
+    ("no that's it", EXIT),
+    ("thanks for your help", EXIT),
+    ("have a nice day", EXIT),
+    ("see you", EXIT),
+    ("I don't know", UNKNOWN),
+    ("I forgot", UNKNOWN),
+    ("I don't remember", UNKNOWN),
+    ("not sure", UNKNOWN),
+    ("where do I find it", UNKNOWN),
+    ("asdf", UNKNOWN),
+)
+
+# How the agent answered a user turn in conversation_examples/ tells what the
+# turn was understood as.
+_EXAMPLE_LABELS = (
+    ("Thanks for chatting", EXIT),
+    ("provide your order number", RETURN),
+    ("I found your order", ORDER_LOOKUP),
+    ("can't find an order", ORDER_LOOKUP),
+    ("How can I help you", SMALL_TALK),
+    ("can't help without a valid order number", UNKNOWN),
+)
+
+
+class IntentResult(NamedTuple):
+    intent: str
+    confidence: float
+    order_number: Optional[str]
+    source: str  # "rules" or "classifier"
+
+
+def normalize(text):
+    return (text or "").lower().replace("’", "'").strip()
+
+
+def features(text):
+    """Unigrams and bigrams, with numbers collapsed to one order-number token."""
+    tokens = [
+        "<order_number>" if token.isdigit() and len(token) >= 6 else token
+        for token in _TOKEN.findall(normalize(text))
+    ]
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def load_examples(examples_dir=EXAMPLES_DIR):
+    """(user text, intent) pairs from the "You:"/"Agent:" transcripts."""
+    examples = []
+    for path in sorted(glob.glob(os.path.join(examples_dir, "*.md"))):
+        with open(path, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        for turn, reply in zip(lines, lines[1:]):
+            if not (turn.startswith("You:") and reply.startswith("Agent:")):
+                continue
+            label = next((intent for marker, intent in _EXAMPLE_LABELS if marker in reply), None)
+            if label is not None:
+                examples.append((turn[len("You:"):].strip(), label))
+    return examples
+
+
+class NaiveBayesIntentClassifier:
+    """
+    Multinomial naive Bayes over word unigrams and bigrams. Training is a few
+    hundred dictionary updates; classifying is one lookup per feature.
+    """
+
+    def __init__(self, examples, alpha=0.5):
+        counts = {}
+        docs = Counter()
+        for text, intent in examples:
+            counts.setdefault(intent, Counter()).update(features(text))
+            docs[intent] += 1
+        vocabulary = set().union(*counts.values()) if counts else set()
+        self.labels = sorted(counts)
+        self.log_prior = {label: math.log(docs[label] / sum(docs.values())) for label in self.labels}
+        self.log_likelihood = {}
+        self.log_unseen = {}
+        for label in self.labels:
+            total = sum(counts[label].values()) + alpha * (len(vocabulary) + 1)
+            self.log_likelihood[label] = {
+                feature: math.log((count + alpha) / total) for feature, count in counts[label].items()
+            }
+            self.log_unseen[label] = math.log(alpha / total)
+        self.vocabulary = vocabulary
+
+    def predict(self, text, candidates=None):
+        """(intent, probability), optionally restricted to candidate intents."""
+        feats = [f for f in features(text) if f in self.vocabulary]
+        labels = [label for label in self.labels if candidates is None or label in candidates]
+        if not labels:
+            return UNKNOWN, 0.0
+        scores = {}
+        for label in labels:
+            likelihood = self.log_likelihood[label]
+            unseen = self.log_unseen[label]
+            scores[label] = self.log_prior[label] + sum(likelihood.get(f, unseen) for f in feats)
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        total = sum(math.exp(score - top) for score in scores.values())
+        return best, 1.0 / total
+
+
+class IntentEngine:
+    """Interface for intent engines: classify one user message."""
+
+    def classify(self, text, closing=False):
+        """
+        Returns an IntentResult. closing=True when the agent has just asked
+        whether there is anything else, so a bare "ok" or "no" ends the chat.
+        """
+        raise NotImplementedError
+
+
+class RuleIntentEngine(IntentEngine):
+    """Word-boundary rules only; messages they cannot place are UNKNOWN."""
+
+    def candidates(self, text):
+        """Intents whose rules match, strongest first, plus any order number."""
+        order = ORDER_NUMBER.search(text)
+        if order:
+            return [ORDER_LOOKUP], order.group(0)
+        matched = [intent for intent, pattern in _PATTERNS.items() if pattern.search(text)]
+        if not matched and _WEAK_EXIT.fullmatch(text):
+            matched = [EXIT]
+        return matched, None
+
+    def classify(self, text, closing=False):
+        text = normalize(text)
+        if closing and (_ACKNOWLEDGEMENT.match(text) or _WEAK_EXIT.fullmatch(text)):
+            return IntentResult(EXIT, 1.0, None, "rules")
+        matched, order_number = self.candidates(text)
+        if len(matched) == 1:
+            return IntentResult(matched[0], 1.0, order_number, "rules")
+        if _ACKNOWLEDGEMENT.match(text):
+            return IntentResult(SMALL_TALK, 1.0, None, "rules")
+        return IntentResult(UNKNOWN, 0.0, None, "rules")
+
+
+class ClassifierIntentEngine(IntentEngine):
+    """The trained classifier only (order numbers are still extracted by pattern)."""
+
+    def __init__(self, classifier=None, min_confidence=INTENT_MIN_CONFIDENCE):
+        self.classifier = classifier or train_classifier()
+        self.min_confidence = min_confidence
+
+    def _predict(self, text, candidates=None):
+        intent, confidence = self.classifier.predict(text, candidates)
+        if confidence < self.min_confidence:
+            intent = UNKNOWN
+        order = ORDER_NUMBER.search(text)
+        if order and intent in (ORDER_LOOKUP, RETURN, UNKNOWN):
+            return IntentResult(ORDER_LOOKUP, confidence, order.group(0), "classifier")
+        return IntentResult(intent, confidence, None, "classifier")
+
+    def classify(self, text, closing=False):
+        return self._predict(normalize(text))
+
+
+class HybridIntentEngine(ClassifierIntentEngine):
+    """
+    Rules first. When several rules match, the classifier picks among them;
+    when none does, it classifies the message on its own.
+    """
+
+    def __init__(self, classifier=None, min_confidence=INTENT_MIN_CONFIDENCE):
+        super().__init__(classifier, min_confidence)
+        self.rules = RuleIntentEngine()
+
+    def classify(self, text, closing=False):
+        result = self.rules.classify(text, closing)
+        if result.intent != UNKNOWN:
+            return result
+        text = normalize(text)
+        matched, _ = self.rules.candidates(text)
+        return self._predict(text, set(matched) if matched else None)
+
+
+def train_classifier(examples_dir=EXAMPLES_DIR):
+    return NaiveBayesIntentClassifier(list(SEED_EXAMPLES) + load_examples(examples_dir))
+
+
+ENGINES = {
+    "hybrid": HybridIntentEngine,
+    "rules": RuleIntentEngine,
+    "classifier": ClassifierIntentEngine,
+}
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_intent_engine():
+    """Returns the process-wide intent engine (INTENT_ENGINE), trained on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ENGINES[INTENT_ENGINE]()
+    return _engine
+
+
+def set_intent_engine(engine):
+    """Install a custom IntentEngine (or None to go back to INTENT_ENGINE)."""
+    global _engine
+    _engine = engine
+
+
+def classify_intent(text, closing=False):
+    return get_intent_engine().classify(text, closing)
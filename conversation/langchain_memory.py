@@ -0,0 +1,32 @@
+from typing import Any, Dict, List
+
+from langchain_core.memory import BaseMemory
+
+# Kept apart from conversation/memory.py so the engine, which uses
+# ConversationMemory directly, does not import LangChain's memory classes.
+
+
+class BoundedChatMemory(BaseMemory):
+    """LangChain memory adapter over ConversationMemory, for the ReAct agent."""
+
+    memory: Any
+    memory_key: str = "chat_history"
+    input_key: str = "input"
+    output_key: str = "output"
+    return_messages: bool = True
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        if self.return_messages:
+            return {self.memory_key: self.memory.messages()}
+        return {self.memory_key: self.memory.as_text()}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        self.memory.add_user_message(str(inputs.get(self.input_key, "")))
+        self.memory.add_ai_message(str(outputs.get(self.output_key, "")))
+
+    def clear(self) -> None:
+        self.memory.clear()
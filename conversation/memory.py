@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from observability.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Prompt tokens the memory may contribute: recent turns verbatim up to
+# MEMORY_RECENT_TOKENS, plus a running summary of everything older.
+MEMORY_RECENT_TOKENS = int(os.getenv("MEMORY_RECENT_TOKENS", "800"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "200"))
+# The latest exchange always stays verbatim, whatever its size
+MIN_RECENT_MESSAGES = 2
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = """Progressively summarize the lines of conversation provided, adding onto the previous summary and returning a new summary.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+Keep the new summary under {words} words.
+
+New summary:"""
+
+SUMMARY_SECONDS = REGISTRY.histogram(
+    "memory_summary_seconds", "Background summarization of older conversation turns."
+)
+
+# Summaries for sync callers (the ReAct agent) run here; async callers
+# (the LangGraph engine) schedule them as tasks on their event loop.
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def render_turns(turns):
+    return "\n".join(f"{role}: {text}" for role, text in turns)
+
+
+class ConversationMemory:
+    """
+    Token-budgeted memory for one conversation.
+
+    Recent messages are kept verbatim. When they exceed the recent-token
+    budget, the oldest ones are handed to a background summarization and
+    dropped from the prompt right away, so neither the prompt nor the user's
+    wait grows with the length of the session.
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        recent_tokens=MEMORY_RECENT_TOKENS,
+        summary_tokens=MEMORY_SUMMARY_TOKENS,
+    ):
+        self.llm = llm
+        self.recent_tokens = recent_tokens
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self._recent = []  # [((role, text), tokens)]
+        self._recent_total = 0
+        self._pending = []  # messages waiting to be folded into the summary
+        self._in_flight = []  # messages the running summary is folding in
+        self._lock = threading.Lock()
+        self._summarizing = None  # asyncio.Task or Future while a summary runs
+        self.summarizations = 0
+
+    # Turns are kept as (role, text) pairs; LangChain message objects are only
+    # built for callers that ask for them.
+    def add_user_message(self, text):
+        self._add("Human", text)
+
+    def add_ai_message(self, text):
+        self._add("AI", text)
+
+    def _add(self, role, text):
+        tokens = estimate_tokens(text)
+        with self._lock:
+            self._recent.append(((role, text), tokens))
+            self._recent_total += tokens
+            while (
+                self._recent_total > self.recent_tokens
+                and len(self._recent) > MIN_RECENT_MESSAGES
+            ):
+                old, old_tokens = self._recent.pop(0)
+                self._recent_total -= old_tokens
+                self._pending.append(old)
+            if self.llm is None:
+                # No summarizer: older turns are simply forgotten
+                self._pending = []
+            start = bool(self._pending) and self._summarizing is None
+            if start:
+                self._summarizing = True  # reserved until the job is scheduled
+        if start:
+            self._schedule_summary()
+
+    def turns(self):
+        """The running summary (if any) and the recent turns, as (role, text)."""
+        with self._lock:
+            recent = [turn for turn, _ in self._recent]
+            summary = self.summary
+        if summary:
+            return [("System", f"Summary of the earlier conversation: {summary}")] + recent
+        return recent
+
+    def messages(self):
+        """turns() as LangChain messages, for chat prompts."""
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        classes = {"Human": HumanMessage, "AI": AIMessage, "System": SystemMessage}
+        return [classes[role](content=text) for role, text in self.turns()]
+
+    def as_text(self):
+        """turns() as "Human: ... / AI: ..." lines for text prompts."""
+        return render_turns(self.turns())
+
+    # ── background summarization ─────────────────
+    def _schedule_summary(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            self._summarizing = loop.create_task(self._summarize_async())
+        else:
+            self._summarizing = _summary_pool.submit(self._summarize_sync)
+
+    def _take_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._in_flight = pending
+            return self.summary, pending
+
+    def _prompt(self, summary, pending):
+        return SUMMARY_PROMPT.format(
+            summary=summary or "(none)",
+            new_lines=render_turns(pending),
+            words=self.summary_tokens * 3 // 4,
+        )
+
+    def _finish(self, text, pending, elapsed):
+        SUMMARY_SECONDS.observe(elapsed)
+        with self._lock:
+            self._in_flight = []
+            if text is not None:
+                self.summary = text.strip()
+                self.summarizations += 1
+            else:
+                # Keep the turns for the next attempt rather than losing them
+                self._pending = pending + self._pending
+            again = bool(self._pending) and text is not None
+            self._summarizing = None
+            if again:
+                self._summarizing = True
+        return again
+
+    async def _summarize_async(self):
+        loop = asyncio.get_running_loop()
+        summary, pending = self._take_pending()
+        start = loop.time()
+        try:
+            text = (await self.llm.ainvoke(self._prompt(summary, pending))).content
+        except Exception as e:
+            logger.warning("Conversation summary failed: %s", e)
+            text = None
+        if self._finish(text, pending, loop.time() - start):
+            self._schedule_summary()
+
+    def _summarize_sync(self):
+        summary, pending = self._take_pending()
+        start = time.perf_counter()
+        try:
+            text = self.llm.invoke(self._prompt(summary, pending)).content
+        except Exception as e:
+            logger.warning("Conversation summary failed: %s", e)
+            text = None
+        if self._finish(text, pending, time.perf_counter() - start):
+            self._schedule_summary()
+
+    def close(self):
+        """Cancel a summary still running for a conversation that has ended."""
+        task = self._summarizing
+        if task is not None and task is not True:
+            task.cancel()
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self._recent = []
+            self._recent_total = 0
+            self._pending = []
+            self._in_flight = []
+
+    def snapshot(self):
+        """
+        The summary and every turn not yet folded into it, oldest first, as
+        plain data that can be checkpointed with the session's state.
+        """
+        with self._lock:
+            turns = self._in_flight + self._pending + [turn for turn, _ in self._recent]
+            return {"summary": self.summary, "turns": [list(turn) for turn in turns]}
+
+    def restore(self, snapshot):
+        """
+        Rebuilds the memory from snapshot(), e.g. when a session resumes in
+        another process. Turns over the recent budget are summarized again.
+        """
+        self.clear()
+        if not snapshot:
+            return
+        with self._lock:
+            self.summary = snapshot.get("summary", "")
+        for role, text in snapshot.get("turns", []):
+            self._add(role, text)
+
+    def stats(self):
+        """Size of this conversation's memory, for capacity planning."""
+        with self._lock:
+            texts = [text for (_, text), _ in self._recent] + [text for _, text in self._pending]
+            return {
+                "recent_messages": len(self._recent),
+                "recent_tokens": self._recent_total,
+                "summary_tokens": estimate_tokens(self.summary),
+                "pending_messages": len(self._pending),
+                "summarizations": self.summarizations,
+                "bytes": sys.getsizeof(self.summary)
+                + sum(sys.getsizeof(text) for text in texts),
+            }
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# "memory", "sqlite" or "off"
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "rag/llm_cache.sqlite3")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+# A SQLite hit refreshes the entry's last-used time (for LRU eviction) only
+# when it is older than this, so reading a hot entry is not a write each time
+LLM_CACHE_TOUCH_SECONDS = float(os.getenv("LLM_CACHE_TOUCH_SECONDS", "300"))
+
+
+def response_cache_key(model, template, order, policy_version, current_date):
+    """
+    Normalized hash of everything an eligibility answer depends on.
+    order is an OrderRecord, or the raw order text when no typed record exists;
+    whitespace in text inputs is collapsed so formatting changes do not miss.
+    """
+    if hasattr(order, "to_list"):
+        order = order.to_list()
+    else:
+        order = " ".join((order or "").split())
+    payload = json.dumps(
+        [model, " ".join(template.split()), order, policy_version, str(current_date)],
+        default=str,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Base class for LLM response caches: TTL-expired, size-bounded (least
+    recently used entries are evicted first) and counting hits and misses.
+    Subclasses implement _get, _put, _len and clear.
+    """
+
+    def __init__(self, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0}
+
+    def get(self, key):
+        """Cached response for key, or None on a miss or an expired entry."""
+        with self._lock:
+            response, expired = self._get(key, time.time())
+            if expired:
+                self._stats["expired"] += 1
+            self._stats["hits" if response is not None else "misses"] += 1
+            return response
+
+    def put(self, key, response):
+        with self._lock:
+            self._stats["evictions"] += self._put(key, response, time.time())
+            self._stats["writes"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._len()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _get(self, key, now):
+        raise NotImplementedError
+
+    def _put(self, key, response, now):
+        raise NotImplementedError
+
+    def _len(self):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryResponseCache(ResponseCache):
+    """In-process cache; entries are lost on restart."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._entries = OrderedDict()  # key -> (response, stored_at)
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        response, stored_at = entry
+        if now - stored_at > self.ttl:
+            del self._entries[key]
+            return None, True
+        self._entries.move_to_end(key)
+        return response, False
+
+    def _put(self, key, response, now):
+        self._entries[key] = (response, now)
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def _len(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Cache persisted in a SQLite file, shared by every process that points at
+    it (CLI, service workers, batch jobs) and surviving restarts. Calls do
+    file I/O, so async code should make them from a worker thread.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, touch_seconds=LLM_CACHE_TOUCH_SECONDS, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.touch_seconds = touch_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self._conn.commit()
+
+    def _get(self, key, now):
+        row = self._conn.execute(
+            "SELECT response, stored_at, used_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None, False
+        response, stored_at, used_at = row
+        if now - stored_at > self.ttl:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+            return None, True
+        # LRU order only needs to be approximate
+        if now - used_at > self.touch_seconds:
+            self._conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return response, False
+
+    def _put(self, key, response, now):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, stored_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, response, now, now),
+        )
+        # Drop expired entries first, then the least recently used beyond the bound
+        expired = self._conn.execute(
+            "DELETE FROM responses WHERE stored_at < ?", (now - self.ttl,)
+        ).rowcount
+        overflow = self._len() - self.max_entries
+        evicted = 0
+        if overflow > 0:
+            evicted = self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY used_at LIMIT ?)",
+                (overflow,),
+            ).rowcount
+        self._conn.commit()
+        return expired + evicted
+
+    def _len(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Returns the shared response cache for LLM_CACHE_BACKEND, or None when
+    caching is turned off.
+    """
+    global _cache
+    if LLM_CACHE_BACKEND == "off":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if LLM_CACHE_BACKEND == "sqlite":
+                    _cache = SQLiteResponseCache()
+                elif LLM_CACHE_BACKEND == "memory":
+                    _cache = MemoryResponseCache()
+                else:
+                    raise ValueError(f"Unknown LLM_CACHE_BACKEND: {LLM_CACHE_BACKEND}")
+    return _cache
@@ -0,0 +1,155 @@
+import asyncio
+
+from observability.metrics import waiting_for_input
+
+# Events a QueueSessionIO emits to whoever drives the session
+MESSAGE = "message"
+CHUNK = "chunk"
+AWAITING_INPUT = "awaiting_input"
+END_OF_SESSION = "end"
+
+
+class SessionIO:
+    """
+    How graph nodes talk to one user. Nodes never call print() or input();
+    they await send() and receive() on the session's IO object instead.
+    """
+
+    async def send(self, text: str) -> None:
+        """Deliver one complete agent message to the user."""
+        raise NotImplementedError
+
+    async def send_stream(self, chunks) -> str:
+        """
+        Deliver one agent message produced incrementally (e.g. LLM tokens) from
+        an async iterator of text chunks. Returns the full message. Adapters
+        that cannot stream deliver it whole once it is complete.
+        """
+        text = "".join([chunk async for chunk in chunks])
+        await self.send(text)
+        return text
+
+    async def receive(self) -> str:
+        """Wait for the user's next message."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Called once when the conversation has ended."""
+
+
+class StdioSessionIO(SessionIO):
+    """Terminal adapter: the original "Agent:" / "You:" console dialogue."""
+
+    async def send(self, text):
+        print(f"Agent: {text}")
+
+    async def send_stream(self, chunks):
+        print("Agent: ", end="", flush=True)
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk)
+            print(chunk, end="", flush=True)
+        print()
+        return "".join(parts)
+
+    async def receive(self):
+        # input() blocks, so it runs off the event loop thread
+        with waiting_for_input():
+            text = await asyncio.to_thread(input, "You: ")
+        return text.strip()
+
+
+class RecordingSessionIO(SessionIO):
+    """
+    Wraps another SessionIO and records both sides of the dialogue in a
+    ConversationMemory, so nodes get history without bookkeeping of their own.
+    """
+
+    def __init__(self, io, memory):
+        self.io = io
+        self.memory = memory
+
+    async def send(self, text):
+        self.memory.add_ai_message(text)
+        await self.io.send(text)
+
+    async def send_stream(self, chunks):
+        text = await self.io.send_stream(chunks)
+        self.memory.add_ai_message(text)
+        return text
+
+    async def receive(self):
+        text = await self.io.receive()
+        self.memory.add_user_message(text)
+        return text
+
+    async def close(self):
+        self.memory.close()
+        await self.io.close()
+
+
+class QueueSessionIO(SessionIO):
+    """
+    In-memory adapter for servers and tests. User messages are pushed with
+    put_input(); agent output is read as (event, payload) tuples from
+    next_event(), where event is MESSAGE, CHUNK, AWAITING_INPUT or
+    END_OF_SESSION. A streamed message arrives as CHUNK events followed by a
+    MESSAGE event with the complete text.
+    """
+
+    def __init__(self):
+        self._inbox = asyncio.Queue()
+        self._outbox = asyncio.Queue()
+        self.closed = False
+
+    async def send(self, text):
+        await self._outbox.put((MESSAGE, text))
+
+    async def send_stream(self, chunks):
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk)
+            await self._outbox.put((CHUNK, chunk))
+        text = "".join(parts)
+        await self._outbox.put((MESSAGE, text))
+        return text
+
+    async def receive(self):
+        await self._outbox.put((AWAITING_INPUT, None))
+        with waiting_for_input():
+            text = await self._inbox.get()
+        return text.strip()
+
+    async def close(self):
+        self.closed = True
+        await self._outbox.put((END_OF_SESSION, None))
+
+    async def put_input(self, text):
+        await self._inbox.put(text)
+
+    async def next_event(self):
+        return await self._outbox.get()
+
+    async def read_turn(self):
+        """
+        Collect agent messages until the agent waits for input or the session
+        ends. Returns (messages, ended).
+        """
+        messages = []
+        while True:
+            event, payload = await self.next_event()
+            if event == MESSAGE:
+                messages.append(payload)
+            elif event != CHUNK:
+                return messages, event == END_OF_SESSION
+
+    async def stream_turn(self):
+        """
+        Yield (event, payload) tuples for one agent turn, chunks included,
+        ending with the AWAITING_INPUT or END_OF_SESSION event.
+        """
+        while True:
+            event, payload = await self.next_event()
+            yield event, payload
+            if event in (AWAITING_INPUT, END_OF_SESSION):
+                return
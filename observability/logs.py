@@ -0,0 +1,55 @@
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# DEBUG shows the retrieval/policy trace the CLI used to print unconditionally;
+# the default keeps production quiet and the debug calls nearly free.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
+# "text" for humans, "json" for one structured object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Set METRICS_LOG=1 to also log every metric observation (as JSON) at DEBUG
+METRICS_LOG = os.getenv("METRICS_LOG", "0") == "1"
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; extra= fields are included as keys."""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        message = record.getMessage()
+        # Metric observations are already JSON; merge rather than nest them
+        if record.name == "metrics" and message.startswith("{"):
+            payload.update(json.loads(message))
+        else:
+            payload["message"] = message
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, metrics=METRICS_LOG):
+    """Set up the root logger for an entry point (CLI, service, ingest)."""
+    handler = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    logging.getLogger("metrics").setLevel(logging.DEBUG if metrics else logging.WARNING)
+    # HTTP client chatter would drown the application's debug output
+    for noisy in ("httpx", "httpcore", "openai", "urllib3", "aiohttp.access"):
+        logging.getLogger(noisy).setLevel(max(root.level, logging.INFO))
+    logging.getLogger("faiss").setLevel(logging.WARNING)
@@ -0,0 +1,306 @@
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Latency buckets (seconds) shared by every histogram: sub-millisecond index
+# lookups through multi-second LLM calls.
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# Every observation is also written as one JSON line to this logger at DEBUG
+# level, so it costs a level check and nothing more unless enabled.
+metrics_log = logging.getLogger("metrics")
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + body + "}"
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, in Prometheus' layout."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[slot] += 1
+            entry[-1] += value
+        if metrics_log.isEnabledFor(logging.DEBUG):
+            metrics_log.debug(
+                json.dumps({"metric": self.name, "labels": labels, "value": round(value, 6)})
+            )
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(entry) for key, entry in self._values.items()}
+        out = []
+        for key, entry in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                out.append((f"{self.name}_bucket", key, cumulative, (("le", repr(bound)),)))
+            cumulative += entry[len(self.buckets)]
+            out.append((f"{self.name}_bucket", key, cumulative, (("le", "+Inf"),)))
+            out.append((f"{self.name}_sum", key, entry[-1], ()))
+            out.append((f"{self.name}_count", key, cumulative, ()))
+        return out
+
+    def snapshot(self):
+        with self._lock:
+            values = {key: list(entry) for key, entry in self._values.items()}
+        out = []
+        for key, entry in values.items():
+            count = sum(entry[:-1])
+            out.append(
+                {
+                    "labels": dict(key),
+                    "count": count,
+                    "sum": round(entry[-1], 6),
+                    "mean": round(entry[-1] / count, 6) if count else 0.0,
+                    "p50": self._quantile(entry, count, 0.50),
+                    "p99": self._quantile(entry, count, 0.99),
+                }
+            )
+        return out
+
+    def _quantile(self, entry, count, q):
+        """Upper bucket bound holding the q-quantile (None if above the top bucket)."""
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, entry):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return None
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get_or_create(Counter, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample in metric.samples():
+                name, key, value = sample[:3]
+                extra = sample[3] if len(sample) > 3 else ()
+                lines.append(f"{name}{_format_labels(key, extra)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict (histograms with p50/p99)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+NODE_SECONDS = REGISTRY.histogram(
+    "graph_node_seconds", "Time spent in a graph node, excluding waiting for user input."
+)
+INPUT_WAIT_SECONDS = REGISTRY.histogram(
+    "session_input_wait_seconds", "Time a session spent waiting for the user."
+)
+EMBEDDING_SECONDS = REGISTRY.histogram(
+    "embedding_request_seconds", "Embedding requests sent to the embedding model."
+)
+EMBEDDING_TEXTS = REGISTRY.counter("embedding_texts_total", "Texts embedded, by source.")
+FAISS_SEARCH_SECONDS = REGISTRY.histogram("faiss_search_seconds", "FAISS index searches.")
+FILE_READ_SECONDS = REGISTRY.histogram(
+    "file_read_seconds", "Reading and parsing on-disk artifacts."
+)
+LLM_SECONDS = REGISTRY.histogram("llm_request_seconds", "LLM calls, start to last token.")
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "LLM tokens, by model and type.")
+LLM_ERRORS = REGISTRY.counter("llm_errors_total", "Failed LLM calls.")
+AGENT_LLM_STEPS = REGISTRY.counter("agent_llm_steps_total", "ReAct agent reasoning steps.")
+AGENT_TOOL_CALLS = REGISTRY.counter(
+    "agent_tool_calls_total", "ReAct agent tool calls, by tool and whether they were cached."
+)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "upstream_requests_total", "HTTP attempts sent to the model API, by model and outcome."
+)
+UPSTREAM_RETRIES = REGISTRY.counter("upstream_retries_total", "Retried model API attempts.")
+UPSTREAM_SHED = REGISTRY.counter(
+    "upstream_shed_total", "Model API requests refused locally instead of being sent."
+)
+UPSTREAM_QUEUE_SECONDS = REGISTRY.histogram(
+    "upstream_queue_seconds", "Time a model API request waited for a concurrency slot."
+)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of the with-block into histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+# Per-node accumulator of time spent waiting for the user, so node latency
+# reflects the agent's own work.
+_input_wait = contextvars.ContextVar("input_wait", default=None)
+
+
+@contextmanager
+def waiting_for_input():
+    """Wrap a wait for user input; it is excluded from the current node's time."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        INPUT_WAIT_SECONDS.observe(elapsed)
+        waits = _input_wait.get()
+        if waits is not None:
+            waits[0] += elapsed
+
+
+def instrument_node(name, fn):
+    """Wrap an async graph node so its active time lands in graph_node_seconds."""
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        waits = [0.0]
+        token = _input_wait.set(waits)
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            NODE_SECONDS.observe(max(time.perf_counter() - start - waits[0], 0.0), node=name)
+            _input_wait.reset(token)
+
+    return wrapper
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """LangChain callback recording LLM latency and token usage."""
+
+    def __init__(self):
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        model = self._model(response)
+        if start is not None:
+            LLM_SECONDS.observe(time.perf_counter() - start, model=model)
+        usage = self._usage(response)
+        for kind in ("input_tokens", "output_tokens"):
+            if usage.get(kind):
+                LLM_TOKENS.inc(usage[kind], model=model, type=kind.split("_")[0])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+        LLM_ERRORS.inc(error=type(error).__name__)
+
+    @staticmethod
+    def _model(response):
+        output = response.llm_output or {}
+        model = output.get("model_name") or output.get("model")
+        if not model:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "response_metadata", {})
+                    model = model or (metadata or {}).get("model_name")
+        return model or "unknown"
+
+    @staticmethod
+    def _usage(response):
+        # Chat models (including streamed ones) attach usage to the message
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    return usage
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        return {
+            "input_tokens": token_usage.get("prompt_tokens", 0),
+            "output_tokens": token_usage.get("completion_tokens", 0),
+        }
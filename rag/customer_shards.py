@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from rag.faiss_store import has_store, load_vectors, read_index_meta
+from rag.lexical_index import LexicalIndex
+from rag.order_records import (
+    OrderRecordStore,
+    decode_string,
+    encode_strings,
+    normalize_username,
+)
+
+logger = logging.getLogger(__name__)
+
+CUSTOMERS_DIR = "customers"
+DIRECTORY_FILE = "directory.json"
+
+# Customers are hashed into this many shard directories at ingest
+CUSTOMER_SHARDS = int(os.getenv("CUSTOMER_SHARDS", "64"))
+# Shards a process keeps open; the least recently used one is closed beyond this
+CUSTOMER_SHARD_CACHE = int(os.getenv("CUSTOMER_SHARD_CACHE", "16"))
+
+
+def shard_of(username, shards):
+    """Stable shard number of a customer (the same in every process and run)."""
+    digest = hashlib.blake2b(normalize_username(username).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % shards
+
+
+def write_customer_shards(store_dir, shards=CUSTOMER_SHARDS):
+    """
+    Splits the orders of a generation by customer (username) into `shards`
+    directories under <store_dir>/customers/. Each shard holds its customers'
+    order records and chunk vectors as memory-mappable columns, grouped by
+    customer, so one customer's orders are a contiguous slice. Writes a small
+    directory.json (shard count, per-shard sizes, metric) next to them.
+    Shards are built one at a time from the mapped record store and vectors,
+    so only one shard's orders are in memory. Call after the record store,
+    the BM25 index (for its chunk-to-row map) and the docs/ columns are
+    written. Returns the number of customers.
+    """
+    records = OrderRecordStore(store_dir)
+    vectors = load_vectors(store_dir) if has_store(store_dir) else None
+    dim = vectors.shape[1] if vectors is not None else 0
+    # FAISS positions grouped by record row: row r owns
+    # chunk_order[chunk_bounds[r]:chunk_bounds[r + 1]]
+    chunk_order = np.zeros(0, dtype=np.int64)
+    chunk_bounds = np.zeros(len(records) + 1, dtype=np.int64)
+    if vectors is not None:
+        doc_rows = np.asarray(LexicalIndex(store_dir).doc_rows)
+        chunk_order = np.argsort(doc_rows, kind="stable")
+        chunk_bounds = np.searchsorted(doc_rows[chunk_order], np.arange(len(records) + 1))
+
+    shard_of_row = np.full(len(records), -1, dtype=np.int32)
+    for row in range(len(records)):
+        username = normalize_username(records.row(row).username)
+        if username:
+            shard_of_row[row] = shard_of(username, shards)
+
+    root = os.path.join(store_dir, CUSTOMERS_DIR)
+    sizes = []
+    for shard in range(shards):
+        rows = np.flatnonzero(shard_of_row == shard)
+        names = [normalize_username(records.row(row).username) for row in rows.tolist()]
+        # Customers in username order, each one's orders in row order
+        order = sorted(range(len(rows)), key=names.__getitem__)
+        rows = rows[order].tolist()
+        members = Counter(names)
+        usernames = sorted(members)
+        starts = np.zeros(len(usernames) + 1, dtype=np.int64)
+        np.cumsum([members[username] for username in usernames], out=starts[1:])
+        positions = [chunk_order[chunk_bounds[row] : chunk_bounds[row + 1]] for row in rows]
+        chunk_starts = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in positions], out=chunk_starts[1:])
+        flat_positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+
+        docs = [records.document(row) for row in rows]
+        content, content_offsets, _ = encode_strings([doc.page_content for doc in docs])
+        metadata, metadata_offsets, _ = encode_strings(
+            [json.dumps(doc.metadata, ensure_ascii=False) for doc in docs]
+        )
+        width = max((len(username.encode("utf-8")) for username in usernames), default=1)
+        columns = {
+            "usernames": np.array(
+                [username.encode("utf-8") for username in usernames], dtype=f"S{width}"
+            ),
+            "starts": starts,
+            "content_blob": content,
+            "content_offsets": content_offsets,
+            "metadata_blob": metadata,
+            "metadata_offsets": metadata_offsets,
+            "chunk_starts": chunk_starts,
+            "vectors": (
+                np.asarray(vectors[flat_positions], dtype=np.float32)
+                if len(flat_positions)
+                else np.zeros((0, dim), dtype=np.float32)
+            ),
+        }
+        path = os.path.join(root, f"{shard:04d}")
+        os.makedirs(path, exist_ok=True)
+        for name, column in columns.items():
+            np.save(os.path.join(path, f"{name}.npy"), column, allow_pickle=False)
+        sizes.append({"customers": len(usernames), "orders": len(rows), "chunks": len(flat_positions)})
+
+    meta = read_index_meta(store_dir) if has_store(store_dir) else {}
+    directory = {
+        "shards": shards,
+        "customers": sum(size["customers"] for size in sizes),
+        "distance_strategy": meta.get("distance_strategy"),
+        "sizes": sizes,
+    }
+    with open(os.path.join(root, DIRECTORY_FILE), "w", encoding="utf-8") as f:
+        json.dump(directory, f)
+    return directory["customers"]
+
+
+class CustomerShard:
+    """One shard's columns, memory-mapped read-only."""
+
+    def __init__(self, path):
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+
+        self.usernames = load("usernames")
+        self.starts = load("starts")
+        self._content = (load("content_blob"), load("content_offsets"))
+        self._metadata = (load("metadata_blob"), load("metadata_offsets"))
+        self.chunk_starts = load("chunk_starts")
+        self.vectors = load("vectors")
+
+    def orders(self, username):
+        """Range [start, end) of a customer's orders in this shard (empty if unknown)."""
+        key = username.encode("utf-8")
+        i = int(np.searchsorted(self.usernames, key))
+        if i < len(self.usernames) and self.usernames[i] == key:
+            return int(self.starts[i]), int(self.starts[i + 1])
+        return 0, 0
+
+    def document(self, i):
+        from langchain_core.documents import Document
+
+        return Document(
+            page_content=decode_string(*self._content, i),
+            metadata=json.loads(decode_string(*self._metadata, i)),
+        )
+
+    def rank(self, start, end, vector, inner_product=False):
+        """Orders start..end-1 ordered by their best chunk's similarity to vector."""
+        lo, hi = int(self.chunk_starts[start]), int(self.chunk_starts[end])
+        if lo == hi:
+            return list(range(start, end))
+        candidates = np.asarray(self.vectors[lo:hi], dtype=np.float32)
+        if inner_product:
+            scores = candidates @ vector
+        else:
+            scores = -((candidates - vector) ** 2).sum(axis=1)
+        owners = np.searchsorted(self.chunk_starts, np.arange(lo, hi), side="right") - 1
+        best = {}
+        for owner, score in zip(owners.tolist(), scores.tolist()):
+            best[owner] = max(score, best.get(owner, score))
+        unranked = [i for i in range(start, end) if i not in best]
+        return sorted(best, key=lambda i: -best[i]) + unranked
+
+
+class CustomerShards:
+    """
+    Directory of a generation's customer shards. Shards are opened on first
+    use and kept in an LRU of `cache_size`; a customer's lookup opens only
+    the one shard their username hashes to and reads only their slice of it.
+    """
+
+    def __init__(self, store_dir, cache_size=CUSTOMER_SHARD_CACHE):
+        self.path = os.path.join(store_dir, CUSTOMERS_DIR)
+        with open(os.path.join(self.path, DIRECTORY_FILE), "r", encoding="utf-8") as f:
+            self.directory = json.load(f)
+        self.cache_size = cache_size
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def __len__(self):
+        return self.directory["customers"]
+
+    @property
+    def inner_product(self):
+        return self.directory.get("distance_strategy") == "MAX_INNER_PRODUCT"
+
+    def shard(self, number):
+        with self._lock:
+            shard = self._shards.get(number)
+            if shard is not None:
+                self._shards.move_to_end(number)
+                self._stats["hits"] += 1
+                return shard
+        # Opening only maps the files; done outside the lock
+        shard = CustomerShard(os.path.join(self.path, f"{number:04d}"))
+        with self._lock:
+            self._stats["loads"] += 1
+            self._shards[number] = shard
+            self._shards.move_to_end(number)
+            while len(self._shards) > self.cache_size:
+                evicted, _ = self._shards.popitem(last=False)
+                self._stats["evictions"] += 1
+                logger.debug("Evicted customer shard %d", evicted)
+        return shard
+
+    def orders(self, username, vector=None, k=None):
+        """
+        A customer's order Documents, best match for vector first when one is
+        given (otherwise in order-number order); at most k of them.
+        """
+        username = normalize_username(username)
+        if not username:
+            return []
+        shard = self.shard(shard_of(username, self.directory["shards"]))
+        start, end = shard.orders(username)
+        if vector is None:
+            positions = list(range(start, end))
+        else:
+            positions = shard.rank(start, end, vector, self.inner_product)
+        return [shard.document(i) for i in positions[:k]]
+
+    def stats(self):
+        return {
+            "customers": len(self),
+            "shards": self.directory["shards"],
+            "open_shards": len(self._shards),
+            "cache_size": self.cache_size,
+            **self._stats,
+        }
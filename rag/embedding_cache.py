@@ -0,0 +1,265 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()  # Ensure .env is loaded
+
+from langchain_core.embeddings import Embeddings
+
+from observability.metrics import EMBEDDING_SECONDS, EMBEDDING_TEXTS, timed
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "rag/embedding_cache")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "1") != "0"
+
+KEY_BYTES = 32
+
+
+def cache_key(model, text):
+    """Hex digest of (model, text); the cache never stores the text itself."""
+    digest = hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+    return digest[:KEY_BYTES].encode("ascii")
+
+
+class DiskEmbeddingCache:
+    """
+    Size-bounded, least-recently-used embedding cache on disk.
+
+    Layout of one cache directory (one per embedding model):
+      meta.json     - model, dimension and capacity
+      vectors.npy   - (capacity, dim) float32, memory-mapped
+      keys.npy      - (capacity,) hex digests, empty for free slots
+      ticks.npy     - (capacity,) int64 last-use timestamps for LRU eviction
+
+    Several processes (ingest and retrievers) can share a directory: slot
+    assignment happens under an exclusive file lock, a slot's digest is only
+    published after its vector is written, and every read checks the digest
+    before and after copying the vector, so a slot re-used by another process
+    reads as a miss.
+    """
+
+    def __init__(self, cache_dir, model, capacity=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.model = model
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._keys = None
+        self._ticks = None
+        self._slots = {}
+        self._keys_mtime = None
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._open()
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _open(self):
+        """Maps existing cache files, if the cache has been created."""
+        meta_path = self._path("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.capacity = meta["capacity"]
+        self._vectors = np.load(self._path("vectors.npy"), mmap_mode="r+")
+        self._keys = np.load(self._path("keys.npy"), mmap_mode="r+")
+        self._ticks = np.load(self._path("ticks.npy"), mmap_mode="r+")
+        self._refresh_slots()
+
+    def _create(self, dim):
+        """Allocates the memory-mapped arrays on the first write."""
+        open_memmap = np.lib.format.open_memmap
+        self._vectors = open_memmap(
+            self._path("vectors.npy"), mode="w+", dtype=np.float32, shape=(self.capacity, dim)
+        )
+        self._keys = open_memmap(
+            self._path("keys.npy"), mode="w+", dtype=f"S{KEY_BYTES}", shape=(self.capacity,)
+        )
+        self._ticks = open_memmap(
+            self._path("ticks.npy"), mode="w+", dtype=np.int64, shape=(self.capacity,)
+        )
+        # meta.json is written last; its presence marks a usable cache
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "dim": dim, "capacity": self.capacity}, f)
+        os.replace(tmp_path, self._path("meta.json"))
+
+    def _refresh_slots(self):
+        """Rebuilds the digest -> slot map if another process changed the keys."""
+        mtime = os.stat(self._path("keys.npy")).st_mtime_ns
+        if mtime == self._keys_mtime:
+            return
+        occupied = np.flatnonzero(self._keys != b"")
+        self._slots = {bytes(self._keys[i]): int(i) for i in occupied}
+        self._keys_mtime = mtime
+
+    def get_many(self, keys):
+        """Returns a list with a float32 vector per key, or None on a miss."""
+        results = [None] * len(keys)
+        now = time.time_ns()
+        with self._lock:
+            if self._keys is None:
+                self._open()
+            if self._keys is None:
+                self.stats["misses"] += len(keys)
+                return results
+            self._refresh_slots()
+            for i, key in enumerate(keys):
+                slot = self._slots.get(key)
+                vector = None
+                if slot is not None and self._keys[slot] == key:
+                    vector = np.array(self._vectors[slot])
+                    # Still our key after the copy: no writer re-used the slot meanwhile
+                    if self._keys[slot] != key:
+                        vector = None
+                if vector is not None:
+                    results[i] = vector
+                    self._ticks[slot] = now
+                    self.stats["hits"] += 1
+                else:
+                    self.stats["misses"] += 1
+        return results
+
+    def put_many(self, keys, vectors):
+        """Stores vectors, evicting the least recently used entries when full."""
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, open(self._path("cache.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self._keys is None:
+                    self._open()
+                if self._keys is None:
+                    self._create(vectors.shape[1])
+                self._refresh_slots()
+
+                new = {}
+                for key, vector in zip(keys, vectors):
+                    if key not in self._slots:
+                        new[key] = vector
+                new_keys = list(new)[-self.capacity :]
+                if not new_keys:
+                    return
+
+                # Readers take no file lock: an evicted slot is cleared before
+                # its vector is overwritten, and the new keys are published
+                # only once the vectors are in place, so a reader never pairs
+                # a key with another entry's vector.
+                slots = self._free_slots(len(new_keys))
+                self._keys[slots] = b""
+                self._keys.flush()
+                self._vectors[slots] = np.stack([new[k] for k in new_keys])
+                self._ticks[slots] = time.time_ns()
+                self._vectors.flush()
+                self._ticks.flush()
+                self._keys[slots] = new_keys
+                self._keys.flush()
+                for key, slot in zip(new_keys, slots):
+                    self._slots[key] = int(slot)
+                self._keys_mtime = os.stat(self._path("keys.npy")).st_mtime_ns
+                self.stats["writes"] += len(new_keys)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _free_slots(self, n):
+        """Picks n slots: free ones first, then the least recently used."""
+        free = np.flatnonzero(self._keys == b"")[:n]
+        if len(free) == n:
+            return free
+        needed = n - len(free)
+        ticks = np.where(self._keys == b"", np.iinfo(np.int64).max, self._ticks)
+        evict = np.argpartition(ticks, needed - 1)[:needed]
+        for slot in evict:
+            self._slots.pop(bytes(self._keys[slot]), None)
+        self.stats["evictions"] += needed
+        return np.concatenate([free, evict])
+
+    def size(self):
+        return len(self._slots)
+
+
+class TimedEmbeddings(Embeddings):
+    """Records latency and volume of every request to the wrapped embedding model."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+
+    def embed_documents(self, texts):
+        with timed(EMBEDDING_SECONDS, model=self.model):
+            vectors = self.embeddings.embed_documents(texts)
+        EMBEDDING_TEXTS.inc(len(texts), source="model")
+        return vectors
+
+    def embed_query(self, text):
+        with timed(EMBEDDING_SECONDS, model=self.model):
+            vector = self.embeddings.embed_query(text)
+        EMBEDDING_TEXTS.inc(source="model")
+        return vector
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from a DiskEmbeddingCache and
+    only sends cache misses to the wrapped embedding client.
+    """
+
+    def __init__(self, embeddings, cache_dir=EMBEDDING_CACHE_DIR, model=None):
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+        safe_model = "".join(c if c.isalnum() or c in "-_." else "_" for c in self.model)
+        self.cache = DiskEmbeddingCache(os.path.join(cache_dir, safe_model), self.model)
+
+    def embed_documents(self, texts):
+        keys = [cache_key(self.model, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        EMBEDDING_TEXTS.inc(len(texts) - len(missing), source="cache")
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.put_many([keys[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return [
+            vector.tolist() if isinstance(vector, np.ndarray) else vector
+            for vector in vectors
+        ]
+
+    def embed_query(self, text):
+        # OpenAI embeds queries and documents the same way, so they share entries
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        """Hit/miss counters plus the number of cached vectors."""
+        return {**self.cache.stats, "entries": self.cache.size()}
+
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings():
+    """
+    Returns the embedding client used by ingest and the retriever: OpenAI
+    embeddings behind the shared on-disk cache unless EMBEDDING_CACHE=0.
+    The client is created on first use and shared by the process.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                from clients.provider import get_embedding_model
+
+                embeddings = TimedEmbeddings(get_embedding_model())
+                if EMBEDDING_CACHE_ENABLED:
+                    embeddings = CachedEmbeddings(embeddings)
+                _embeddings = embeddings
+    return _embeddings
@@ -0,0 +1,319 @@
+import json
+import logging
+import math
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+from rag.order_records import decode_string
+
+logger = logging.getLogger(__name__)
+
+# Files of one generation written by rag.store_writer.StoreWriter (legacy
+# generations have index.faiss + index.pkl instead of index.json, vectors.npy
+# and docs/)
+INDEX_FILE = "index.faiss"
+INDEX_META_FILE = "index.json"
+VECTORS_FILE = "vectors.npy"
+DOCSTORE_DIR = "docs"
+
+# Index built by ingest: exact "flat" search, inverted file ("ivf"), graph
+# ("hnsw"), or product-quantized codes with ("ivfpq") or without ("pq") an
+# inverted file. Query cost is O(N) for flat and pq, sublinear for the rest.
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq", "pq")
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+# IVF: number of clusters (0 picks about 4 * sqrt(N)) and clusters probed per query
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+# HNSW: links per node, and the candidate list size while building and searching
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "40"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+# PQ: sub-quantizers (must divide the embedding width) and bits per sub-code
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "64"))
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", "8"))
+# Map indexes read-only from the page cache instead of copying them into each process
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") != "0"
+
+# k-means wants about this many training points per centroid; with fewer
+# vectors than that, ingest builds a flat index instead.
+MIN_POINTS_PER_CENTROID = 39
+# Vectors added to the index per call when building from the mapped vectors.npy
+ADD_BATCH_SIZE = 65536
+# Index types an incremental ingest updates in place (remove the stale
+# vectors from a copy of the previous index, append the new ones) instead of
+# rebuilding; HNSW graphs do not support removal. An updated IVF/PQ index
+# keeps the clusters and codebooks it was trained on, so it is retrained
+# once the corpus has grown or shrunk by more than this factor since.
+UPDATABLE_INDEX_TYPES = ("flat", "ivf", "ivfpq", "pq")
+RETRAIN_FACTOR = 2.0
+
+
+def index_params(**overrides):
+    """Build-time index parameters from the environment, with overrides."""
+    params = {
+        "nlist": FAISS_NLIST,
+        "hnsw_m": FAISS_HNSW_M,
+        "ef_construction": FAISS_HNSW_EF_CONSTRUCTION,
+        "pq_m": FAISS_PQ_M,
+        "pq_nbits": FAISS_PQ_NBITS,
+    }
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    return params
+
+
+def factory_string(index_type, dim, n, params):
+    """
+    The faiss.index_factory description for index_type over n vectors of width
+    dim, and the index type actually used: IVF and PQ fall back to flat when
+    there are too few vectors to train them.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+    if index_type == "hnsw":
+        return f"HNSW{params['hnsw_m']},Flat", index_type
+
+    nlist = params["nlist"] or int(4 * math.sqrt(n))
+    nlist = min(nlist, n // MIN_POINTS_PER_CENTROID)
+    if index_type in ("ivf", "ivfpq") and nlist < 2:
+        logger.info("%d vectors are too few to train %s; building a flat index", n, index_type)
+        return "Flat", "flat"
+    if index_type in ("pq", "ivfpq"):
+        if dim % params["pq_m"]:
+            raise ValueError(f"pq_m={params['pq_m']} does not divide the embedding width {dim}")
+        if n < 2 ** params["pq_nbits"]:
+            logger.info("%d vectors are too few to train %s; building a flat index", n, index_type)
+            return "Flat", "flat"
+        pq = f"PQ{params['pq_m']}x{params['pq_nbits']}"
+        return (f"IVF{nlist},{pq}", index_type) if index_type == "ivfpq" else (pq, index_type)
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat", index_type
+    return "Flat", "flat"
+
+
+def build_index(vectors, index_type=FAISS_INDEX_TYPE, params=None, inner_product=False):
+    """
+    Trains (when the type needs it) and fills a FAISS index with vectors, in
+    order, so index position i holds vectors[i]. Returns (index, metadata).
+    """
+    import faiss
+
+    params = params or index_params()
+    n, dim = vectors.shape
+    factory, index_type = factory_string(index_type, dim, n, params)
+    metric = faiss.METRIC_INNER_PRODUCT if inner_product else faiss.METRIC_L2
+    index = faiss.index_factory(dim, factory, metric)
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = params["ef_construction"]
+    if not index.is_trained:
+        index.train(vectors)
+    _add_vectors(index, vectors)
+    meta = {"index_type": index_type, "factory": factory, "dim": dim, "ntotal": n, "trained_ntotal": n}
+    return index, {**meta, **params}
+
+
+def _add_vectors(index, vectors):
+    # vectors may be memory-mapped: add them in slices so only one is paged in at a time
+    for start in range(0, len(vectors), ADD_BATCH_SIZE):
+        index.add(np.ascontiguousarray(vectors[start : start + ADD_BATCH_SIZE]))
+
+
+def update_index(path, meta, removed, vectors, index_type=FAISS_INDEX_TYPE, params=None):
+    """
+    Updates a copy of the index at path (built with metadata meta) for an
+    incremental ingest: the vectors at positions `removed` are dropped and
+    `vectors` appended, so the surviving vectors keep their order and the
+    new ones follow them. Returns (index, metadata), or None when the index
+    has to be rebuilt instead: its type cannot remove vectors, it was built
+    with other settings, or (IVF/PQ) the corpus size moved past
+    RETRAIN_FACTOR since it was trained.
+    """
+    import faiss
+
+    params = params or index_params()
+    n = meta["ntotal"] - len(removed) + len(vectors)
+    if meta["index_type"] not in UPDATABLE_INDEX_TYPES or not n:
+        return None
+    if len(vectors) and vectors.shape[1] != meta["dim"]:
+        return None
+    if factory_string(index_type, meta["dim"], n, params)[1] != meta["index_type"]:
+        return None
+    if any(meta.get(key) != value for key, value in params.items()):
+        return None
+    trained = meta.get("trained_ntotal", meta["ntotal"])
+    if meta["index_type"] != "flat" and not trained / RETRAIN_FACTOR <= n <= trained * RETRAIN_FACTOR:
+        return None
+
+    # Read into memory: the published (possibly mapped) file is never modified
+    index = faiss.read_index(path)
+    if len(removed):
+        removed = np.sort(np.asarray(removed, dtype=np.int64))
+        index.remove_ids(faiss.IDSelectorBatch(removed))
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            # IVF lists keep the old positions as labels; shift them down past the removed ones
+            invlists = ivf.invlists
+            for list_no in range(ivf.nlist):
+                size = invlists.list_size(list_no)
+                if size:
+                    labels = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+                    labels -= np.searchsorted(removed, labels)
+    _add_vectors(index, vectors)
+    return index, {**meta, "ntotal": int(index.ntotal), "trained_ntotal": trained}
+
+
+def apply_search_params(index, nprobe=FAISS_NPROBE, ef_search=FAISS_HNSW_EF_SEARCH):
+    """Sets the query-time knobs (IVF clusters probed, HNSW candidate list size)."""
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def search_with_ids(index, vectors, k, ids):
+    """
+    index.search restricted to the given positions: the filter is applied
+    while scanning, so disallowed vectors never take a result slot.
+    """
+    import faiss
+
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    elif hasattr(index, "hnsw"):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(index.hnsw.efSearch, k))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    # The selector must outlive the search; params only holds a raw pointer to it
+    distances, positions = index.search(vectors, k, params=params)
+    del selector
+    return distances, positions
+
+
+def read_index(path, mmap=FAISS_MMAP):
+    """
+    Reads a FAISS index file. With mmap the codes stay in the file mapping:
+    loading is near-instant and every process shares one page-cached copy.
+    """
+    import faiss
+
+    if mmap:
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning("Could not memory-map %s (%s); reading it into memory", path, e)
+    return faiss.read_index(path)
+
+
+class DocStore:
+    """
+    Read-only, memory-mapped documents in index order. Implements the
+    search(id) interface langchain's FAISS store expects from a Docstore,
+    without unpickling the corpus into every process.
+    """
+
+    def __init__(self, store_dir):
+        path = os.path.join(store_dir, DOCSTORE_DIR)
+
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+
+        self.ids = load("ids")
+        self._id_order = load("id_order")
+        self._content = (load("content_blob"), load("content_offsets"))
+        self._metadata = (load("metadata_blob"), load("metadata_offsets"))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, doc_id):
+        """Index position of a docstore id, or None."""
+        key = str(doc_id).encode("utf-8")
+        i = int(np.searchsorted(self.ids, key, sorter=self._id_order))
+        if i < len(self._id_order) and self.ids[self._id_order[i]] == key:
+            return int(self._id_order[i])
+        return None
+
+    def document(self, i):
+        """The Document at index position i."""
+        from langchain_core.documents import Document
+
+        return Document(
+            id=self.ids[i].decode("utf-8"),
+            page_content=decode_string(*self._content, i),
+            metadata=self.metadata(i),
+        )
+
+    def metadata(self, i):
+        """The metadata dict at index position i, without building a Document."""
+        return json.loads(decode_string(*self._metadata, i))
+
+    def search(self, search):
+        i = self.position(search)
+        if i is None:
+            return f"ID {search} not found."
+        return self.document(i)
+
+
+class PositionIds(Mapping):
+    """index_to_docstore_id for a DocStore: index position -> id, read from the mapped ids column."""
+
+    def __init__(self, docstore):
+        self._ids = docstore.ids
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self._ids):
+            raise KeyError(i)
+        return self._ids[i].decode("utf-8")
+
+    def __iter__(self):
+        return iter(range(len(self._ids)))
+
+    def __len__(self):
+        return len(self._ids)
+
+
+def has_store(store_dir):
+    """True if store_dir holds a store written by StoreWriter (not a legacy pickle)."""
+    return os.path.exists(os.path.join(store_dir, INDEX_META_FILE))
+
+
+def read_index_meta(store_dir):
+    with open(os.path.join(store_dir, INDEX_META_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_store(store_dir, embeddings, mmap=FAISS_MMAP):
+    """
+    Opens a store written by StoreWriter for querying: the index read-only and
+    (by default) memory-mapped, documents served from the mapped docs/ columns.
+    """
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    meta = read_index_meta(store_dir)
+    index = apply_search_params(read_index(os.path.join(store_dir, INDEX_FILE), mmap))
+    docstore = DocStore(store_dir)
+    return FAISS(
+        embeddings,
+        index,
+        docstore,
+        PositionIds(docstore),
+        normalize_L2=meta["normalize_L2"],
+        distance_strategy=DistanceStrategy(meta["distance_strategy"]),
+    )
+
+
+def load_vectors(store_dir):
+    """The saved full-precision vectors, memory-mapped read-only, or None."""
+    path = os.path.join(store_dir, VECTORS_FILE)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r", allow_pickle=False)
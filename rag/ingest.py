@@ -1,24 +1,78 @@
+import argparse
+import hashlib
+import json
 import os
 import re
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OpenAIEmbeddings
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 from langchain_community.vectorstores import FAISS
 from dotenv import load_dotenv
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from rag.customer_shards import CUSTOMER_SHARDS
+from rag.embedding_cache import get_embeddings
+from rag.faiss_store import (
+    FAISS_INDEX_TYPE,
+    INDEX_TYPES,
+    DocStore,
+    has_store,
+    index_params,
+    load_vectors,
+    read_index_meta,
+)
+from rag.order_records import (
+    ORDER_RECORDS_DIR,
+    OrderRecord,
+    OrderRecordStore,
+    parse_order_record,
+)
+from rag.store_writer import StoreWriter
+from rag.vectorstore_manager import (
+    VECTORSTORE_DIR,
+    begin_generation,
+    prune_generations,
+    read_generation,
+    read_order_index,
+    resolve_store_path,
+    write_generation,
+    write_json_atomic,
+)
+
 # Load environment variables (for OpenAI API key)
 load_dotenv()
 
 ORDER_DIR = "order_information"
-VECTORSTORE_DIR = "rag/vectorstore"
+MANIFEST_FILE = "manifest.json"
+
+# Streaming ingest knobs: chunks per embedding request / index append,
+# embedding requests in flight, and seconds between progress lines.
+EMBED_BATCH_SIZE = 256
+EMBED_CONCURRENCY = 4
+PROGRESS_INTERVAL = 5.0
+
+# Orders parsed in this run replace same-numbered orders carried over from
+# the previous generation (StoreWriter.add_orders priority)
+NEW_ORDER_PRIORITY = 1
+
+
+def iter_markdown_files(order_dir):
+    """Yield the paths of all .md files without listing the directory into memory."""
+    with os.scandir(order_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".md") and entry.is_file():
+                yield entry.path
 
 
 def load_markdown_files(order_dir):
     """Read all .md files and return a list of (filename, content) tuples."""
     docs = []
-    for fname in os.listdir(order_dir):
-        if fname.endswith(".md"):
-            with open(os.path.join(order_dir, fname), "r", encoding="utf-8") as f:
-                docs.append((fname, f.read()))
+    for path in iter_markdown_files(order_dir):
+        with open(path, "r", encoding="utf-8") as f:
+            docs.append((os.path.basename(path), f.read()))
     return docs
 
 
@@ -28,35 +82,490 @@ def split_by_order(text):
     ]
 
 
-def main():
-    # 1. Load all order .md files
-    docs = load_markdown_files(ORDER_DIR)
+def split_order_records(text):
+    """Split a file into one full record per order, each starting at 'Product category:'."""
+    return [
+        chunk.strip()
+        for chunk in re.split(r"(?=Product category:)", text)
+        if chunk.strip()
+    ]
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def parse_order_file(fname, content):
+    """
+    Split a file into orders and return (key, order_number, record_hash, record,
+    chunks, fields) tuples. The key is the order number, or the record position
+    when a record has no order number, and is unique within the file. Each
+    record is split into chunks at "Order number:" so the identifying fields get
+    their own embedding, and parsed once into typed OrderRecord fields.
+    """
+    orders = []
+    seen = set()
+    for i, record in enumerate(split_order_records(content)):
+        match = re.search(r"Order number: (\d+)", record)
+        order_number = match.group(1) if match else None
+        key = order_number or f"#{i}"
+        if key in seen:
+            key = f"{key}#{i}"
+        seen.add(key)
+        parsed = parse_order_record(record)
+        fields = parsed.to_list() if parsed else None
+        orders.append(
+            (key, order_number, hash_text(record), record, split_by_order(record), fields)
+        )
+    return orders
+
+
+def parse_file_job(job):
+    """
+    Process-pool worker: read and parse one order file. Returns
+    (fname, file_hash, orders); orders is None when the file hash still
+    matches the manifest, so unchanged files are never re-parsed.
+    """
+    path, known_hash = job
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    fname = os.path.basename(path)
+    file_hash = hash_text(content)
+    if file_hash == known_hash:
+        return fname, file_hash, None
+    return fname, file_hash, parse_order_file(fname, content)
+
+
+def bounded_map(executor, fn, items, window):
+    """
+    Like executor.map, but keeps at most `window` tasks in flight so the input
+    iterator is consumed lazily. Results are yielded in input order.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class InlineExecutor:
+    """Executor stand-in that runs tasks in the calling process (workers=0)."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def load_manifest(store_dir):
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_current_store(store_dir=VECTORSTORE_DIR):
+    """
+    Returns (path, manifest) for the published generation, or None if there
+    is no store with a manifest to update incrementally. Its chunks and
+    orders are read back in batches by iter_store_chunks and iter_store_orders.
+    """
+    generation = read_generation(store_dir)
+    if generation is None:
+        return None
+    path = resolve_store_path(generation, store_dir)
+    if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return None
+    return path, load_manifest(path)
+
+
+def iter_store_orders(path, batch_size=EMBED_BATCH_SIZE):
+    """
+    Yields batches of (record, page_content, source) for the orders of a
+    published store, read from its mapped record store, or from the JSON
+    order index of stores written before the record store kept the order text.
+    """
+    if os.path.isdir(os.path.join(path, ORDER_RECORDS_DIR)):
+        records = OrderRecordStore(path)
+        if records.has_content:
+            for start in range(0, len(records), batch_size):
+                rows = range(start, min(start + batch_size, len(records)))
+                yield [(records.row(i), records.content(i), records.source(i)) for i in rows]
+            return
+    yield from batched(iter_order_entries(read_order_index(path)), batch_size)
+
+
+def iter_store_chunks(path, embeddings, batch_size=EMBED_BATCH_SIZE):
+    """
+    Yields (vectors, docs, ids) batches of the chunks of a published store, in
+    index order. Stores written by StoreWriter are read from their mapped
+    columns; legacy pickled stores are loaded whole.
+    """
+    if has_store(path):
+        vectors = load_vectors(path)
+        docstore = DocStore(path)
+        for start in range(0, len(docstore), batch_size):
+            docs = [
+                docstore.document(i) for i in range(start, min(start + batch_size, len(docstore)))
+            ]
+            yield vectors[start : start + len(docs)], docs, [doc.id for doc in docs]
+        return
+    legacy = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    n = legacy.index.ntotal
+    for start in range(0, n, batch_size):
+        count = min(batch_size, n - start)
+        ids = [legacy.index_to_docstore_id[i] for i in range(start, start + count)]
+        docs = [legacy.docstore.search(doc_id) for doc_id in ids]
+        yield legacy.index.reconstruct_n(start, count), docs, ids
+
+
+def diff_orders(parsed_files, manifest, writer, stale_ids, dropped_orders, progress):
+    """
+    Compare parsed order files against the manifest of per-file and per-order
+    content hashes and yield (text, metadata, id) for every chunk that needs
+    embedding. New or changed orders are added to writer file by file;
+    docstore ids that became stale are appended to stale_ids, and the
+    (order_number, source) of removed orders added to dropped_orders. The
+    manifest is updated in place as files stream past.
+    """
+    old_files = manifest["files"]
+    new_files = {}
+
+    for fname, file_hash, orders in parsed_files:
+        progress.files += 1
+        old = old_files.get(fname)
+        if orders is None:
+            new_files[fname] = old
+            continue
+
+        old_orders = old["orders"] if old else {}
+        new_orders = {}
+        entries = []
+        for key, order_number, record_hash, record, chunks, fields in orders:
+            progress.orders += 1
+            prev = old_orders.get(key)
+            if prev and prev["hash"] == record_hash:
+                new_orders[key] = prev
+                continue
+            if prev:
+                stale_ids.extend(prev["ids"])
+
+            chunk_ids = [f"{fname}:{key}:{record_hash[:16]}:{n}" for n in range(len(chunks))]
+            for chunk, chunk_id in zip(chunks, chunk_ids):
+                yield chunk, {"source": fname, "order_number": order_number}, chunk_id
+            new_orders[key] = {
+                "hash": record_hash,
+                "order_number": order_number,
+                "ids": chunk_ids,
+            }
+            if order_number and fields:
+                entries.append((OrderRecord.from_list(fields), record, fname))
+        if entries:
+            writer.add_orders(entries, NEW_ORDER_PRIORITY)
+
+        # Orders removed from a changed file
+        for key, prev in old_orders.items():
+            if key not in new_orders:
+                stale_ids.extend(prev["ids"])
+                dropped_orders.add((prev["order_number"], fname))
+        new_files[fname] = {"hash": file_hash, "orders": new_orders}
+
+    # Files deleted from the order directory
+    for fname, old in old_files.items():
+        if fname not in new_files:
+            for prev in old["orders"].values():
+                stale_ids.extend(prev["ids"])
+                dropped_orders.add((prev["order_number"], fname))
+
+    manifest["files"] = new_files
+
+
+def iter_order_entries(order_index):
+    """
+    (record, page_content, source) for each order in a legacy JSON order
+    index; typed records of entries from older stores are parsed here.
+    """
+    for entry in order_index.values():
+        if entry.get("record"):
+            record = OrderRecord.from_list(entry["record"])
+        else:
+            record = parse_order_record(entry["page_content"])
+        if record:
+            yield record, entry["page_content"], entry["metadata"]["source"]
+
+
+def batched(items, size):
+    """Group an iterator into lists of at most `size` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class IngestProgress:
+    """Counts ingest work and prints throughput every `interval` seconds."""
+
+    def __init__(self, interval=PROGRESS_INTERVAL):
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.files = 0
+        self.orders = 0
+        self.embeddings = 0
+
+    def rates(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return elapsed, self.files / elapsed, self.embeddings / elapsed
+
+    def maybe_report(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        elapsed, docs_per_sec, embeddings_per_sec = self.rates()
+        print(
+            f"[{elapsed:7.1f}s] {self.files} files, {self.orders} orders, "
+            f"{self.embeddings} chunks embedded "
+            f"({docs_per_sec:.1f} docs/sec, {embeddings_per_sec:.1f} embeddings/sec)"
+        )
+
+
+def main(
+    incremental=False,
+    workers=None,
+    batch_size=EMBED_BATCH_SIZE,
+    embed_concurrency=EMBED_CONCURRENCY,
+    order_dir=ORDER_DIR,
+    store_dir=VECTORSTORE_DIR,
+    embeddings=None,
+    index_type=FAISS_INDEX_TYPE,
+    params=None,
+    customer_shards=CUSTOMER_SHARDS,
+):
+    """
+    Build (or incrementally update) the store in store_dir from the order files
+    in order_dir and publish it as a new generation with an index of
+    index_type (see rag.faiss_store; params default to index_params()) and
+    the orders split into customer_shards per-customer shards.
+    Returns a summary dict, or None when there were no orders to store.
+    """
+    # 1. Stream the order .md files; nothing is read into memory up front
+    embeddings = embeddings or get_embeddings()
+
+    # 2. In incremental mode, start from the published store and its manifest
+    #    so only new or changed orders are embedded.
+    current = load_current_store(store_dir) if incremental else None
+    if incremental and current is None:
+        print("No existing store with a manifest found. Running a full ingest.")
+    previous, manifest = current or (None, {"files": {}})
+    known_hashes = {fname: entry["hash"] for fname, entry in manifest["files"].items()}
+
+    workers = os.cpu_count() if workers is None else workers
+    progress = IngestProgress()
+    stale_ids = []
+    dropped_orders = set()
+
+    # The new generation is written into its own directory as it is built and
+    # only published once complete (step 6).
+    generation, path = begin_generation(store_dir)
+    if previous is not None and has_store(previous):
+        meta = read_index_meta(previous)
+        writer = StoreWriter(path, meta["normalize_L2"], meta["distance_strategy"], previous)
+    else:
+        writer = StoreWriter(path)
+
+    try:
+        with (
+            ProcessPoolExecutor(max_workers=workers) if workers else InlineExecutor()
+        ) as parse_pool, ThreadPoolExecutor(max_workers=embed_concurrency) as embed_pool:
+            # 3. Parse files and split them into order chunks in a process pool.
+            #    Each record is split at "Order number:" for retrieval granularity.
+            jobs = (
+                (file_path, known_hashes.get(os.path.basename(file_path)))
+                for file_path in iter_markdown_files(order_dir)
+            )
+            parsed = bounded_map(parse_pool, parse_file_job, jobs, window=max(workers, 1) * 4)
+            chunks = diff_orders(parsed, manifest, writer, stale_ids, dropped_orders, progress)
+
+            # 4. Generate embeddings with OpenAI in fixed-size batches, with at most
+            #    `embed_concurrency` requests in flight. Chunks embedded before
+            #    (by ingest or the retriever) come from the disk cache.
+            def embed_batch(batch):
+                texts = [text for text, _, _ in batch]
+                return batch, embeddings.embed_documents(texts)
 
-    # 2. Split each document into chunks for better retrieval granularity
-    #    Here we use RecursiveCharacterTextSplitter from LangChain.
-    #    This splits text into ~500 character chunks with 50 character overlap.
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=50)
+            batches = batched(chunks, batch_size)
+            for batch, vectors in bounded_map(embed_pool, embed_batch, batches, embed_concurrency):
+                # 5. Write each batch to the generation's vectors and docs columns
+                #    as it arrives (diff_orders writes each file's orders the
+                #    same way), so no chunk or order text accumulates in memory.
+                writer.add(
+                    vectors,
+                    [text for text, _, _ in batch],
+                    [metadata for _, metadata, _ in batch],
+                    [chunk_id for _, _, chunk_id in batch],
+                )
+                progress.embeddings += len(batch)
+                progress.maybe_report()
 
-    all_chunks = []
-    metadatas = []
-    for fname, content in docs:
-        chunks = split_by_order(content)
-        all_chunks.extend(chunks)
-        for chunk in chunks:
-            match = re.search(r"Order number: (\d+)", chunk)
-            order_number = match.group(1) if match else None
-            metadatas.append({"source": fname, "order_number": order_number})
+        # Unchanged chunks and orders of the previous generation are copied
+        # over, minus the ones of changed or removed orders. Chunks keep their
+        # previous index positions so the index can be updated, not rebuilt.
+        if previous is not None:
+            stale = set(stale_ids)
+            position = 0
+            for vectors, docs, ids in iter_store_chunks(previous, embeddings, batch_size):
+                keep = [i for i, doc_id in enumerate(ids) if doc_id not in stale]
+                if keep:
+                    writer.add(
+                        np.asarray(vectors)[keep],
+                        [docs[i].page_content for i in keep],
+                        [docs[i].metadata for i in keep],
+                        [ids[i] for i in keep],
+                        previous_positions=[position + i for i in keep],
+                    )
+                position += len(ids)
+            for entries in iter_store_orders(previous, batch_size):
+                entries = [
+                    entry
+                    for entry in entries
+                    if (entry[0].order_number, entry[2]) not in dropped_orders
+                ]
+                if entries:
+                    writer.add_orders(entries)
+    except BaseException:
+        writer.close()
+        shutil.rmtree(path, ignore_errors=True)
+        raise
 
-    # 3. Generate embeddings for each chunk using OpenAI
-    embeddings = OpenAIEmbeddings()
+    if not writer.ntotal:
+        writer.close()
+        shutil.rmtree(path, ignore_errors=True)
+        print(f"No orders found in {order_dir}; nothing to store.")
+        return None
 
-    # 4. Create FAISS vectorstore and persist it to disk
-    #    This allows fast similarity search over the order data.
-    vectorstore = FAISS.from_texts(all_chunks, embeddings, metadatas=metadatas)
-    vectorstore.save_local(VECTORSTORE_DIR)
+    # 6. Finish the new generation (the index_type index, trained on all
+    #    vectors or, incrementally, a copy of the previous one with the stale
+    #    chunks removed and the new ones added; typed order records with their
+    #    text for exact order-number lookups, BM25 index over the records,
+    #    per-customer shards, manifest), then publish it atomically so running
+    #    retrievers hot-swap to it and never see a half-written store.
+    try:
+        index_meta = writer.finish(index_type, params, customer_shards)
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    write_json_atomic(manifest, os.path.join(path, MANIFEST_FILE))
+    write_generation(generation, store_dir)
+    prune_generations(store_dir)
 
-    print(f"Stored {len(all_chunks)} chunks in FAISS vectorstore at {VECTORSTORE_DIR}")
+    progress.maybe_report(force=True)
+    print(
+        f"Embedded {progress.embeddings} chunks, removed {len(stale_ids)} stale chunks; "
+        f"{index_meta['ntotal']} chunks, {index_meta['orders']} indexed orders and "
+        f"{index_meta['lexical_terms']} BM25 terms, {index_meta['customers']} customers "
+        f"in {customer_shards} shards at {path} (generation {generation}, "
+        f"{index_meta['factory']} index {'updated' if index_meta['index_updated'] else 'built'} "
+        f"in {index_meta['index_seconds']:.1f}s)"
+    )
+    if hasattr(embeddings, "stats"):
+        print(f"Embedding cache: {embeddings.stats()}")
+    return {
+        "generation": generation,
+        "path": path,
+        "embedded_chunks": progress.embeddings,
+        "removed_chunks": len(stale_ids),
+        "index_vectors": index_meta["ntotal"],
+        "indexed_orders": index_meta["orders"],
+        "index_type": index_meta["index_type"],
+        "index_factory": index_meta["factory"],
+        "index_updated": index_meta["index_updated"],
+        "index_seconds": round(index_meta["index_seconds"], 3),
+        "lexical_terms": index_meta["lexical_terms"],
+        "customers": index_meta["customers"],
+    }
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build the order vectorstore.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only embed new or changed orders and update the published store.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Parser processes (default: CPU count, 0 parses in-process).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=EMBED_BATCH_SIZE,
+        help="Chunks per embedding request and per index append.",
+    )
+    parser.add_argument(
+        "--embed-concurrency",
+        type=int,
+        default=EMBED_CONCURRENCY,
+        help="Maximum embedding requests in flight.",
+    )
+    parser.add_argument(
+        "--order-dir",
+        default=ORDER_DIR,
+        help="Directory of order .md files to ingest.",
+    )
+    parser.add_argument(
+        "--store-dir",
+        default=VECTORSTORE_DIR,
+        help="Vectorstore directory to publish generations into.",
+    )
+    parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default=FAISS_INDEX_TYPE,
+        help="FAISS index to build (default: FAISS_INDEX_TYPE or flat).",
+    )
+    parser.add_argument("--nlist", type=int, help="IVF clusters (0: about 4*sqrt(N)).")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW links per node.")
+    parser.add_argument("--ef-construction", type=int, help="HNSW build candidate list size.")
+    parser.add_argument("--pq-m", type=int, help="PQ sub-quantizers; must divide the embedding width.")
+    parser.add_argument("--pq-nbits", type=int, help="Bits per PQ sub-code.")
+    parser.add_argument(
+        "--customer-shards",
+        type=int,
+        default=CUSTOMER_SHARDS,
+        help="Shards the orders are split into by customer (username).",
+    )
+    args = parser.parse_args()
+    main(
+        incremental=args.incremental,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        embed_concurrency=args.embed_concurrency,
+        order_dir=args.order_dir,
+        store_dir=args.store_dir,
+        index_type=args.index_type,
+        customer_shards=args.customer_shards,
+        params=index_params(
+            nlist=args.nlist,
+            hnsw_m=args.hnsw_m,
+            ef_construction=args.ef_construction,
+            pq_m=args.pq_m,
+            pq_nbits=args.pq_nbits,
+        ),
+    )
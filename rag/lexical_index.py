@@ -0,0 +1,240 @@
+import calendar
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from rag.faiss_store import DocStore, has_store
+from rag.order_records import ColumnSpill, OrderRecordStore, open_npy
+
+LEXICAL_DIR = "lexical"
+# Postings handled per step when the spilled postings are laid out by term
+POSTINGS_CHUNK = 1 << 20
+
+# Okapi BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_MONTHS = [name.lower() for name in calendar.month_name]
+
+
+def tokenize(text):
+    """Lowercase alphanumeric runs; emails and addresses split at punctuation."""
+    return _TOKEN.findall(text.lower())
+
+
+def record_terms(text, delivery_date=None):
+    """
+    Terms of one order record. The delivery month and year are added as words
+    so "my earbuds from April" matches a "Delivery date: 2025-04-29" record.
+    """
+    terms = tokenize(text)
+    if delivery_date is not None:
+        terms += [_MONTHS[delivery_date.month], str(delivery_date.year)]
+    return terms
+
+
+class LexicalIndexWriter:
+    """
+    Builds the BM25 inverted index of a generation as orders stream in. Each
+    batch's postings are spilled to disk as (term id, entry, tf) columns, and
+    finish() scatters them into the per-term columns LexicalIndex maps, with
+    documents numbered by their OrderRecordStore row so metadata filters and
+    lexical scores share one row numbering. Only the vocabulary (one id per
+    distinct term) is kept in memory.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.path = os.path.join(store_dir, LEXICAL_DIR)
+        os.makedirs(self.path, exist_ok=True)
+        self.count = 0
+        self._vocabulary = {}
+        self._spills = {
+            name: ColumnSpill(os.path.join(self.path, f"{name}_spill"), dtype)
+            for name, dtype in (
+                ("terms", np.int32),
+                ("entries", np.int32),
+                ("tf", np.uint16),
+                ("lengths", np.int32),
+            )
+        }
+
+    def add(self, texts, delivery_dates):
+        """Appends the postings of a batch of orders; entries are numbered in add order."""
+        terms, entries, tfs, lengths = [], [], [], []
+        for text, delivery_date in zip(texts, delivery_dates):
+            counts = Counter(record_terms(text, delivery_date))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                terms.append(self._vocabulary.setdefault(term, len(self._vocabulary)))
+                entries.append(self.count)
+                tfs.append(tf)
+            self.count += 1
+        for name, values in (("terms", terms), ("entries", entries), ("tf", tfs), ("lengths", lengths)):
+            self._spills[name].add(values)
+
+    def close(self):
+        for spill in self._spills.values():
+            spill.close()
+
+    def finish(self, row_of_entry, rows):
+        """
+        Writes the index over `rows` record rows; row_of_entry is the row of
+        each added entry (-1 drops its postings), as OrderRecordWriter.finish
+        returns it. Call after the records and the docs/ columns are written.
+        Returns the number of terms.
+        """
+        vocabulary = list(self._vocabulary)
+        self._vocabulary = {}
+        spilled_terms = self._spills["terms"].values()
+        entries = self._spills["entries"].values()
+        spilled_tf = self._spills["tf"].values()
+
+        # Rank of every term id in sorted term order, then postings per term
+        by_term = sorted(range(len(vocabulary)), key=vocabulary.__getitem__)
+        rank = np.empty(len(vocabulary), dtype=np.int64)
+        rank[by_term] = np.arange(len(vocabulary))
+        counts = np.zeros(len(vocabulary), dtype=np.int64)
+        for start in range(0, len(entries), POSTINGS_CHUNK):
+            kept = row_of_entry[entries[start : start + POSTINGS_CHUNK]] >= 0
+            ranks = rank[spilled_terms[start : start + POSTINGS_CHUNK][kept]]
+            counts += np.bincount(ranks, minlength=len(vocabulary))
+        # Terms that only occur in replaced entries are dropped
+        used = counts > 0
+        terms = [vocabulary[term] for term, keep in zip(by_term, used.tolist()) if keep]
+        compact = np.cumsum(used) - 1
+        counts = counts[used]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        postings = (int(offsets[-1]),)
+        postings_rows = open_npy(os.path.join(self.path, "rows.npy"), np.int32, postings)
+        postings_tf = open_npy(os.path.join(self.path, "tf.npy"), np.uint16, postings)
+        cursor = offsets[:-1].copy()
+        for start in range(0, len(entries), POSTINGS_CHUNK):
+            chunk = slice(start, start + POSTINGS_CHUNK)
+            chunk_rows = row_of_entry[entries[chunk]]
+            kept = chunk_rows >= 0
+            chunk_terms = compact[rank[spilled_terms[chunk][kept]]]
+            order = np.argsort(chunk_terms, kind="stable")
+            chunk_terms = chunk_terms[order]
+            present, first, run = np.unique(chunk_terms, return_index=True, return_counts=True)
+            positions = cursor[chunk_terms] + np.arange(len(chunk_terms)) - np.repeat(first, run)
+            postings_rows[positions] = chunk_rows[kept][order]
+            postings_tf[positions] = spilled_tf[chunk][kept][order]
+            cursor[present] += run
+        # Entries were scattered in add order; put each term's postings in row order
+        term = 0
+        while term < len(terms):
+            end = max(term + 1, int(np.searchsorted(offsets, offsets[term] + POSTINGS_CHUNK, "right")) - 1)
+            lo, hi = offsets[term], offsets[end]
+            order = np.lexsort(
+                (postings_rows[lo:hi], np.repeat(np.arange(term, end), counts[term:end]))
+            )
+            postings_rows[lo:hi] = postings_rows[lo:hi][order]
+            postings_tf[lo:hi] = postings_tf[lo:hi][order]
+            term = end
+        for column in (postings_rows, postings_tf):
+            if isinstance(column, np.memmap):
+                column.flush()
+        del postings_rows, postings_tf
+
+        lengths = np.zeros(rows, dtype=np.int32)
+        kept = row_of_entry >= 0
+        lengths[row_of_entry[kept]] = self._spills["lengths"].values()[kept]
+        del spilled_terms, entries, spilled_tf
+        for spill in self._spills.values():
+            spill.discard()
+
+        columns = {
+            "terms": np.array([term.encode("utf-8") for term in terms], dtype=bytes),
+            "offsets": offsets,
+            "lengths": lengths,
+            "doc_rows": _doc_rows(OrderRecordStore(self.store_dir), self.store_dir),
+        }
+        for name, column in columns.items():
+            np.save(os.path.join(self.path, f"{name}.npy"), column, allow_pickle=False)
+        return len(terms)
+
+
+def _doc_rows(records, store_dir):
+    """Record row of each FAISS position's order (-1 for chunks without one)."""
+    if not has_store(store_dir):
+        return np.zeros(0, dtype=np.int32)
+    docs = DocStore(store_dir)
+    rows = np.full(len(docs), -1, dtype=np.int32)
+    for i in range(len(docs)):
+        order_number = docs.metadata(i).get("order_number")
+        row = records.find(order_number) if order_number else None
+        if row is not None:
+            rows[i] = row
+    return rows
+
+
+class LexicalIndex:
+    """
+    Read-only BM25 index over order records. Postings are memory-mapped; a
+    query touches only the postings of its own terms, restricted up front to
+    the rows a filter allows.
+    """
+
+    def __init__(self, store_dir):
+        path = os.path.join(store_dir, LEXICAL_DIR)
+
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+
+        self._terms = load("terms")
+        self._offsets = load("offsets")
+        self._rows = load("rows")
+        self._tf = load("tf")
+        self._lengths = load("lengths")
+        self.doc_rows = load("doc_rows")
+        self._avg_length = float(self._lengths.mean()) if len(self._lengths) else 0.0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    @property
+    def terms(self):
+        return len(self._terms)
+
+    def _postings(self, term):
+        key = term.encode("utf-8")
+        i = int(np.searchsorted(self._terms, key))
+        if i >= len(self._terms) or self._terms[i] != key:
+            return None
+        return self._rows[self._offsets[i] : self._offsets[i + 1]], self._tf[
+            self._offsets[i] : self._offsets[i + 1]
+        ]
+
+    def search(self, query, k=10, mask=None):
+        """
+        Top-k record rows by BM25 score for query, best first, as (rows, scores).
+        With a boolean mask over rows, only allowed rows are scored.
+        """
+        n = len(self._lengths)
+        hits, contributions = [], []
+        for term in set(tokenize(query)):
+            postings = self._postings(term)
+            if postings is None:
+                continue
+            rows, tf = postings
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            if mask is not None:
+                allowed = mask[rows]
+                rows, tf = rows[allowed], tf[allowed]
+            tf = tf.astype(np.float32)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[rows] / self._avg_length)
+            hits.append(rows)
+            contributions.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+        if not hits:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        rows, inverse = np.unique(np.concatenate(hits), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        top = np.argsort(-scores, kind="stable")[:k]
+        return rows[top], scores[top]
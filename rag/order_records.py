@@ -0,0 +1,538 @@
+import os
+import re
+import shutil
+from collections.abc import Mapping
+from datetime import date
+import numpy as np
+
+ORDER_RECORDS_DIR = "orders"
+# Strings gathered per write when a spilled string column is reordered, and
+# bytes of fixed-width values copied per step
+SPILL_CHUNK = 65536
+SPILL_BUFFER_BYTES = 64 << 20
+
+ORDER_FIELDS = (
+    "order_number",
+    "delivery_date",
+    "category",
+    "brand",
+    "is_prime",
+    "username",
+    "address",
+)
+
+# Field patterns for the order markdown format, compiled once
+FIELD_PATTERNS = {
+    "order_number": re.compile(r"Order number:\s*(\d+)"),
+    "delivery_date": re.compile(r"Delivery date:\s*(\d{4}-\d{2}-\d{2})"),
+    "category": re.compile(r"Product category:\s*(.+)"),
+    "brand": re.compile(r"Brand:\s*(.+)"),
+    "is_prime": re.compile(r"isPrime:\s*(true|false)", re.IGNORECASE),
+    "username": re.compile(r"username:\s*(\S+)"),
+}
+ADDRESS_PATTERN = re.compile(r"^(Street|Suite|City|Zipcode):\s*(.+)$", re.MULTILINE)
+
+# Uppercase ASCII bytes mapped to lowercase, for case-folding string columns
+_ASCII_LOWER = np.arange(256, dtype=np.uint8)
+_ASCII_LOWER[65:91] += 32
+
+
+def normalize_username(username):
+    """
+    The form usernames are compared in (customer shards, the username
+    filter, order ownership): stripped and lowercased.
+    """
+    return (username or "").strip().lower()
+
+
+class OrderRecord:
+    """
+    One order, parsed once at ingest time.
+    Callers read typed fields instead of re-running regexes over page_content.
+    """
+
+    __slots__ = ORDER_FIELDS
+
+    def __init__(
+        self,
+        order_number,
+        delivery_date=None,
+        category=None,
+        brand=None,
+        is_prime=None,
+        username=None,
+        address=None,
+    ):
+        self.order_number = order_number
+        self.delivery_date = delivery_date  # datetime.date or None
+        self.category = category
+        self.brand = brand
+        self.is_prime = is_prime  # True, False or None when not stated
+        self.username = username
+        self.address = address
+
+    def to_list(self):
+        """JSON-friendly form, used to carry parsed records through the ingest manifest."""
+        values = [getattr(self, field) for field in ORDER_FIELDS]
+        values[1] = self.delivery_date.isoformat() if self.delivery_date else None
+        return values
+
+    @classmethod
+    def from_list(cls, values):
+        values = list(values)
+        values[1] = date.fromisoformat(values[1]) if values[1] else None
+        return cls(*values)
+
+    def __eq__(self, other):
+        return isinstance(other, OrderRecord) and self.to_list() == other.to_list()
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in ORDER_FIELDS)
+        return f"OrderRecord({fields})"
+
+
+def parse_order_record(text):
+    """Parse one order's markdown into an OrderRecord, or None if it has no order number."""
+    values = {}
+    for field, pattern in FIELD_PATTERNS.items():
+        match = pattern.search(text)
+        values[field] = match.group(1).strip() if match else None
+    if not values["order_number"]:
+        return None
+
+    if values["delivery_date"]:
+        try:
+            values["delivery_date"] = date.fromisoformat(values["delivery_date"])
+        except ValueError:
+            values["delivery_date"] = None
+    if values["is_prime"] is not None:
+        values["is_prime"] = values["is_prime"].lower() == "true"
+    address = ", ".join(value.strip() for _, value in ADDRESS_PATTERN.findall(text))
+    return OrderRecord(address=address or None, **values)
+
+
+def encode_strings(values):
+    """
+    Pack optional strings into a utf-8 blob, offsets and a presence mask, the
+    string-column layout of the record store, docstore and customer shards.
+    """
+    encoded = [value.encode("utf-8") if value is not None else b"" for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    present = np.array([value is not None for value in values], dtype=bool)
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return blob, offsets, present
+
+
+def decode_string(blob, offsets, i):
+    """String i of a column written by encode_strings (blob and offsets may be memory-mapped)."""
+    return bytes(blob[offsets[i] : offsets[i + 1]]).decode("utf-8")
+
+
+def raw_to_npy(raw_path, path, dtype, shape):
+    """Puts an .npy header in front of a raw spill file, copying it without reading it into memory."""
+    header = {
+        "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        "fortran_order": False,
+        "shape": shape,
+    }
+    with open(path, "wb") as out, open(raw_path, "rb") as raw:
+        np.lib.format.write_array_header_1_0(out, header)
+        shutil.copyfileobj(raw, out)
+    os.remove(raw_path)
+
+
+def open_npy(path, dtype, shape):
+    """A new .npy file of the given shape, memory-mapped for writing (numpy cannot map an empty one)."""
+    if not np.prod(shape):
+        np.save(path, np.zeros(shape, dtype=dtype), allow_pickle=False)
+        return np.zeros(shape, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+class ColumnSpill:
+    """
+    One column of a store that is written batch by batch. Fixed-width values
+    (dtype given) are appended to <path>.raw; strings (dtype None) are appended
+    there as a utf-8 blob, and only their offsets and presence mask (9 bytes
+    per value) stay in memory. finish() turns the spill into the column's .npy
+    files, in add order or reordered, without loading the spilled data.
+    """
+
+    def __init__(self, path, dtype=None):
+        self.path = path
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self.shape = ()  # shape of one fixed-width value, set by add()
+        self.count = 0
+        self._raw = open(f"{path}.raw", "wb")
+        self._offsets = [np.zeros(1, dtype=np.int64)]
+        self._present = []
+
+    def add(self, values):
+        if self.dtype is None:
+            blob, offsets, present = encode_strings(values)
+            self._raw.write(blob.tobytes())
+            self._offsets.append(offsets[1:] + self._offsets[-1][-1])
+            self._present.append(present)
+            self.count += len(present)
+        else:
+            values = np.ascontiguousarray(values, dtype=self.dtype)
+            self.shape = values.shape[1:]
+            self._raw.write(values.tobytes())
+            self.count += len(values)
+
+    def values(self):
+        """The fixed-width values spilled so far, memory-mapped read-only."""
+        if not self._raw.closed:
+            self._raw.flush()
+        if not self.count:
+            return np.zeros((0, *self.shape), dtype=self.dtype)
+        return np.memmap(self._raw.name, dtype=self.dtype, mode="r", shape=(self.count, *self.shape))
+
+    def close(self):
+        self._raw.close()
+
+    def discard(self):
+        """Closes and deletes the spill, for columns finished by the caller from values()."""
+        self.close()
+        if os.path.exists(self._raw.name):
+            os.remove(self._raw.name)
+
+    def finish(self, order=None, present=True):
+        """
+        Writes <path>.npy (fixed-width) or <path>_blob, _offsets and, with
+        present, _present.npy (strings); in `order` (spill indexes) if given.
+        """
+        self.close()
+        raw = self._raw.name
+        if self.dtype is not None:
+            if order is None:
+                raw_to_npy(raw, f"{self.path}.npy", self.dtype, (self.count, *self.shape))
+                return
+            values = self.values()
+            out = open_npy(f"{self.path}.npy", self.dtype, (len(order), *self.shape))
+            step = max(1, SPILL_BUFFER_BYTES // max(values[:1].nbytes, 1))
+            for start in range(0, len(order), step):
+                out[start : start + step] = values[order[start : start + step]]
+            if isinstance(out, np.memmap):
+                out.flush()
+            del values, out
+            os.remove(raw)
+            return
+        offsets = np.concatenate(self._offsets)
+        mask = np.concatenate(self._present) if self._present else np.zeros(0, dtype=bool)
+        self._offsets = self._present = None
+        if order is not None:
+            offsets, mask = _reorder_blob(raw, offsets, order), mask[order]
+        raw_to_npy(raw, f"{self.path}_blob.npy", np.uint8, (int(offsets[-1]),))
+        np.save(f"{self.path}_offsets.npy", offsets, allow_pickle=False)
+        if present:
+            np.save(f"{self.path}_present.npy", mask, allow_pickle=False)
+
+
+def _reorder_blob(raw, offsets, order):
+    """Rewrites the string blob in raw with its strings in `order`; returns their offsets."""
+    with open(f"{raw}.tmp", "wb") as out:
+        if offsets[-1]:
+            blob = np.memmap(raw, dtype=np.uint8, mode="r")
+            for start in range(0, len(order), SPILL_CHUNK):
+                chunk = order[start : start + SPILL_CHUNK]
+                out.write(
+                    b"".join(
+                        blob[lo:hi].tobytes()
+                        for lo, hi in zip(offsets[chunk].tolist(), offsets[chunk + 1].tolist())
+                    )
+                )
+            del blob
+    os.replace(f"{raw}.tmp", raw)
+    reordered = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(np.diff(offsets)[order], out=reordered[1:])
+    return reordered
+
+
+# Record-store columns spilled by OrderRecordWriter, with their dtype (None: strings)
+_SPILLED_COLUMNS = {
+    "delivery_date": "datetime64[D]",
+    "is_prime": np.int8,
+    "category_codes": np.int32,
+    "brand_codes": np.int32,
+    "username": None,
+    "address": None,
+    "content": None,
+    "source": None,
+}
+
+
+class OrderRecordWriter:
+    """
+    Writes the record store of a generation as orders stream in. Every column
+    (typed fields, order text, source file) is spilled to disk per batch, and
+    finish() sorts the rows by order number into the columns OrderRecordStore
+    maps, so only the order numbers stay in memory. When an order number is
+    added more than once, the entry with the highest priority wins, then the
+    latest one.
+    """
+
+    def __init__(self, store_dir):
+        self.path = os.path.join(store_dir, ORDER_RECORDS_DIR)
+        os.makedirs(self.path, exist_ok=True)
+        self._keys = []
+        self._priority = []
+        # Category and brand are dictionary-encoded: label -> code in first-seen order
+        self._labels = {"category": {}, "brand": {}}
+        self._columns = {
+            name: ColumnSpill(os.path.join(self.path, name), dtype)
+            for name, dtype in _SPILLED_COLUMNS.items()
+        }
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, entries, priority=0):
+        """Appends a batch of (record, page_content, source) entries."""
+        records = [record for record, _, _ in entries]
+        self._keys.extend(record.order_number.encode("ascii") for record in records)
+        self._priority.append(np.full(len(records), priority, dtype=np.int8))
+        columns = self._columns
+        columns["delivery_date"].add([record.delivery_date or "NaT" for record in records])
+        columns["is_prime"].add(
+            [-1 if record.is_prime is None else int(record.is_prime) for record in records]
+        )
+        for field, labels in self._labels.items():
+            values = (getattr(record, field) for record in records)
+            columns[f"{field}_codes"].add(
+                [-1 if value is None else labels.setdefault(value, len(labels)) for value in values]
+            )
+        for field in ("username", "address"):
+            columns[field].add([getattr(record, field) for record in records])
+        columns["content"].add([content for _, content, _ in entries])
+        columns["source"].add([source for _, _, source in entries])
+
+    def close(self):
+        for column in self._columns.values():
+            column.close()
+
+    def finish(self):
+        """
+        Writes the columns sorted by order number. Returns the row of every
+        added entry, in add order, with -1 for entries another one replaced.
+        """
+        width = max((len(key) for key in self._keys), default=1)
+        keys = np.array(self._keys, dtype=f"S{width}")
+        self._keys = []
+        priority = np.concatenate(self._priority) if self._priority else np.zeros(0, dtype=np.int8)
+        # Stable sorts by priority, then order number: the last entry of each run wins
+        order = np.argsort(priority, kind="stable")
+        order = order[np.argsort(keys[order], kind="stable")]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = keys[order[1:]] != keys[order[:-1]]
+        order = order[last]
+        row_of_entry = np.full(len(keys), -1, dtype=np.int32)
+        row_of_entry[order] = np.arange(len(order), dtype=np.int32)
+        np.save(os.path.join(self.path, "order_number.npy"), keys[order], allow_pickle=False)
+        del keys
+
+        for field, labels in self._labels.items():
+            spill = self._columns.pop(f"{field}_codes")
+            codes = np.array(spill.values()[order])
+            spill.discard()
+            # Keep the labels of the surviving rows, sorted, and renumber the codes
+            names = list(labels)
+            used = np.unique(codes[codes >= 0])
+            sorted_labels = sorted(names[code] for code in used)
+            lookup = {label: code for code, label in enumerate(sorted_labels)}
+            remap = np.full(len(names) + 1, -1, dtype=np.int32)
+            for code in used:
+                remap[code] = lookup[names[code]]
+            np.save(os.path.join(self.path, f"{field}_codes.npy"), remap[codes], allow_pickle=False)
+            np.save(
+                os.path.join(self.path, f"{field}_labels.npy"),
+                np.array(sorted_labels, dtype=str),
+                allow_pickle=False,
+            )
+        for column in self._columns.values():
+            column.finish(order)
+        return row_of_entry
+
+
+class OrderRecordStore:
+    """
+    Read-only columnar order store. Columns are memory-mapped, so opening the
+    store is cheap and worker processes share one page-cached copy.
+    """
+
+    def __init__(self, store_dir):
+        path = os.path.join(store_dir, ORDER_RECORDS_DIR)
+
+        def load(name, mmap=True):
+            return np.load(
+                os.path.join(path, f"{name}.npy"),
+                mmap_mode="r" if mmap else None,
+                allow_pickle=False,
+            )
+
+        self._keys = load("order_number")
+        self._dates = load("delivery_date")
+        self._is_prime = load("is_prime")
+        self._labels = {}
+        self._codes = {}
+        for field in ("category", "brand"):
+            self._labels[field] = load(f"{field}_labels", mmap=False).tolist()
+            self._codes[field] = load(f"{field}_codes")
+        fields = ["username", "address"]
+        # Stores written before the order text was kept here have no content/source
+        if os.path.exists(os.path.join(path, "content_blob.npy")):
+            fields += ["content", "source"]
+        self._strings = {
+            field: (load(f"{field}_blob"), load(f"{field}_offsets"), load(f"{field}_present"))
+            for field in fields
+        }
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, order_number):
+        return self.find(order_number) is not None
+
+    def find(self, order_number):
+        """Row of an order number, or None."""
+        key = str(order_number).encode("ascii", "ignore")
+        i = int(np.searchsorted(self._keys, key))
+        if i < len(self._keys) and self._keys[i] == key:
+            return i
+        return None
+
+    def get(self, order_number):
+        """Returns the OrderRecord for an order number, or None."""
+        i = self.find(order_number)
+        return self.row(i) if i is not None else None
+
+    def order_number(self, i):
+        return self._keys[i].decode("ascii")
+
+    @property
+    def has_content(self):
+        """True if the store keeps each order's full text (for exact lookups)."""
+        return "content" in self._strings
+
+    def content(self, i):
+        """The full order text at row i ("" for stores without it)."""
+        return (self._string("content", i) or "") if self.has_content else ""
+
+    def source(self, i):
+        """The order file row i was read from (None for stores without it)."""
+        return self._string("source", i) if self.has_content else None
+
+    def document(self, i):
+        """The order at row i as the Document exact lookups and hybrid search return."""
+        from langchain_core.documents import Document
+
+        order_number = self.order_number(i)
+        return Document(
+            page_content=self.content(i),
+            metadata={"source": self.source(i), "order_number": order_number},
+        )
+
+    def mask(
+        self,
+        order_number=None,
+        username=None,
+        category=None,
+        delivered_after=None,
+        delivered_before=None,
+    ):
+        """
+        Boolean array over rows for the orders matching every given filter
+        (category case-insensitively, delivery dates inclusive), or None when
+        no filter is given. Evaluated on the columns, without building records.
+        """
+        mask = None
+
+        def narrow(selected):
+            nonlocal mask
+            mask = selected if mask is None else mask & selected
+
+        if order_number is not None:
+            selected = np.zeros(len(self), dtype=bool)
+            i = self.find(order_number)
+            if i is not None:
+                selected[i] = True
+            narrow(selected)
+        if category is not None:
+            labels = self._labels["category"]
+            codes = [code for code, label in enumerate(labels) if label.lower() == category.lower()]
+            narrow(np.isin(self._codes["category"], codes))
+        if delivered_after is not None:
+            narrow(self._dates >= np.datetime64(delivered_after, "D"))
+        if delivered_before is not None:
+            narrow(self._dates <= np.datetime64(delivered_before, "D"))
+        if username is not None:
+            narrow(self._username_equals(username, mask))
+        return mask
+
+    def _username_equals(self, username, within=None):
+        """
+        Rows whose username equals username under normalize_username,
+        checking only rows in within. ASCII names (emails) are case-folded
+        on the column bytes; others are decoded and normalized row by row.
+        """
+        blob, offsets, present = self._strings["username"]
+        value = normalize_username(username)
+        key = np.frombuffer(value.encode("utf-8"), dtype=np.uint8)
+        candidates = present & (True if within is None else within)
+        selected = np.zeros(len(self), dtype=bool)
+        if not value.isascii():
+            for i in np.flatnonzero(candidates):
+                selected[i] = normalize_username(decode_string(blob, offsets, i)) == value
+            return selected
+        candidates = np.flatnonzero((np.diff(offsets) == len(key)) & candidates)
+        if len(candidates):
+            chars = _ASCII_LOWER[blob[offsets[candidates][:, None] + np.arange(len(key))]]
+            selected[candidates[(chars == key).all(axis=1)]] = True
+        return selected
+
+    def row(self, i):
+        delivery_date = self._dates[i]
+        is_prime = int(self._is_prime[i])
+        return OrderRecord(
+            order_number=self._keys[i].decode("ascii"),
+            delivery_date=None if np.isnat(delivery_date) else delivery_date.item(),
+            category=self._label("category", i),
+            brand=self._label("brand", i),
+            is_prime=None if is_prime < 0 else bool(is_prime),
+            username=self._string("username", i),
+            address=self._string("address", i),
+        )
+
+    def _label(self, field, i):
+        code = int(self._codes[field][i])
+        return self._labels[field][code] if code >= 0 else None
+
+    def _string(self, field, i):
+        blob, offsets, present = self._strings[field]
+        if not present[i]:
+            return None
+        return decode_string(blob, offsets, i)
+
+
+class OrderDocuments(Mapping):
+    """
+    order_number -> Document view over an OrderRecordStore that keeps the
+    order text. Lookups are a binary search in the mapped columns; a Document
+    is only built on a hit.
+    """
+
+    def __init__(self, records):
+        self.records = records
+
+    def __getitem__(self, order_number):
+        i = self.records.find(order_number)
+        if i is None:
+            raise KeyError(order_number)
+        return self.records.document(i)
+
+    def __iter__(self):
+        return (self.records.order_number(i) for i in range(len(self.records)))
+
+    def __len__(self):
+        return len(self.records)
@@ -1,46 +1,263 @@
+import logging
 import os
+import sys
 from dotenv import load_dotenv
 import re
+import numpy as np
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 load_dotenv()  # Ensure .env is loaded
 
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from observability.metrics import FAISS_SEARCH_SECONDS, timed
+from rag.faiss_store import search_with_ids
+from rag.lexical_index import tokenize
+from rag.order_records import normalize_username, parse_order_record
+from rag.vectorstore_manager import VECTORSTORE_DIR, get_vectorstore_manager
 
-VECTORSTORE_DIR = "rag/vectorstore"
+logger = logging.getLogger(__name__)
+
+# Orders each ranking (BM25, vector) contributes to the fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+# Reciprocal rank fusion damping: score = sum(1 / (RRF_K + rank))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Filtered vector search scores up to this many allowed chunks exactly from
+# the memory-mapped vectors; larger sets go through the index with a selector.
+FILTERED_EXACT_LIMIT = int(os.getenv("FILTERED_EXACT_LIMIT", "4096"))
+
+# Metadata pre-filters accepted by hybrid_search and query_order_info
+FILTERS = ("order_number", "username", "category", "delivered_after", "delivered_before")
+ORDER_NUMBER = re.compile(r"(?<!\d)\d{6,}(?!\d)")
 
 
 def load_vectorstore():
     """
-    Loads the FAISS vectorstore from disk.
-    Returns the vectorstore object directly to allow multiple query strategies.
+    Returns the shared FAISS vectorstore.
+    The store is loaded from disk once per process and hot-swapped when
+    ingest publishes a new generation, so repeated lookups stay warm.
     """
-    embeddings = OpenAIEmbeddings()
+    return get_vectorstore_manager().get()
 
-    try:
-        # Load the persisted FAISS vectorstore
-        vectorstore = FAISS.load_local(
-            VECTORSTORE_DIR, embeddings, allow_dangerous_deserialization=True
-        )
-        return vectorstore  # Return the vectorstore itself
-    except Exception as e:
-        print(f"Error loading vectorstore: {e}")
+
+def lookup_order_number(order_number):
+    """
+    Exact lookup of an order number: a binary search in the memory-mapped
+    order records written by ingest; the Document is built only on a hit.
+    Returns (found, docs); found is None when no index is available so the
+    caller can fall back to vector search.
+    """
+    order_index = get_vectorstore_manager().get_order_index()
+    if order_index is None:
+        return None, []
+    doc = order_index.get(order_number)
+    return (True, [doc]) if doc else (False, [])
+
+
+def get_order_record(order_number):
+    """
+    Returns the typed OrderRecord (delivery date, category, brand, ...) for an
+    order number, or None if it is unknown or the store has no record columns.
+    """
+    store = get_vectorstore_manager().get_order_records()
+    if store is None or not order_number:
         return None
+    return store.get(order_number)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuses ranked lists of ids; an id ranked well by several lists wins."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+def dense_ranking(vectorstore, doc_rows, query, limit, mask=None, vectors=None):
+    """
+    Order record rows ranked by their best chunk's similarity to query. With a
+    row mask, only chunks of allowed orders are scored: exactly from vectors
+    when few enough, otherwise by an index search with an id selector.
+    """
+    import faiss
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    vector = np.asarray([vectorstore.embeddings.embed_query(query)], dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(vector)
+    if mask is None:
+        allowed = None
+        total = vectorstore.index.ntotal
+    else:
+        # Chunks without an order (row -1) index the trailing False
+        allowed = np.flatnonzero(np.append(mask, False)[doc_rows])
+        if not len(allowed):
+            return []
+        total = len(allowed)
+        if vectors is not None and total <= FILTERED_EXACT_LIMIT:
+            candidates = np.asarray(vectors[allowed], dtype=np.float32)
+            if vectorstore.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+                scores = candidates @ vector[0]
+            else:
+                scores = -((candidates - vector[0]) ** 2).sum(axis=1)
+            positions = allowed[np.argsort(-scores, kind="stable")]
+            return _distinct_rows(positions, doc_rows)[:limit].tolist()
+
+    # An order has one or more chunks, so `limit` orders need at least that
+    # many chunks; search again with twice as many while chunks of the same
+    # orders leave fewer than `limit` distinct ones
+    fetch = min(limit * 2, total)
+    while True:
+        with timed(FAISS_SEARCH_SECONDS, queries=1):
+            if allowed is None:
+                _, positions = vectorstore.index.search(vector, fetch)
+            else:
+                _, positions = search_with_ids(vectorstore.index, vector, fetch, allowed)
+        rows = _distinct_rows(positions[0], doc_rows)
+        if len(rows) >= limit or fetch >= total:
+            return rows[:limit].tolist()
+        fetch = min(fetch * 2, total)
 
 
-def query_order_info(query, k=1):
+def _distinct_rows(positions, doc_rows):
+    """Order rows of ranked chunk positions, each order once, best first."""
+    positions = positions[positions >= 0]
+    rows = np.asarray(doc_rows[positions])
+    rows = rows[rows >= 0]
+    _, first = np.unique(rows, return_index=True)
+    return rows[np.sort(first)]
+
+
+def hybrid_search(query, k=5, **filters):
+    """
+    Orders matching a free-text query: BM25 over the order records and vector
+    search over their chunks, fused with reciprocal rank fusion. Filters
+    (order_number, username, category, delivered_after, delivered_before)
+    restrict both rankings before anything is scored. With filters and no
+    query terms, returns the first k matching orders.
+
+    Returns the full order Documents, or None when the store has no lexical
+    index so the caller can fall back to vector search alone.
+    """
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filters {sorted(unknown)}; expected some of {FILTERS}")
+    # Every artifact comes from one snapshot, so a lookup that races a reload
+    # never mixes rows of one generation with documents of another
+    snapshot = get_vectorstore_manager().snapshot()
+    if snapshot is None:
+        return None
+    lexical = snapshot.lexical_index
+    records = snapshot.order_records
+    order_index = snapshot.order_index
+    if lexical is None or records is None or order_index is None:
+        return None
+
+    mask = records.mask(**{name: value for name, value in filters.items() if value is not None})
+    if mask is not None and not mask.any():
+        return []
+    if not tokenize(query):
+        rows = np.flatnonzero(mask)[:k].tolist() if mask is not None else []
+    else:
+        rankings = [lexical.search(query, HYBRID_CANDIDATES, mask)[0].tolist()]
+        vectorstore = snapshot.vectorstore
+        if vectorstore is not None and len(lexical.doc_rows):
+            try:
+                rankings.append(
+                    dense_ranking(
+                        vectorstore,
+                        lexical.doc_rows,
+                        query,
+                        HYBRID_CANDIDATES,
+                        mask,
+                        snapshot.vectors,
+                    )
+                )
+            except Exception as e:
+                logger.error("Vector search failed, ranking by BM25 only: %s", e)
+        rows = reciprocal_rank_fusion(rankings)[:k]
+
+    if records.has_content:
+        return [records.document(row) for row in rows]
+    docs = [order_index.get(records.order_number(row)) for row in rows]
+    return [doc for doc in docs if doc is not None]
+
+
+def _owner(doc):
+    record = parse_order_record(doc.page_content)
+    return normalize_username(record.username) if record else ""
+
+
+def query_customer_orders(username, query="", k=1):
+    """
+    Orders of one customer, searched only among that customer's orders in
+    their shard. An order number in query must be one of theirs; other text
+    ranks their orders by vector similarity.
+    """
+    snapshot = get_vectorstore_manager().snapshot()
+    shards = snapshot.customer_shards if snapshot is not None else None
+    if shards is None:
+        # Stores written before customer shards: search all orders, keep theirs
+        docs = query_order_info(query, k=max(k, 5))
+        return [doc for doc in docs if _owner(doc) == normalize_username(username)][:k]
+
+    mentioned = ORDER_NUMBER.search(query)
+    if mentioned:
+        docs = shards.orders(username)
+        return [doc for doc in docs if doc.metadata.get("order_number") == mentioned.group(0)][:k]
+    vector = None
+    vectorstore = snapshot.vectorstore if tokenize(query) else None
+    if vectorstore is not None:
+        try:
+            import faiss
+
+            vector = np.asarray([vectorstore.embeddings.embed_query(query)], dtype=np.float32)
+            if vectorstore._normalize_L2:
+                faiss.normalize_L2(vector)
+            vector = vector[0]
+        except Exception as e:
+            logger.error("Could not embed query, returning orders unranked: %s", e)
+            vector = None
+    return shards.orders(username, vector, k)
+
+
+def query_order_info(query, k=1, **filters):
     """
     Given a user query, returns the most relevant order info.
-    Uses advanced search strategies to improve retrieval quality.
+    Order numbers are resolved through the exact index without any embedding
+    call; free-text queries go through hybrid BM25 + vector search, restricted
+    by any metadata filters (see hybrid_search).
     """
-    # Print debug information
-    print(f"Searching for order: {query}")
+    logger.debug("Searching for order: %s", query)
+
+    # Bare order numbers ("9823417654", "Order number: 9823417654", "order #...")
+    numeric = re.fullmatch(
+        r"\s*(?:order\s*(?:number)?\s*[:#]?\s*)?(\d{6,})\s*", query, re.IGNORECASE
+    )
+    if numeric and not filters:
+        found, docs = lookup_order_number(numeric.group(1))
+        if found is not None:
+            if found:
+                logger.debug("Found exact match for order %s", query)
+            else:
+                logger.debug("Order %s is not in the order index", query)
+            return docs
 
-    # Load the vectorstore
+    # An order number inside a sentence ("return order 9823417654 please")
+    # narrows the search to that order
+    mentioned = ORDER_NUMBER.search(query)
+    if mentioned and filters.get("order_number") is None:
+        filters["order_number"] = mentioned.group(0)
+    docs = hybrid_search(query, k, **filters)
+    if docs is not None:
+        logger.debug("Hybrid search returned %d orders", len(docs))
+        return docs
+
+    # Stores without a lexical index: vector search over query variations
+    if filters:
+        logger.warning("Store has no lexical index; ignoring filters %s", filters)
     vectorstore = load_vectorstore()
     if not vectorstore:
-        print("Failed to load vectorstore")
+        logger.error("Failed to load vectorstore")
         return []
 
     # Try various query formulations to find the best match
@@ -52,56 +269,71 @@ def query_order_info(query, k=1):
         f"Customer order {query}",  # Another variation
     ]
 
-    # Track all results to avoid duplicates
-    seen = set()
-    all_results = []
+    try:
+        # All variations are embedded and searched in one round-trip each
+        results = batched_similarity_search(vectorstore, query_variations, k=5)
+    except Exception as e:
+        logger.error("Error querying with %d variations: %s", len(query_variations), e)
+        return []
 
-    # First try each query variation
-    for variation in query_variations:
-        print(f"Trying query: '{variation}'")
-        try:
-            # Use a reasonable k to avoid processing too many documents
-            results = vectorstore.similarity_search(variation, k=5)
-
-            if results:
-                print(f"Found {len(results)} results for '{variation}'")
-
-                # Process each document
-                for doc in results:
-                    # Check for exact match first
-                    if f"Order number: {query}" in doc.page_content:
-                        print(f"✓ Found exact match for order {query}")
-                        # Try to extract delivery date
-                        delivery_match = re.search(
-                            r"Delivery date: (\d{4}-\d{2}-\d{2})", doc.page_content
-                        )
-                        if delivery_match:
-                            delivery_date = delivery_match.group(1)
-                            print(f"✓ Found delivery date: {delivery_date}")
-                        else:
-                            print("✗ No delivery date found in document")
-
-                        return [doc]  # Return immediately on exact match
-
-                    # Otherwise add to collected results if not seen before
-                    content_hash = hash(doc.page_content)
-                    if content_hash not in seen:
-                        seen.add(content_hash)
-                        all_results.append(doc)
+    if not results:
+        logger.debug("No results found for any query variation.")
+        return []
+    logger.debug(
+        "Found %d unique results across %d variations", len(results), len(query_variations)
+    )
 
-        except Exception as e:
-            print(f"Error querying with '{variation}': {e}")
+    # Check the merged ranking for an exact match first
+    for doc in results:
+        if f"Order number: {query}" in doc.page_content:
+            logger.debug("Found exact match for order %s", query)
+            return [doc]  # Return immediately on exact match
+
+    logger.debug("No exact match found. Returning top %d most similar documents.", k)
+    return results[:k]
+
+
+def batched_similarity_search(vectorstore, queries, k=5):
+    """
+    Embeds all queries in a single embed_documents request, runs one FAISS
+    search over the stacked query matrix and returns the union of hits,
+    deduplicated by index id and ordered by each document's best score.
+    """
+    # Already loaded with the vectorstore; imported here to keep startup lean
+    import faiss
+    from langchain_community.vectorstores.utils import DistanceStrategy
 
-    # If we got here, no exact match was found
-    if all_results:
-        print(f"No exact match found. Returning top {k} most similar documents.")
-        return all_results[:k]
+    vectors = np.asarray(vectorstore.embeddings.embed_documents(queries), dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(vectors)
+    with timed(FAISS_SEARCH_SECONDS, queries=len(queries)):
+        distances, ids = vectorstore.index.search(vectors, k)
 
-    print("No results found for any query variation.")
-    return []
+    ids = ids.ravel()
+    scores = distances.ravel()
+    # FAISS returns distances for L2 indexes (lower is better) and similarities
+    # for inner-product indexes (higher is better); rank both as "higher is better".
+    if vectorstore.distance_strategy != DistanceStrategy.MAX_INNER_PRODUCT:
+        scores = -scores
+    valid = ids >= 0
+    ids, scores = ids[valid], scores[valid]
+
+    # Best hit per id: sort by score, keep the first occurrence of each id
+    order = np.argsort(-scores, kind="stable")
+    ranked_ids = ids[order]
+    _, first = np.unique(ranked_ids, return_index=True)
+    ranked_ids = ranked_ids[np.sort(first)]
+
+    return [
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(i)])
+        for i in ranked_ids
+    ]
 
 
 if __name__ == "__main__":
+    from observability.logs import configure_logging
+
+    configure_logging(level="DEBUG")
     # Example manual test with diagnostics
     test_order = "9345018724"
     print(f"==== TESTING RETRIEVAL FOR ORDER {test_order} ====")
@@ -122,3 +354,5 @@ if __name__ == "__main__":
             if match:
                 found_order = match.group(1)
                 print(f"  Found order number: {found_order} instead")
+
+    print(f"\nVectorstore stats: {get_vectorstore_manager().stats()}")
@@ -0,0 +1,182 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from rag.customer_shards import CUSTOMER_SHARDS, write_customer_shards
+from rag.faiss_store import (
+    DOCSTORE_DIR,
+    FAISS_INDEX_TYPE,
+    INDEX_FILE,
+    INDEX_META_FILE,
+    VECTORS_FILE,
+    build_index,
+    has_store,
+    load_vectors,
+    read_index_meta,
+    update_index,
+)
+from rag.lexical_index import LexicalIndexWriter
+from rag.order_records import ColumnSpill, OrderRecordWriter
+
+
+class StoreWriter:
+    """
+    Writes a store generation batch by batch, as ingest produces it, so
+    neither the chunks nor the orders of the corpus are held in memory:
+    add() appends embedded chunks (vectors to vectors.npy, documents to the
+    docs/ columns with the docstore ids), and add_orders() appends parsed
+    orders to the spilled record store (typed fields plus the order text and
+    source file for exact lookups) and their BM25 postings. finish() builds
+    the FAISS index from the memory-mapped vectors, sorts the records by
+    order number, lays the postings out by term and writes the customer
+    shards.
+
+    For an incremental ingest, `previous` is the published generation being
+    updated. Chunks carried over from it are added with their positions in
+    its index; they are laid out first, in their old order, followed by the
+    new chunks, so finish() can update a copy of the previous index (see
+    faiss_store.update_index) instead of rebuilding it.
+    """
+
+    def __init__(
+        self,
+        store_dir,
+        normalize_L2=False,
+        distance_strategy="EUCLIDEAN_DISTANCE",
+        previous=None,
+    ):
+        self.store_dir = store_dir
+        self.normalize_L2 = normalize_L2
+        self.distance_strategy = distance_strategy
+        self.previous = previous
+        docs_dir = os.path.join(store_dir, DOCSTORE_DIR)
+        os.makedirs(docs_dir, exist_ok=True)
+        self._docs_dir = docs_dir
+        self._vectors = ColumnSpill(
+            os.path.join(store_dir, os.path.splitext(VECTORS_FILE)[0]), np.float32
+        )
+        self._docs = {name: ColumnSpill(os.path.join(docs_dir, name)) for name in ("content", "metadata")}
+        # Docstore ids are small; they stay in memory until finish() sorts them
+        self._ids = []
+        # (first chunk, positions in the previous index) of each carried-over batch
+        self._carried = []
+        self._records = OrderRecordWriter(store_dir)
+        self._lexical = LexicalIndexWriter(store_dir)
+
+    @property
+    def ntotal(self):
+        """Chunks added so far."""
+        return self._vectors.count
+
+    def add(self, vectors, texts, metadatas, ids, previous_positions=None):
+        """
+        Appends one batch of chunks. Chunks carried over from the previous
+        generation pass their positions in its index as previous_positions.
+        """
+        if previous_positions is not None:
+            self._carried.append((self.ntotal, np.asarray(previous_positions, dtype=np.int64)))
+        vectors = np.array(vectors, dtype=np.float32)
+        if self.normalize_L2:
+            import faiss
+
+            faiss.normalize_L2(vectors)
+        self._vectors.add(vectors)
+        self._docs["content"].add(texts)
+        self._docs["metadata"].add([json.dumps(metadata, ensure_ascii=False) for metadata in metadatas])
+        self._ids.extend(doc_id.encode("utf-8") for doc_id in ids)
+
+    def add_orders(self, entries, priority=0):
+        """
+        Appends one batch of (record, page_content, source) orders. An order
+        number added again replaces the earlier entry unless that one was
+        added with a higher priority.
+        """
+        self._records.add(entries, priority)
+        self._lexical.add(
+            [content for _, content, _ in entries],
+            [record.delivery_date for record, _, _ in entries],
+        )
+
+    def close(self):
+        for spill in (self._vectors, *self._docs.values()):
+            spill.close()
+        self._records.close()
+        self._lexical.close()
+
+    def finish(self, index_type=FAISS_INDEX_TYPE, params=None, customer_shards=CUSTOMER_SHARDS):
+        """
+        Completes the generation: the vectors and docs/ columns, the
+        index_type index (an updated copy of the previous one when possible,
+        otherwise built from the mapped vectors) with index.json, the record
+        store, the BM25 index and customer_shards customer shards. Returns
+        the index metadata, plus whether the index was updated, the seconds
+        it took and the number of orders, BM25 terms and customers.
+        """
+        import faiss
+
+        # Carried-over chunks first, in their previous order, then the new ones
+        order, positions = None, np.zeros(0, dtype=np.int64)
+        if self._carried:
+            carried = np.concatenate(
+                [np.arange(start, start + len(batch)) for start, batch in self._carried]
+            )
+            positions = np.concatenate([batch for _, batch in self._carried])
+            order = np.concatenate([carried, np.setdiff1d(np.arange(self.ntotal), carried)])
+        self._vectors.finish(order)
+        for spill in self._docs.values():
+            spill.finish(order, present=False)
+        width = max((len(doc_id) for doc_id in self._ids), default=1)
+        keys = np.array(self._ids, dtype=f"S{width}")
+        self._ids = []
+        if order is not None:
+            keys = keys[order]
+        np.save(os.path.join(self._docs_dir, "ids.npy"), keys, allow_pickle=False)
+        np.save(
+            os.path.join(self._docs_dir, "id_order.npy"),
+            np.argsort(keys, kind="stable").astype(np.int64),
+            allow_pickle=False,
+        )
+        del keys
+
+        start = time.perf_counter()
+        vectors = load_vectors(self.store_dir)
+        updated = None
+        if (
+            self.previous is not None
+            and has_store(self.previous)
+            and np.all(np.diff(positions) > 0)
+        ):
+            previous_meta = read_index_meta(self.previous)
+            if previous_meta["distance_strategy"] == self.distance_strategy:
+                updated = update_index(
+                    os.path.join(self.previous, INDEX_FILE),
+                    previous_meta,
+                    np.setdiff1d(np.arange(previous_meta["ntotal"]), positions),
+                    vectors[len(positions) :],
+                    index_type,
+                    params,
+                )
+        inner_product = self.distance_strategy == "MAX_INNER_PRODUCT"
+        index, meta = updated or build_index(vectors, index_type, params, inner_product)
+        del vectors
+        faiss.write_index(index, os.path.join(self.store_dir, INDEX_FILE))
+        del index
+        meta.update(distance_strategy=self.distance_strategy, normalize_L2=self.normalize_L2)
+        with open(os.path.join(self.store_dir, INDEX_META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        index_seconds = time.perf_counter() - start
+
+        row_of_entry = self._records.finish()
+        orders = int((row_of_entry >= 0).sum())
+        lexical_terms = self._lexical.finish(row_of_entry, orders)
+        customers = write_customer_shards(self.store_dir, customer_shards)
+        return {
+            **meta,
+            "index_updated": updated is not None,
+            "index_seconds": index_seconds,
+            "orders": orders,
+            "lexical_terms": lexical_terms,
+            "customers": customers,
+        }
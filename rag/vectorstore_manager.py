@@ -0,0 +1,417 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()  # Ensure .env is loaded
+
+from observability.metrics import FILE_READ_SECONDS, timed
+from rag.customer_shards import CUSTOMERS_DIR, DIRECTORY_FILE, CustomerShards
+from rag.faiss_store import (
+    DOCSTORE_DIR,
+    INDEX_META_FILE,
+    has_store,
+    load_store,
+    load_vectors,
+    read_index_meta,
+)
+from rag.lexical_index import LEXICAL_DIR, LexicalIndex
+from rag.order_records import ORDER_RECORDS_DIR, OrderDocuments, OrderRecordStore
+
+logger = logging.getLogger(__name__)
+
+VECTORSTORE_DIR = "rag/vectorstore"
+GENERATION_FILE = "GENERATION"
+GENERATIONS_DIR = "generations"
+ORDER_INDEX_FILE = "order_index.json"
+KEEP_GENERATIONS = 2
+
+# How often (seconds) a lookup is allowed to stat the store for a new generation.
+RELOAD_CHECK_INTERVAL = float(os.getenv("VECTORSTORE_RELOAD_INTERVAL", "2.0"))
+
+
+def begin_generation(store_dir=VECTORSTORE_DIR):
+    """
+    Creates an empty directory for a new store generation.
+    Ingest writes every file of the new store there before publishing it,
+    so readers never see a half-written store.
+    """
+    generation = str(time.time_ns())
+    path = os.path.join(store_dir, GENERATIONS_DIR, generation)
+    os.makedirs(path)
+    return generation, path
+
+
+def write_generation(generation, store_dir=VECTORSTORE_DIR):
+    """
+    Publishes a fully written generation by pointing the GENERATION marker at it.
+    The marker is replaced atomically, so readers switch from one complete
+    generation to the next.
+    """
+    path = os.path.join(store_dir, GENERATION_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(generation)
+    os.replace(tmp_path, path)
+    return generation
+
+
+def read_generation(store_dir=VECTORSTORE_DIR):
+    """
+    Returns the generation id of the store on disk, or None if there is no store.
+    Falls back to the index file mtime for stores written before generation files.
+    """
+    try:
+        with open(os.path.join(store_dir, GENERATION_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    try:
+        return f"mtime-{os.stat(os.path.join(store_dir, 'index.faiss')).st_mtime_ns}"
+    except FileNotFoundError:
+        return None
+
+
+def resolve_store_path(generation, store_dir=VECTORSTORE_DIR):
+    """Directory holding the files of a generation (the store root for legacy stores)."""
+    path = os.path.join(store_dir, GENERATIONS_DIR, generation)
+    return path if os.path.isdir(path) else store_dir
+
+
+def prune_generations(store_dir=VECTORSTORE_DIR, keep=KEEP_GENERATIONS):
+    """
+    Removes old generation directories, keeping the newest `keep` so that
+    processes still loading a previous generation can finish.
+    """
+    root = os.path.join(store_dir, GENERATIONS_DIR)
+    if not os.path.isdir(root):
+        return
+    current = read_generation(store_dir)
+    generations = sorted(os.listdir(root), key=lambda g: (len(g), g))
+    for generation in generations[:-keep]:
+        if generation != current:
+            shutil.rmtree(os.path.join(root, generation), ignore_errors=True)
+
+
+def write_json_atomic(data, path):
+    """Writes JSON to a temp file and renames it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_order_index(store_dir=VECTORSTORE_DIR):
+    """
+    Reads the raw order-number index ({order_number: {page_content, metadata}})
+    of a store written before the record store kept the order text, or an
+    empty dict if there is none.
+    """
+    path = os.path.join(store_dir, ORDER_INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def store_size_bytes(store_dir=VECTORSTORE_DIR):
+    """Total size of the persisted index files a retriever reads."""
+    total = 0
+    for fname in ("index.faiss", "index.pkl", INDEX_META_FILE, ORDER_INDEX_FILE):
+        path = os.path.join(store_dir, fname)
+        if os.path.exists(path):
+            total += os.path.getsize(path)
+    docs_dir = os.path.join(store_dir, DOCSTORE_DIR)
+    if os.path.isdir(docs_dir):
+        total += sum(entry.stat().st_size for entry in os.scandir(docs_dir))
+    return total
+
+
+class StoreSnapshot:
+    """
+    Every artifact of one published generation: the FAISS vectorstore, the
+    order-number index, the typed order records, the BM25 index, the
+    full-precision vectors and the customer shard directory. Artifacts a store
+    predates are None. A lookup that reads several of them from one snapshot
+    never mixes generations.
+    """
+
+    def __init__(
+        self,
+        generation,
+        vectorstore=None,
+        order_index=None,
+        order_records=None,
+        lexical_index=None,
+        vectors=None,
+        customer_shards=None,
+    ):
+        self.generation = generation
+        self.vectorstore = vectorstore
+        self.order_index = order_index
+        self.order_records = order_records
+        self.lexical_index = lexical_index
+        self.vectors = vectors
+        self.customer_shards = customer_shards
+
+
+class VectorStoreManager:
+    """
+    Process-wide owner of the current StoreSnapshot: the FAISS vectorstore,
+    the exact order-number index, the typed order record store and the other
+    artifacts of one generation.
+
+    The whole generation is loaded once and shared by all callers. When ingest
+    publishes a new generation, the next lookup that notices it loads every
+    artifact of the new one and swaps the snapshot in one step; lookups already
+    holding the old snapshot keep using it.
+    """
+
+    def __init__(
+        self, store_dir=VECTORSTORE_DIR, check_interval=RELOAD_CHECK_INTERVAL, embeddings=None
+    ):
+        self.store_dir = store_dir
+        self.check_interval = check_interval
+        self._embeddings = embeddings
+        self._snapshot = None
+        self._last_checked = 0.0
+        self._lock = threading.Lock()
+        self._stats = {
+            "loads": 0,
+            "warm_hits": 0,
+            "last_load_seconds": None,
+            "total_load_seconds": 0.0,
+            "index_vectors": 0,
+            "index_bytes": 0,
+            "index_type": None,
+            "order_index_entries": 0,
+            "order_records": 0,
+            "lexical_terms": 0,
+            "generation": None,
+        }
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from rag.embedding_cache import get_embeddings
+
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    def snapshot(self):
+        """
+        Returns the StoreSnapshot of the current generation, loading it on first
+        use and swapping it when a new generation has been published. Returns
+        None if no store exists. Callers reading more than one artifact should
+        take one snapshot and read them all from it.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._last_checked < self.check_interval:
+            self._stats["warm_hits"] += 1
+            return snapshot
+
+        # Only the first caller waits for a cold load; once a snapshot is loaded,
+        # callers that find a reload in progress keep serving the old one.
+        if not self._lock.acquire(blocking=snapshot is None):
+            self._stats["warm_hits"] += 1
+            return snapshot
+        try:
+            snapshot = self._snapshot
+            generation = read_generation(self.store_dir)
+            if generation is None or (snapshot is not None and generation == snapshot.generation):
+                if snapshot is None:
+                    return None
+                self._last_checked = time.monotonic()
+                self._stats["warm_hits"] += 1
+                return snapshot
+            try:
+                loaded = self._load_snapshot(generation)
+            except Exception as e:
+                logger.error("Error loading vectorstore generation %s: %s", generation, e)
+                return snapshot
+            self._snapshot = loaded
+            self._last_checked = time.monotonic()
+            return loaded
+        finally:
+            self._lock.release()
+
+    def get(self):
+        """Returns the current vectorstore, or None if no store exists."""
+        snapshot = self.snapshot()
+        return snapshot.vectorstore if snapshot is not None else None
+
+    def get_order_index(self):
+        """
+        Returns the {order_number: Document} mapping over the order records, or
+        None if the store predates it.
+        """
+        snapshot = self.snapshot()
+        return snapshot.order_index if snapshot is not None else None
+
+    def get_order_records(self):
+        """
+        Returns the memory-mapped OrderRecordStore for the current generation,
+        or None if the store predates typed records.
+        """
+        snapshot = self.snapshot()
+        return snapshot.order_records if snapshot is not None else None
+
+    def get_lexical_index(self):
+        """
+        Returns the BM25 LexicalIndex over the order records, or None if the
+        store predates it.
+        """
+        snapshot = self.snapshot()
+        return snapshot.lexical_index if snapshot is not None else None
+
+    def get_vectors(self):
+        """
+        Returns the memory-mapped full-precision vectors in index order (for
+        exact scoring of small filtered candidate sets), or None.
+        """
+        snapshot = self.snapshot()
+        return snapshot.vectors if snapshot is not None else None
+
+    def get_customer_shards(self):
+        """
+        Returns the CustomerShards directory of the current generation (shards
+        open lazily, LRU-bounded), or None if the store predates them.
+        """
+        snapshot = self.snapshot()
+        return snapshot.customer_shards if snapshot is not None else None
+
+    def _load_snapshot(self, generation):
+        artifacts = {}
+        for name, loader in (
+            ("vectorstore", self._load_vectorstore),
+            ("order_records", self._load_order_records),
+            ("lexical_index", self._load_lexical_index),
+            ("vectors", self._load_vectors),
+            ("customer_shards", self._load_customer_shards),
+        ):
+            with timed(FILE_READ_SECONDS, artifact=name):
+                artifacts[name] = loader(generation)
+        with timed(FILE_READ_SECONDS, artifact="order_index"):
+            artifacts["order_index"] = self._load_order_index(
+                generation, artifacts["order_records"]
+            )
+        return StoreSnapshot(generation, **artifacts)
+
+    def _load_vectorstore(self, generation):
+        path = resolve_store_path(generation, self.store_dir)
+        start = time.perf_counter()
+        if has_store(path):
+            # Read-only and memory-mapped: workers share the page-cached index
+            vectorstore = load_store(path, self.embeddings)
+            index_type = read_index_meta(path)["index_type"]
+        else:
+            # Stores written before index.json: pickled docstore, read into memory.
+            # langchain/FAISS are imported with the first load, not at startup
+            from langchain_community.vectorstores import FAISS
+
+            vectorstore = FAISS.load_local(
+                path, self.embeddings, allow_dangerous_deserialization=True
+            )
+            index_type = "flat"
+        elapsed = time.perf_counter() - start
+
+        self._stats["loads"] += 1
+        self._stats["last_load_seconds"] = elapsed
+        self._stats["total_load_seconds"] += elapsed
+        self._stats["index_vectors"] = vectorstore.index.ntotal
+        self._stats["index_bytes"] = store_size_bytes(path)
+        self._stats["index_type"] = index_type
+        self._stats["generation"] = generation
+        logger.info(
+            "Loaded %s vectorstore generation %s in %.3fs (%d vectors, %d bytes)",
+            index_type,
+            generation,
+            elapsed,
+            self._stats["index_vectors"],
+            self._stats["index_bytes"],
+        )
+        return vectorstore
+
+    def _load_order_index(self, generation, records=None):
+        # The record store keeps the order text: lookups map the order number
+        # to a row in its mapped columns and build the Document on a hit
+        if records is not None and records.has_content:
+            self._stats["order_index_entries"] = len(records)
+            return OrderDocuments(records)
+        # Stores written before that: the JSON index, read whole into Documents
+        path = resolve_store_path(generation, self.store_dir)
+        if not os.path.exists(os.path.join(path, ORDER_INDEX_FILE)):
+            return None
+        entries = read_order_index(path)
+        from langchain_core.documents import Document
+
+        index = {
+            order_number: Document(
+                page_content=entry["page_content"], metadata=entry["metadata"]
+            )
+            for order_number, entry in entries.items()
+        }
+        self._stats["order_index_entries"] = len(index)
+        return index
+
+    def _load_order_records(self, generation):
+        path = resolve_store_path(generation, self.store_dir)
+        if not os.path.isdir(os.path.join(path, ORDER_RECORDS_DIR)):
+            return None
+        store = OrderRecordStore(path)
+        self._stats["order_records"] = len(store)
+        return store
+
+    def _load_lexical_index(self, generation):
+        path = resolve_store_path(generation, self.store_dir)
+        if not os.path.isdir(os.path.join(path, LEXICAL_DIR)):
+            return None
+        index = LexicalIndex(path)
+        self._stats["lexical_terms"] = index.terms
+        return index
+
+    def _load_vectors(self, generation):
+        return load_vectors(resolve_store_path(generation, self.store_dir))
+
+    def _load_customer_shards(self, generation):
+        path = resolve_store_path(generation, self.store_dir)
+        if not os.path.exists(os.path.join(path, CUSTOMERS_DIR, DIRECTORY_FILE)):
+            return None
+        return CustomerShards(path)
+
+    def stats(self):
+        """Load cost and index size, for comparing cold and warm lookups."""
+        stats = dict(self._stats)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.customer_shards is not None:
+            stats["customer_shards"] = snapshot.customer_shards.stats()
+        if hasattr(self._embeddings, "stats"):
+            stats["embedding_cache"] = self._embeddings.stats()
+        return stats
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_vectorstore_manager():
+    """Returns the shared VectorStoreManager, creating it on first use."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = VectorStoreManager()
+    return _manager
+
+
+def set_vectorstore_manager(manager):
+    """
+    Replace the shared VectorStoreManager, e.g. to point the retriever at
+    another store directory or embedding model (benchmarks, offline runs).
+    """
+    global _manager
+    with _manager_lock:
+        _manager = manager
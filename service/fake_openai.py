@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+
+import numpy as np
+from aiohttp import web
+
+# A local stand-in for the OpenAI API, so the service (and ingest) can run
+# without a key or network access:
+#   python -m service.fake_openai --port 8999
+#   OPENAI_BASE_URL=http://127.0.0.1:8999/v1 OPENAI_API_KEY=fake python -m service.server
+# Chat completions (streaming or not) return a canned reply word by word;
+# embeddings are deterministic unit vectors derived from the input text.
+# Faults can be injected to exercise the client-side limits and retries
+# (clients/provider.py):
+#   python -m service.fake_openai --latency 0.2 --max-concurrency 4 --error-rate 0.1
+
+HOST = "127.0.0.1"
+PORT = int(os.getenv("FAKE_OPENAI_PORT", "8999"))
+EMBEDDING_DIM = int(os.getenv("FAKE_OPENAI_EMBEDDING_DIM", "1536"))
+
+# Seconds between streamed tokens, to make time-to-first-token visible
+TOKEN_DELAY = float(os.getenv("FAKE_OPENAI_TOKEN_DELAY", "0.01"))
+
+REPLY = (
+    "Based on the order information and the return policy, this order was checked "
+    "against the return window for its category. If it is still within the window, "
+    "go to Your Orders, choose Return Items and follow the instructions."
+)
+
+# Injected faults: seconds added before every answer, the fraction of
+# requests answered 500 and 429, and the concurrent requests served before
+# the rest get 429 (0 = unlimited)
+LATENCY = float(os.getenv("FAKE_OPENAI_LATENCY", "0"))
+ERROR_RATE = float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0"))
+RATE_LIMIT_RATE = float(os.getenv("FAKE_OPENAI_RATE_LIMIT_RATE", "0"))
+MAX_CONCURRENCY = int(os.getenv("FAKE_OPENAI_MAX_CONCURRENCY", "0"))
+# Retry-After seconds sent with 429s
+RETRY_AFTER = float(os.getenv("FAKE_OPENAI_RETRY_AFTER", "0.1"))
+
+REPLY_KEY = web.AppKey("reply", str)
+FAULTS_KEY = web.AppKey("faults", dict)
+STATS_KEY = web.AppKey("stats", collections.Counter)
+
+
+def fake_embedding(item):
+    """Unit vector seeded from the input (a string or a list of token ids)."""
+    key = item if isinstance(item, str) else json.dumps(item)
+    seed = int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _tokens(text):
+    words = text.split(" ")
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+
+def _usage(body, reply):
+    prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+    completion_tokens = len(reply.split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+async def chat_completions(request):
+    body = await request.json()
+    model = body.get("model", "fake-model")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    reply = request.app[REPLY_KEY]
+
+    if not body.get("stream"):
+        return web.json_response(
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": _usage(body, reply),
+            }
+        )
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+
+    async def send(delta, finish_reason=None):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    await send({"role": "assistant", "content": ""})
+    for token in _tokens(reply):
+        if TOKEN_DELAY:
+            await asyncio.sleep(TOKEN_DELAY)
+        await send({"content": token})
+    await send({}, finish_reason="stop")
+    if (body.get("stream_options") or {}).get("include_usage"):
+        usage_chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [],
+            "usage": _usage(body, reply),
+        }
+        await response.write(f"data: {json.dumps(usage_chunk)}\n\n".encode())
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def embeddings(request):
+    body = await request.json()
+    inputs = body.get("input", [])
+    # A single string, a single token list, or a list of either
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    base64_output = body.get("encoding_format") == "base64"
+
+    data = []
+    for i, item in enumerate(inputs):
+        vector = fake_embedding(item)
+        embedding = base64.b64encode(vector.tobytes()).decode() if base64_output else vector.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+    tokens = sum(len(item) if isinstance(item, list) else len(item.split()) for item in inputs)
+    return web.json_response(
+        {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+    )
+
+
+async def models(request):
+    return web.json_response({"object": "list", "data": []})
+
+
+async def stats(request):
+    """GET /stats: requests received and answered, by outcome (for load tests)."""
+    return web.json_response(dict(request.app[STATS_KEY]))
+
+
+def _error(status, message, headers=None):
+    return web.json_response(
+        {"error": {"message": message, "type": "fake_fault", "code": None}},
+        status=status,
+        headers=headers,
+    )
+
+
+@web.middleware
+async def faults(request, handler):
+    """Applies the app's injected faults to the API routes."""
+    if request.path == "/stats":
+        return await handler(request)
+    settings = request.app[FAULTS_KEY]
+    counts = request.app[STATS_KEY]
+    counts["requests"] += 1
+    counts["in_flight"] += 1
+    counts["peak_in_flight"] = max(counts["peak_in_flight"], counts["in_flight"])
+    try:
+        retry_after = {"retry-after": str(settings["retry_after"])}
+        if settings["max_concurrency"] and counts["in_flight"] > settings["max_concurrency"]:
+            counts["429_concurrency"] += 1
+            return _error(429, "Too many concurrent requests", retry_after)
+        if random.random() < settings["rate_limit_rate"]:
+            counts["429"] += 1
+            return _error(429, "Rate limit reached", retry_after)
+        if settings["latency"]:
+            await asyncio.sleep(settings["latency"])
+        if random.random() < settings["error_rate"]:
+            counts["500"] += 1
+            return _error(500, "The server had an error while processing your request")
+        counts["200"] += 1
+        return await handler(request)
+    finally:
+        counts["in_flight"] -= 1
+
+
+def create_app(
+    reply=REPLY,
+    latency=LATENCY,
+    error_rate=ERROR_RATE,
+    rate_limit_rate=RATE_LIMIT_RATE,
+    max_concurrency=MAX_CONCURRENCY,
+    retry_after=RETRY_AFTER,
+):
+    app = web.Application(client_max_size=64 * 1024 * 1024, middlewares=[faults])
+    app[REPLY_KEY] = reply
+    app[FAULTS_KEY] = {
+        "latency": latency,
+        "error_rate": error_rate,
+        "rate_limit_rate": rate_limit_rate,
+        "max_concurrency": max_concurrency,
+        "retry_after": retry_after,
+    }
+    app[STATS_KEY] = collections.Counter()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/embeddings", embeddings)
+    app.router.add_get("/v1/models", models)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible endpoint for local testing")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--reply", default=REPLY, help="Canned chat completion text")
+    parser.add_argument("--latency", type=float, default=LATENCY, help="Seconds added per request")
+    parser.add_argument(
+        "--error-rate", type=float, default=ERROR_RATE, help="Fraction of requests answered 500"
+    )
+    parser.add_argument(
+        "--rate-limit-rate",
+        type=float,
+        default=RATE_LIMIT_RATE,
+        help="Fraction of requests answered 429",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=MAX_CONCURRENCY,
+        help="Concurrent requests served; the rest get 429 (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--retry-after", type=float, default=RETRY_AFTER, help="Retry-After seconds on 429s"
+    )
+    args = parser.parse_args()
+    app = create_app(
+        args.reply,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        max_concurrency=args.max_concurrency,
+        retry_after=args.retry_after,
+    )
+    web.run_app(app, host=args.host, port=args.port)
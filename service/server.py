@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from aiohttp import WSMsgType, web
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+load_dotenv()
+
+from clients.provider import client_stats
+from conversation.engine import ConversationEngine
+from conversation.response_cache import get_response_cache
+from conversation.session_io import CHUNK, END_OF_SESSION, MESSAGE
+from observability.logs import configure_logging
+from observability.metrics import REGISTRY
+from service.warmup import warm_up
+from tools.eligibility_fast_path import decision_stats
+
+HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+PORT = int(os.getenv("SERVICE_PORT", "8080"))
+
+# Upper bound on concurrent conversations per process; new sessions beyond it
+# are refused with 503 rather than degrading everyone's latency.
+MAX_SESSIONS = int(os.getenv("SERVICE_MAX_SESSIONS", "5000"))
+
+# Preload clients, imports and indexes before accepting traffic
+WARMUP = os.getenv("SERVICE_WARMUP", "1") != "0"
+
+ENGINE_KEY = web.AppKey("engine", ConversationEngine)
+WARMUP_KEY = web.AppKey("warmup", dict)
+
+
+def event_json(event, payload):
+    """One engine (event, payload) tuple as the wire-format dict."""
+    if event in (MESSAGE, CHUNK):
+        return {"type": event, "text": payload}
+    return {"type": event}
+
+
+async def stream_events(request, session_id, events):
+    """
+    Write events as newline-delimited JSON, flushing each one so the client
+    sees LLM tokens as they are generated.
+    """
+    response = web.StreamResponse(
+        headers={
+            "Content-Type": "application/x-ndjson",
+            "Cache-Control": "no-cache",
+            "X-Session-Id": session_id,
+        }
+    )
+    await response.prepare(request)
+    await response.write(
+        (json.dumps({"type": "session", "session_id": session_id}) + "\n").encode()
+    )
+    async for event, payload in events:
+        await response.write((json.dumps(event_json(event, payload)) + "\n").encode())
+    await response.write_eof()
+    return response
+
+
+def _check_capacity(engine):
+    if engine.active_sessions() >= MAX_SESSIONS:
+        raise web.HTTPServiceUnavailable(text="Too many active sessions")
+
+
+async def create_session(request):
+    """
+    POST /sessions: start a conversation and stream its greeting. An optional
+    {"username": ...} body scopes order lookups to that customer's orders.
+    """
+    engine = request.app[ENGINE_KEY]
+    _check_capacity(engine)
+    customer = None
+    if request.can_read_body:
+        try:
+            customer = (await request.json()).get("username")
+        except (ValueError, AttributeError):
+            raise web.HTTPBadRequest(text='Expected an empty body or {"username": "..."}')
+    try:
+        session_id, events = await engine.open_stream(customer=customer)
+    except ValueError as e:
+        raise web.HTTPConflict(text=str(e))
+    return await stream_events(request, session_id, events)
+
+
+async def post_message(request):
+    """POST /sessions/{session_id}/messages with {"text": ...}: stream the reply."""
+    engine = request.app[ENGINE_KEY]
+    session_id = request.match_info["session_id"]
+    try:
+        body = await request.json()
+        text = body["text"]
+    except (ValueError, KeyError, TypeError):
+        raise web.HTTPBadRequest(text='Expected a JSON body {"text": "..."}')
+    if session_id not in engine.sessions:
+        # Started on another worker, or before a restart: resume it here
+        _check_capacity(engine)
+        try:
+            await engine.live_session(session_id)
+        except (KeyError, ValueError) as e:
+            raise web.HTTPNotFound(text=str(e.args[0]))
+    return await stream_events(request, session_id, engine.send_stream(session_id, str(text)))
+
+
+async def get_session(request):
+    """GET /sessions/{session_id}: where the conversation is and its memory size."""
+    engine = request.app[ENGINE_KEY]
+    try:
+        session = engine.get_session(request.match_info["session_id"])
+    except KeyError as e:
+        raise web.HTTPNotFound(text=str(e.args[0]))
+    return web.json_response(
+        {
+            "session_id": session.session_id,
+            "current_node": session.current_node,
+            "customer": session.customer,
+            "memory": session.memory.stats(),
+        }
+    )
+
+
+async def delete_session(request):
+    """DELETE /sessions/{session_id}: end a conversation early."""
+    await request.app[ENGINE_KEY].close_session(request.match_info["session_id"], discard=True)
+    return web.Response(status=204)
+
+
+async def websocket_session(request):
+    """
+    GET /ws[?username=...]: one conversation per WebSocket. The server sends
+    the same JSON events as the HTTP stream; the client sends plain text or
+    {"text": ...}. Reconnecting with ?session_id=... resumes that session,
+    starting with the question it was waiting on.
+    """
+    engine = request.app[ENGINE_KEY]
+    _check_capacity(engine)
+    resume_id = request.query.get("session_id")
+    if resume_id:
+        if resume_id in engine.sessions:
+            raise web.HTTPConflict(text=f"Session {resume_id} is already connected")
+        try:
+            session = await engine.resume(resume_id)
+        except KeyError as e:
+            raise web.HTTPNotFound(text=str(e.args[0]))
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+
+    if resume_id:
+        session_id, events = resume_id, session.io.stream_turn()
+    else:
+        session_id, events = await engine.open_stream(customer=request.query.get("username"))
+    await ws.send_json({"type": "session", "session_id": session_id})
+    try:
+        while True:
+            async for event, payload in events:
+                await ws.send_json(event_json(event, payload))
+                if event == END_OF_SESSION:
+                    return ws
+            # The agent is waiting for input
+            msg = await ws.receive()
+            if msg.type != WSMsgType.TEXT:
+                return ws
+            text = msg.data
+            if text.startswith("{"):
+                try:
+                    text = json.loads(text).get("text", "")
+                except (ValueError, AttributeError):
+                    pass
+            events = engine.send_stream(session_id, str(text))
+    finally:
+        await engine.close_session(session_id)
+        await ws.close()
+
+
+async def health(request):
+    cache = get_response_cache()
+    return web.json_response(
+        {
+            "status": "ok",
+            "warmup_seconds": request.app.get(WARMUP_KEY),
+            "active_sessions": request.app[ENGINE_KEY].active_sessions(),
+            "eligibility_decisions": decision_stats(),
+            "conversation_memory": request.app[ENGINE_KEY].memory_stats(),
+            "checkpoints": request.app[ENGINE_KEY].checkpoint_stats(),
+            "llm_response_cache": cache.stats() if cache is not None else None,
+            "upstream": client_stats(),
+        }
+    )
+
+
+async def metrics(request):
+    """GET /metrics: Prometheus text format; ?format=json for a JSON snapshot."""
+    if request.query.get("format") == "json":
+        return web.json_response(REGISTRY.snapshot())
+    return web.Response(
+        text=REGISTRY.render_prometheus(), content_type="text/plain", charset="utf-8"
+    )
+
+
+async def _warm_up(app):
+    # Runs before the server starts listening; off the loop, since it is all
+    # blocking imports and file reads
+    app[WARMUP_KEY] = await asyncio.get_running_loop().run_in_executor(None, warm_up)
+
+
+async def _close_sessions(app):
+    engine = app[ENGINE_KEY]
+    for session_id in list(engine.sessions):
+        await engine.close_session(session_id)
+
+
+def create_app(engine=None, warmup=WARMUP):
+    """Build the aiohttp application around a (shared) ConversationEngine."""
+    app = web.Application()
+    if warmup:
+        app.on_startup.append(_warm_up)
+    app[ENGINE_KEY] = engine or ConversationEngine()
+    app.router.add_post("/sessions", create_session)
+    app.router.add_post("/sessions/{session_id}/messages", post_message)
+    app.router.add_get("/sessions/{session_id}", get_session)
+    app.router.add_delete("/sessions/{session_id}", delete_session)
+    app.router.add_get("/ws", websocket_session)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    app.on_shutdown.append(_close_sessions)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the return assistant over HTTP and WebSocket")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument(
+        "--no-warmup", action="store_true", help="Start without preloading (first requests pay)."
+    )
+    args = parser.parse_args()
+    configure_logging()
+    web.run_app(create_app(warmup=WARMUP and not args.no_warmup), host=args.host, port=args.port)
@@ -0,0 +1,67 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Modules that request handlers import on first use; importing them on the
+# event loop would stall every session for the duration.
+DEFERRED_MODULES = (
+    "langchain_core.prompts",
+    "langchain_core.messages",
+    "langchain_community.vectorstores.faiss",
+    "langchain_community.vectorstores.utils",
+)
+
+
+def warm_up(vectorstore=True):
+    """
+    Builds everything the first request would otherwise pay for: deferred
+    imports, the LLM and embedding clients, the compiled graph, the policy
+    index, the response cache and (unless vectorstore=False) the FAISS store,
+    order index, record store, BM25 index and customer shard directory. Returns {step: seconds}.
+    """
+    from conversation.graph import get_compiled_graph, get_llm
+    from conversation.response_cache import get_response_cache
+    from rag.vectorstore_manager import get_vectorstore_manager
+    from tools.return_policy_engine import get_policy_engine
+
+    timings = {}
+
+    def step(name, fn):
+        start = time.perf_counter()
+        fn()
+        timings[name] = round(time.perf_counter() - start, 4)
+
+    step("imports", lambda: [importlib.import_module(name) for name in DEFERRED_MODULES])
+    step("llm_client", get_llm)
+    step("graph", get_compiled_graph)
+    step("return_policy", get_policy_engine)
+    step("response_cache", get_response_cache)
+    if vectorstore:
+        manager = get_vectorstore_manager()
+        step("embeddings_client", lambda: manager.embeddings)
+        step("vectorstore", manager.snapshot)
+    timings["total"] = round(sum(timings.values()), 4)
+    logger.info("Warm-up finished in %.3fs: %s", timings["total"], timings)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Preload clients, the graph and indexes, and report how long each took."
+    )
+    parser.add_argument(
+        "--no-vectorstore", action="store_true", help="Skip loading the FAISS store and indexes."
+    )
+    args = parser.parse_args()
+    print(json.dumps(warm_up(vectorstore=not args.no_vectorstore), indent=2))
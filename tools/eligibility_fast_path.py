@@ -0,0 +1,73 @@
+import os
+import threading
+from datetime import timedelta
+
+# "fast": answer clear-cut decisions from templates and only call the LLM for
+# ambiguous ones. "llm": always ask the LLM (the original behaviour).
+ELIGIBILITY_DECISION_MODE = os.getenv("ELIGIBILITY_DECISION_MODE", "fast")
+
+ELIGIBLE_TEMPLATE = """Good news! Your {item} (order #{order_number}) is eligible for return.
+It was delivered on {delivery_date}, {days_since} days ago. Most items can be returned within {window} days of delivery, so you have {days_remaining} days left to start your return (until {deadline}).
+
+To initiate the return:
+1. Go to Your Orders in your Amazon account.
+2. Find order #{order_number} and click "Return Items".
+3. Select the reason for the return and choose your refund method.
+4. Follow the drop-off or pickup instructions. Most returns can be dropped off for free at a nearby location.
+
+Please return the item in its original or unused condition, with all accessories and packaging."""
+
+NOT_ELIGIBLE_TEMPLATE = """I'm sorry, your {item} (order #{order_number}) is no longer eligible for return.
+It was delivered on {delivery_date}, {days_since} days ago. Most items can be returned within {window} days of delivery, and that window ended on {deadline}.
+
+If the item is damaged or defective, it may still be covered by the manufacturer's warranty, or you can contact Amazon Customer Service for help."""
+
+_stats_lock = threading.Lock()
+_stats = {"fast_path": 0, "cached": 0, "llm_path": 0}
+
+
+def record_decision_path(path):
+    """Count one eligibility answer as "fast_path", "cached" or "llm_path"."""
+    with _stats_lock:
+        _stats[path] += 1
+
+
+def decision_stats():
+    """Fast-path, response-cache and LLM-path counters since startup."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def is_clear_cut(decision, record):
+    """
+    True when the computed decision can be stated without LLM reasoning:
+    a category the rule table knows, under the standard window, and a known
+    delivery date that is not in the future. Missing or future dates, unknown
+    categories (the default window was only assumed), special windows and
+    non-returnable items are left to the LLM.
+    """
+    if ELIGIBILITY_DECISION_MODE != "fast" or decision is None or record is None:
+        return False
+    if not record.category or record.delivery_date is None or not decision.matched:
+        return False
+    if decision.days_since_delivery is None or decision.days_since_delivery < 0:
+        return False
+    return decision.policy_class == "standard" and decision.status in (
+        "ELIGIBLE",
+        "NOT ELIGIBLE",
+    )
+
+
+def render_decision(decision, record):
+    """Prepared customer-facing answer for a clear-cut decision."""
+    item = f"{record.brand} {record.category}" if record.brand else record.category
+    template = ELIGIBLE_TEMPLATE if decision.status == "ELIGIBLE" else NOT_ELIGIBLE_TEMPLATE
+    return template.format(
+        item=item,
+        order_number=record.order_number,
+        delivery_date=record.delivery_date.isoformat(),
+        days_since=decision.days_since_delivery,
+        window=decision.window_days,
+        days_remaining=decision.days_remaining,
+        deadline=(record.delivery_date + timedelta(days=decision.window_days)).isoformat(),
+    )
@@ -0,0 +1,190 @@
+import math
+import os
+import re
+from typing import NamedTuple
+
+# Token budget for the policy excerpt sent to the LLM (roughly 4 chars/token).
+POLICY_CONTEXT_TOKENS = int(os.getenv("POLICY_CONTEXT_TOKENS", "400"))
+CHARS_PER_TOKEN = 4
+
+# Longer multi-line paragraphs (the window table, item lists, the fee table)
+# are indexed line by line so one relevant row does not drag in the rest.
+MAX_PASSAGE_TOKENS = 120
+
+# Section headings of amazon_return_policy.md, in file order. The file is
+# plain text, so headings cannot be told apart from short list items (e.g.
+# "Perishables") by format alone. A heading missing from the file is skipped;
+# text under an unknown heading stays with the previous section.
+POLICY_HEADINGS = (
+    "Amazon Return Policy",
+    "Refund Timelines",
+    "Return Window",
+    "Items That You Can't Return",
+    "Initiating a Return",
+    "Third Party Seller Returns",
+    "Sending Us Your Return",
+    "Amazon Pharmacy",
+    "Amazon Business",
+    "Amazon Luxury Stores",
+    "Return Fees",
+    "Returning a Gift",
+    "Global Store Returns",
+    "Special Delivery Service Returns",
+    "Product Warranties",
+    "Unintended Item(s) in My Return",
+    "Returning Items Purchased in a Bundle",
+    "Note:",
+)
+
+# Passages sent for every order: how long returns take in general and how to
+# start one, which the eligibility prompt always asks the LLM to explain.
+PINNED_PASSAGES = (
+    r"returned for a refund or replacement/exchange within \d+ days",
+    r'click on "Return Items"',
+)
+
+STOPWORDS = frozenset(
+    """a an and are as at be by can do for from has have if in into is it its
+    may most not of on or our than that the their them there these this to
+    was we were what when which will with within you your""".split()
+)
+
+
+def terms(text):
+    """Normalized keyword set: lowercase words, stopwords and plural 's' removed."""
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return frozenset(
+        word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+        for word in words
+        if word not in STOPWORDS and len(word) > 1
+    )
+
+
+def estimate_tokens(text):
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+class PolicyPassage(NamedTuple):
+    """One paragraph (or one row of a long list) of the policy, with its section."""
+
+    position: int
+    section: str
+    text: str
+    terms: frozenset
+    tokens: int
+
+
+def split_policy(text):
+    """Split the policy into PolicyPassage paragraphs under their section headings."""
+    headings = set(POLICY_HEADINGS)
+    passages = []
+    section = POLICY_HEADINGS[0]
+    paragraph = []
+
+    def add(body):
+        passages.append(
+            PolicyPassage(
+                len(passages), section, body, terms(f"{section} {body}"), estimate_tokens(body)
+            )
+        )
+
+    def flush():
+        body = "\n".join(paragraph).strip()
+        lines = list(paragraph)
+        paragraph.clear()
+        if not body:
+            return
+        if len(lines) == 1 or estimate_tokens(body) <= MAX_PASSAGE_TOKENS:
+            add(body)
+            return
+        # Window table rows keep their "N days" group as a prefix
+        window = None
+        for line in lines:
+            if re.fullmatch(r"\d+ days", line):
+                window = line
+            else:
+                add(f"{window}: {line}" if window else line)
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped in headings:
+            flush()
+            section = stripped
+        elif not stripped:
+            flush()
+        else:
+            paragraph.append(stripped)
+    flush()
+    return passages
+
+
+class PolicySectionIndex:
+    """
+    Keyword signatures for the policy's passages, built once per policy load.
+    select() picks the passages relevant to one order under a token budget.
+    """
+
+    def __init__(self, text):
+        self.passages = split_policy(text)
+        # Inverse document frequency: terms found in few passages weigh more
+        counts = {}
+        for passage in self.passages:
+            for term in passage.terms:
+                counts[term] = counts.get(term, 0) + 1
+        total = len(self.passages) or 1
+        self.idf = {term: math.log(1 + total / count) for term, count in counts.items()}
+        self.pinned = []
+        for pattern in PINNED_PASSAGES:
+            passage = next((p for p in self.passages if re.search(pattern, p.text)), None)
+            if passage is not None:
+                self.pinned.append(passage.position)
+
+    def score(self, passage, query_terms):
+        return sum(self.idf.get(term, 0.0) for term in query_terms & passage.terms)
+
+    def select(self, query, rule=None, budget=POLICY_CONTEXT_TOKENS):
+        """
+        Passages for an order, most relevant first until the budget is spent,
+        returned in document order. query is free text (category, brand,
+        ...); rule is the policy line that decided eligibility, whose passage
+        is always included when it fits.
+        """
+        query_terms = terms(query)
+        ranked = list(self.pinned)
+        if rule:
+            ruled = next((p.position for p in self.passages if rule in p.text), None)
+            if ruled is not None and ruled not in ranked:
+                ranked.insert(0, ruled)
+        scored = sorted(
+            (
+                (self.score(passage, query_terms), passage.position)
+                for passage in self.passages
+                if passage.position not in ranked
+            ),
+            reverse=True,
+        )
+        ranked += [position for score, position in scored if score > 0]
+
+        selected = []
+        used = 0
+        for position in ranked:
+            passage = self.passages[position]
+            if used + passage.tokens <= budget:
+                selected.append(passage)
+                used += passage.tokens
+        return sorted(selected)
+
+    def render(self, passages):
+        """Selected passages as text, each section heading printed once."""
+        lines = []
+        section = None
+        for passage in passages:
+            if passage.section != section:
+                section = passage.section
+                lines.append(f"\n{section}")
+            lines.append(passage.text)
+        return "\n".join(lines).strip()
+
+    def context(self, query, rule=None, budget=POLICY_CONTEXT_TOKENS):
+        """Policy excerpt for an order: select() rendered as text."""
+        return self.render(self.select(query, rule, budget))
@@ -0,0 +1,282 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from observability.metrics import FILE_READ_SECONDS, timed
+from tools.policy_sections import PolicySectionIndex
+
+logger = logging.getLogger(__name__)
+
+POLICY_PATH = os.path.join(os.path.dirname(__file__), "amazon_return_policy.md")
+
+# How often (seconds) evaluation may stat the policy file for changes.
+RELOAD_CHECK_INTERVAL = float(os.getenv("POLICY_RELOAD_INTERVAL", "5.0"))
+
+DEFAULT_CONDITION = "new"
+RULE_CACHE_SIZE = 4096
+
+# The policy file lists exceptions as prose. Each entry maps a phrase found in
+# an exception line to the orders it applies to; the window itself is always
+# read from the file. Category and brand terms match case-insensitively as
+# whole words of the order's category/brand; conditions match exactly.
+WINDOW_MATCHERS = [
+    (r"Kindle Store", {"categories": ("kindle", "ebook", "e-book", "digital book")}),
+    (r"Digital textbooks", {"categories": ("digital textbook", "workbook")}),
+    (r"Digital Music Store", {"categories": ("digital music", "song", "album")}),
+    (r"Apple Brand", {"brands": ("apple",), "conditions": ("new",)}),
+    (r"Boost Infinite", {"brands": ("boost infinite",), "conditions": ("new",)}),
+    (r"Amazon Haul", {"conditions": ("haul",)}),
+    (
+        r'Renewed products in "Acceptable"',
+        {"conditions": ("renewed-acceptable", "renewed-good", "renewed-excellent")},
+    ),
+    (r'Renewed products in "Premium"', {"conditions": ("renewed-premium",)}),
+    (r"nonperishable Baby products", {"categories": ("baby",)}),
+    (r"Birthday and/or Custom Gift List", {"conditions": ("gift-list",)}),
+    (r"Mattresses", {"categories": ("mattress",), "exclude": ("crib",)}),
+    (r"Wedding Registry", {"conditions": ("wedding-registry",)}),
+    (r"Baby Registry", {"conditions": ("baby-registry",)}),
+]
+
+NON_RETURNABLE_MATCHERS = [
+    (r"Perishables", {"categories": ("grocery", "perishable", "fresh produce", "fresh food")}),
+    (r"Customized products", {"categories": ("customized", "custom-made", "personalized")}),
+    (r"Amazon Pharmacy", {"categories": ("pharmacy", "prescription")}),
+    (r"Pet medication", {"categories": ("pet medication",)}),
+    (r"Automobiles", {"categories": ("automobile",)}),
+    (r'listed as "Final Sale"', {"conditions": ("final-sale",)}),
+]
+
+# Categories the catalog sells under the default ("Most items") window. The
+# policy only lists exceptions, so these are what make a category known: an
+# order matching no rule at all gets the default window as a guess.
+STANDARD_CATEGORIES = (
+    "earbuds", "headphones", "speaker", "smartphone", "laptop", "laptop stand", "tablet",
+    "projector", "camera", "monitor", "keyboard", "mouse", "air fryer", "cookware",
+    "blender", "coffee maker", "vacuum", "robot vacuum", "diffuser", "water bottle",
+    "yoga mat", "dumbbells", "stroller", "furniture", "clothing", "shoes", "toys",
+)
+
+
+def _has_term(terms, text):
+    return any(re.search(rf"\b{re.escape(term)}\b", text) for term in terms)
+
+
+class PolicyRule(NamedTuple):
+    """One line of the policy, resolved to the orders it applies to."""
+
+    window_days: Optional[int]  # None for non-returnable items
+    description: str
+    categories: tuple = ()
+    brands: tuple = ()
+    conditions: tuple = ()
+    exclude: tuple = ()
+    standard: bool = False  # a known category under the default window
+
+    def matches(self, category, brand, condition):
+        if self.exclude and _has_term(self.exclude, category):
+            return False
+        if self.categories and not _has_term(self.categories, category):
+            return False
+        if self.brands and not _has_term(self.brands, brand):
+            return False
+        if self.conditions and condition not in self.conditions:
+            return False
+        return True
+
+
+class EligibilityDecision(NamedTuple):
+    """Result of evaluating one order against the rule table."""
+
+    status: str  # ELIGIBLE, NOT ELIGIBLE, NON-RETURNABLE or UNKNOWN
+    policy_class: str  # standard, special or non-returnable
+    window_days: Optional[int]
+    days_since_delivery: Optional[int]
+    days_remaining: Optional[int]
+    rule: str
+    # False when no rule matched and the default window was assumed (e.g. an
+    # unknown category)
+    matched: bool = True
+
+
+def _section(text, start, end):
+    """Text between a heading line and the next heading, or '' if missing."""
+    match = re.search(
+        rf"^{re.escape(start)}\s*$(.*?)^{re.escape(end)}", text, re.MULTILINE | re.DOTALL
+    )
+    return match.group(1) if match else ""
+
+
+def parse_policy(text):
+    """
+    Parse the policy markdown into (default_window_days, rules).
+    Window rules come from the "Return Window" section ("7 days", "15 days", ...
+    followed by the items they cover); non-returnable rules from "Items That You
+    Can't Return". Lines no matcher recognises are kept out of the table.
+    """
+    default_match = re.search(r"returned within (\d+) days of delivery", text)
+    default_window = int(default_match.group(1)) if default_match else 30
+
+    rules = []
+    window = None
+    for line in _section(text, "Return Window", "Items That You Can't Return").splitlines():
+        line = line.strip()
+        days = re.fullmatch(r"(\d+) days", line)
+        if days:
+            window = int(days.group(1))
+            continue
+        if not line or window is None:
+            continue
+        for phrase, spec in WINDOW_MATCHERS:
+            if re.search(phrase, line, re.IGNORECASE):
+                rules.append(PolicyRule(window, line, **spec))
+
+    non_returnable = _section(text, "Items That You Can't Return", "Initiating a Return")
+    for line in non_returnable.splitlines():
+        line = line.strip()
+        for phrase, spec in NON_RETURNABLE_MATCHERS:
+            if line and re.search(phrase, line, re.IGNORECASE):
+                rules.append(PolicyRule(None, line, **spec))
+
+    # Non-returnable rules win over windows; among windows the first listed
+    # wins, and the known standard categories come last
+    rules.sort(key=lambda rule: rule.window_days is not None)
+    rules.append(
+        PolicyRule(
+            default_window,
+            f"Most items: {default_window} days of delivery",
+            categories=STANDARD_CATEGORIES,
+            standard=True,
+        )
+    )
+    return default_window, rules
+
+
+class ReturnPolicyEngine:
+    """
+    In-process return policy: parsed once, reloaded when the file changes,
+    and evaluated from an order's category, brand, condition and delivery date.
+    """
+
+    def __init__(self, path=POLICY_PATH, check_interval=RELOAD_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_check = 0.0
+        self.text = ""
+        self.version = None
+        self.default_window = 30
+        self.rules = []
+        self.sections = None
+        self._rule_cache = {}
+        self.reload()
+
+    def reload(self):
+        """(Re)parse the policy file and reset the per-category rule table."""
+        with self._lock, timed(FILE_READ_SECONDS, artifact="return_policy"):
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, "r", encoding="utf-8") as f:
+                text = f.read()
+            default_window, rules = parse_policy(text)
+            sections = PolicySectionIndex(text)
+            self.text = text
+            # Content hash, so caches keyed on it survive restarts but not edits
+            self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+            self.default_window = default_window
+            self.rules = rules
+            self.sections = sections
+            self._rule_cache = {}
+            self._mtime = mtime
+            self._last_check = time.monotonic()
+        logger.info(
+            "Loaded return policy: %d rules, %d passages, default window %d days",
+            len(rules),
+            len(sections.passages),
+            default_window,
+        )
+
+    def _check_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            if os.stat(self.path).st_mtime_ns != self._mtime:
+                self.reload()
+        except OSError as e:
+            logger.error("Error checking return policy file: %s", e)
+
+    def current_version(self):
+        """Version of the policy currently in effect, picking up file edits."""
+        self._check_reload()
+        return self.version
+
+    def rule_for(self, category=None, brand=None, condition=DEFAULT_CONDITION):
+        """The rule for a (category, brand, condition) key, or None for the default window."""
+        self._check_reload()
+        key = ((category or "").lower(), (brand or "").lower(), condition or DEFAULT_CONDITION)
+        try:
+            return self._rule_cache[key]
+        except KeyError:
+            pass
+        rule = next((rule for rule in self.rules if rule.matches(*key)), None)
+        if len(self._rule_cache) >= RULE_CACHE_SIZE:
+            self._rule_cache = {}
+        self._rule_cache[key] = rule
+        return rule
+
+    def evaluate(self, delivery_date, category=None, brand=None, condition=None, today=None):
+        """Decide eligibility for one order (delivery_date is a datetime.date or None)."""
+        rule = self.rule_for(category, brand, condition)
+        if rule is not None and rule.window_days is None:
+            return EligibilityDecision(
+                "NON-RETURNABLE", "non-returnable", None, None, None, rule.description
+            )
+
+        matched = rule is not None
+        window = rule.window_days if matched else self.default_window
+        policy_class = "special" if matched and not rule.standard else "standard"
+        description = rule.description if matched else f"Most items: {window} days of delivery"
+        if delivery_date is None:
+            return EligibilityDecision(
+                "UNKNOWN", policy_class, window, None, None, description, matched
+            )
+
+        today = today or datetime.now().date()
+        days_since = (today - delivery_date).days
+        status = "ELIGIBLE" if days_since <= window else "NOT ELIGIBLE"
+        return EligibilityDecision(
+            status,
+            policy_class,
+            window,
+            days_since,
+            max(window - days_since, 0),
+            description,
+            matched,
+        )
+
+    def evaluate_record(self, record, condition=None, today=None):
+        """Evaluate a typed OrderRecord."""
+        return self.evaluate(
+            record.delivery_date, record.category, record.brand, condition, today
+        )
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_policy_engine():
+    """Returns the shared ReturnPolicyEngine, parsing the policy on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ReturnPolicyEngine()
+    return _engine
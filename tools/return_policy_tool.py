@@ -1,10 +1,87 @@
-from langchain.tools import tool
+import logging
 import os
+import re
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from rag.retriever import get_order_record
+from tools.return_policy_engine import get_policy_engine
 
-@tool("fetch_return_policy", return_direct=True)
-def fetch_return_policy_tool(tool_input: str) -> str:
+logger = logging.getLogger(__name__)
+
+
+def eligibility_info(delivery_date, category=None, brand=None, current_date=None):
+    """
+    Builds the eligibility lines for an order from the preloaded policy engine.
+    delivery_date is a datetime.date or None.
+    """
+    current_date = current_date or datetime.now().date()
+    current_date_str = current_date.strftime("%Y-%m-%d")
+    decision = get_policy_engine().evaluate(
+        delivery_date, category=category, brand=brand, today=current_date
+    )
+
+    info = f"\n\nCurrent date: {current_date_str}\n"
+    if category:
+        info += f"Product category: {category}\n"
+    info += f"Applicable rule: {decision.rule}\n"
+
+    if decision.status == "NON-RETURNABLE":
+        info += "Return status: NOT ELIGIBLE - Item is non-returnable\n"
+        return info
+    if delivery_date is None:
+        logger.debug("No delivery date found in order information")
+        info += "No delivery date found in order information.\n"
+        info += f"Return window: {decision.window_days} days\n"
+        return info
+
+    info += f"Delivery date: {delivery_date.isoformat()}\n"
+    info += f"Days since delivery: {decision.days_since_delivery}\n"
+    if decision.status == "ELIGIBLE":
+        info += (
+            f"Return status: ELIGIBLE - Within {decision.window_days}-day return window "
+            f"({decision.days_remaining} days remaining)\n"
+        )
+    else:
+        info += (
+            f"Return status: NOT ELIGIBLE - Beyond {decision.window_days}-day return window\n"
+        )
+    return info
+
+
+def policy_context(category=None, brand=None, current_date=None):
+    """
+    The policy passages relevant to one order, within POLICY_CONTEXT_TOKENS:
+    the general window and how to start a return, the passage of any special
+    rule that applies, and sections mentioning the category or brand.
+    """
+    engine = get_policy_engine()
+    decision = engine.evaluate(None, category=category, brand=brand, today=current_date)
+    rule = decision.rule if decision.policy_class != "standard" else None
+    query = " ".join(filter(None, (category, brand)))
+    return engine.sections.context(query, rule=rule)
+
+
+def evaluate_order(record, current_date=None):
+    """The policy engine's EligibilityDecision for a typed OrderRecord."""
+    return get_policy_engine().evaluate_record(record, today=current_date)
+
+
+def return_policy_for_order(record, current_date=None):
+    """
+    Returns the relevant return policy passages with eligibility information
+    for a typed OrderRecord, reading its fields directly.
+    """
+    return policy_context(record.category, record.brand, current_date) + eligibility_info(
+        record.delivery_date,
+        category=record.category,
+        brand=record.brand,
+        current_date=current_date,
+    )
+
+
+def fetch_return_policy(tool_input: str) -> str:
     """
     Fetches the Amazon return policy from a local markdown file and checks return eligibility
     based on the delivery date and current date.
@@ -15,54 +92,49 @@ def fetch_return_policy_tool(tool_input: str) -> str:
     Returns:
         The return policy text with eligibility information based on current date.
     """
-    # Print what we actually received
-    print(f"******************* Tool input received: {tool_input} *******************")
+    logger.debug("Tool input received: %s", tool_input)
 
-    # Get the current date
-    current_date = datetime.now()
-    current_date_str = current_date.strftime("%Y-%m-%d")
-
-    # Extract delivery date from the tool_input
-    delivery_date = None
+    # Prefer the typed order record when the input names a known order
+    order_match = re.search(r"\b\d{6,}\b", tool_input)
+    record = get_order_record(order_match.group(0)) if order_match else None
+    if record:
+        logger.debug(
+            "Using order record %s (delivery date: %s)", record.order_number, record.delivery_date
+        )
+        return return_policy_for_order(record)
 
-    # Try to find delivery date in the tool_input
+    # Fall back to reading the delivery date and category from free-form input
+    category = None
     try:
-        import re
-
         date_match = re.search(r"Delivery date:\s*(\d{4}-\d{2}-\d{2})", tool_input)
+        category_match = re.search(r"Product category:\s*(.+)", tool_input)
+        delivery_date = None
         if date_match:
-            delivery_date_str = date_match.group(1)
-            print(f"Found delivery date in tool input: {delivery_date_str}")
-            delivery_date = datetime.strptime(delivery_date_str, "%Y-%m-%d")
-
-            # Calculate days since delivery
-            days_since_delivery = (current_date - delivery_date).days
-
-            # Add eligibility information
-            eligibility_info = f"\n\nCurrent date: {current_date_str}\n"
-            eligibility_info += f"Delivery date: {delivery_date_str}\n"
-            eligibility_info += f"Days since delivery: {days_since_delivery}\n"
-
-            if days_since_delivery <= 30:
-                eligibility_info += (
-                    "Return status: ELIGIBLE - Within 30-day return window\n"
-                )
-            else:
-                eligibility_info += (
-                    "Return status: NOT ELIGIBLE - Beyond 30-day return window\n"
-                )
-        else:
-            eligibility_info = f"\n\nCurrent date: {current_date_str}\nNo delivery date found in order information.\n"
-            print("No delivery date found in tool input!")
+            logger.debug("Found delivery date in tool input: %s", date_match.group(1))
+            delivery_date = datetime.strptime(date_match.group(1), "%Y-%m-%d").date()
+        category = category_match.group(1).strip() if category_match else None
+        info = eligibility_info(delivery_date, category=category)
     except Exception as e:
-        eligibility_info = f"\n\nCurrent date: {current_date_str}\nUnable to determine return eligibility: {str(e)}\n"
-        print(f"Error processing delivery date: {str(e)}")
-
-    # Load base return policy
-    max_chars = 2000
-    policy_path = os.path.join(os.path.dirname(__file__), "amazon_return_policy.md")
-    with open(policy_path, "r", encoding="utf-8") as f:
-        text = f.read()
+        current_date_str = datetime.now().strftime("%Y-%m-%d")
+        info = f"\n\nCurrent date: {current_date_str}\nUnable to determine return eligibility: {str(e)}\n"
+        logger.warning("Error processing delivery date: %s", e)
 
     # Combine policy with eligibility information
-    return text[:max_chars] + eligibility_info
+    return policy_context(category) + info
+
+
+_return_policy_tool = None
+
+
+def get_return_policy_tool():
+    """
+    fetch_return_policy as a LangChain tool for the ReAct agent. Built on first
+    use, so the graph, which calls fetch_return_policy directly, never imports
+    LangChain's tool machinery.
+    """
+    global _return_policy_tool
+    if _return_policy_tool is None:
+        from langchain_core.tools import tool
+
+        _return_policy_tool = tool("fetch_return_policy", return_direct=True)(fetch_return_policy)
+    return _return_policy_tool